@@ -0,0 +1,50 @@
+"""
+Memory benchmark of the list of wallpapers: compares a plain list of paths
+with `WallpaperList`, for synthetic libraries of different sizes.
+
+Usage: python benchmarks/bench_memory.py [number of paths ...]
+"""
+
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from py3status_randwallpaper.wallpaper_list import WallpaperList  # noqa: E402
+
+
+def synthetic_paths(count, files_per_dir=200):
+    """Generate paths looking like a real library (long shared prefixes)."""
+    root = '/mnt/nas/photos/wallpapers/collections'
+    for i in range(count):
+        dir_index = i // files_per_dir
+        yield '%s/%04d/album-%06d/IMG_%08d.jpg' % (root, dir_index // 50,
+                                                   dir_index, i)
+
+
+def measure(factory, count):
+    """Return the memory (in bytes) retained by `factory(paths)`."""
+    gc.collect()
+    tracemalloc.start()
+    container = factory(synthetic_paths(count))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del container
+    return current
+
+
+def main(counts):
+    print('%10s %14s %14s %8s' % ('paths', 'list (bytes)',
+                                  'compact (bytes)', 'ratio'))
+    for count in counts:
+        plain = measure(list, count)
+        compact = measure(WallpaperList, count)
+        print('%10d %14d %14d %8.2f' % (count, plain, compact,
+                                        float(plain) / compact))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
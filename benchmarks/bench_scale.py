@@ -0,0 +1,260 @@
+"""
+Benchmark of the module at scale: search throughput, peak memory of the
+search, and end-to-end click latency (with the wallpaper command stubbed),
+on synthetic libraries of 1k to 1M files.
+
+The results are written as JSON, so that they can be compared between
+releases with `benchmarks/compare.py`.
+
+Usage examples:
+    python benchmarks/bench_scale.py --sizes 1000 10000 --output new.json
+    python benchmarks/bench_scale.py --sizes 100000 --depth 4 \\
+        --extensions jpg:6,png:3,txt:1 --ignored-patterns 20 \\
+        --config scan_index=True --config cache_dir="'/tmp/bench-cache'"
+"""
+
+
+import argparse
+import ast
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from py3status_randwallpaper.random_wallpaper import Py3status  # noqa: E402
+from py3status_randwallpaper.random_wallpaper import WallpapersFinder  # noqa
+from tests.fake_py3 import make_module  # noqa: E402
+
+
+SCHEMA_VERSION = 1
+
+
+def parse_extensions(value):
+    """Parse an extension mix such as 'jpg:6,png:3,txt:1'."""
+    mix = []
+    for item in value.split(','):
+        name, _, weight = item.partition(':')
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def generate_tree(root, size, depth, files_per_dir, extensions,
+                  ignored_patterns, seed=0):
+    """
+    Generate a synthetic library of (empty) files.
+
+    The files are spread in leaf directories, `depth` levels below `root`.
+    One file out of a hundred is named so that it matches one of the
+    ignored patterns.
+
+    :return: The list of ignored patterns to configure.
+    """
+    rng = random.Random(seed)
+    names = [name for name, _ in extensions]
+    weights = [weight for _, weight in extensions]
+    nb_dirs = max(1, -(-size // files_per_dir))
+    # Number of sub-directories per level, so that there are enough leaves
+    branching = max(2, int(round(nb_dirs ** (1.0 / depth))) + 1) \
+        if depth > 0 else 1
+    patterns = ['*/skip%d_*' % i for i in range(ignored_patterns)]
+    created = 0
+    for dir_index in range(nb_dirs):
+        parts = []
+        value = dir_index
+        for _ in range(depth):
+            parts.append('d%d' % (value % branching))
+            value //= branching
+        if value and parts:
+            parts[-1] += '_%d' % value
+        dir_path = os.path.join(root, *parts)
+        os.makedirs(dir_path, exist_ok=True)
+        for _ in range(min(files_per_dir, size - created)):
+            ext = rng.choices(names, weights)[0]
+            prefix = ''
+            if patterns and rng.random() < 0.01:
+                prefix = 'skip%d_' % rng.randrange(len(patterns))
+            name = '%simg%08d.%s' % (prefix, created, ext)
+            open(os.path.join(dir_path, name), 'w').close()
+            created += 1
+    return patterns
+
+
+def timed(function, repeat):
+    """Run `function` `repeat` times, and return the durations (in s)."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(durations):
+    """Summarize durations (in seconds) as milliseconds statistics."""
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * len(ordered))))]
+    return {
+        'min_ms': ordered[0] * 1000,
+        'median_ms': statistics.median(ordered) * 1000,
+        'p95_ms': p95 * 1000,
+        'runs': len(ordered),
+    }
+
+
+def bench_search(config, repeat):
+    finder = WallpapersFinder(config['search_dirs'],
+                              config['recursive_search'],
+                              config['filter_extensions'],
+                              config['ignored_patterns'])
+    found = len(finder.search())
+    durations = timed(finder.search, repeat)
+    result = summarize(durations)
+    result['found'] = found
+    result['files_per_second'] = found / min(durations) \
+        if min(durations) > 0 else None
+    # Peak memory, measured separately as tracing slows the search
+    finder.wallpapers = []
+    tracemalloc.start()
+    finder.search()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result['peak_memory_bytes'] = peak
+    return result
+
+
+def bench_clicks(config, clicks):
+    module_config = dict(config)
+    module_config.setdefault('background_apply', False)
+    module_config.setdefault('screen_count', 1)
+    start = time.perf_counter()
+    module = make_module(Py3status, **module_config)
+    startup = time.perf_counter() - start
+    buttons = [module.button_next, module.button_prev, module.button_rand]
+    try:
+        durations = []
+        for i in range(clicks):
+            event = {'button': buttons[i % len(buttons)]}
+            begin = time.perf_counter()
+            module.on_click(event)
+            module.show()
+            durations.append(time.perf_counter() - begin)
+    finally:
+        module.kill()
+    result = summarize(durations)
+    result['startup_ms'] = startup * 1000
+    result['commands'] = len(module.py3.commands)
+    return result
+
+
+def git_revision():
+    try:
+        output = subprocess.check_output(['git', 'describe', '--always',
+                                          '--dirty'], cwd=ROOT_DIR,
+                                         stderr=subprocess.DEVNULL)
+        return output.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='Numbers of files in the synthetic libraries.')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='Depth of the directories.')
+    parser.add_argument('--files-per-dir', type=int, default=200)
+    parser.add_argument('--extensions', type=parse_extensions,
+                        default=parse_extensions('jpg:6,png:3,txt:1'),
+                        help='Extension mix, e.g. jpg:6,png:3,txt:1.')
+    parser.add_argument('--ignored-patterns', type=int, default=5,
+                        help='Number of ignored patterns to configure.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed searches.')
+    parser.add_argument('--clicks', type=int, default=30,
+                        help='Number of timed clicks.')
+    parser.add_argument('--config', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='Module parameter (Python literal), may be '
+                             'repeated.')
+    parser.add_argument('--workdir', default=None,
+                        help='Where to generate the libraries (default: a '
+                             'temporary directory, removed afterwards).')
+    parser.add_argument('--output', default=None,
+                        help='JSON file for the results (default: stdout).')
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for item in args.config:
+        key, _, value = item.partition('=')
+        overrides[key] = ast.literal_eval(value)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='randwallpaper-bench-')
+    results = []
+    try:
+        for size in args.sizes:
+            root = os.path.join(workdir, 'library-%d' % size)
+            shutil.rmtree(root, ignore_errors=True)
+            start = time.perf_counter()
+            patterns = generate_tree(root, size, args.depth,
+                                     args.files_per_dir, args.extensions,
+                                     args.ignored_patterns)
+            generation = time.perf_counter() - start
+            config = {
+                'search_dirs': [root],
+                'recursive_search': True,
+                'filter_extensions': [name for name, _ in args.extensions
+                                      if name != 'txt'],
+                'ignored_patterns': patterns,
+            }
+            config.update(overrides)
+            sys.stderr.write('Benchmarking %d files...\n' % size)
+            results.append({
+                'size': size,
+                'generation_s': generation,
+                'search': bench_search(config, args.repeat),
+                'click': bench_clicks(config, args.clicks),
+            })
+            if args.workdir is None:
+                shutil.rmtree(root)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'schema': SCHEMA_VERSION,
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'depth': args.depth,
+            'files_per_dir': args.files_per_dir,
+            'extensions': args.extensions,
+            'ignored_patterns': args.ignored_patterns,
+            'repeat': args.repeat,
+            'clicks': args.clicks,
+            'config': overrides,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare two results files of `benchmarks/bench_scale.py` (e.g. from two
+releases), and report the regressions.
+
+Usage: python benchmarks/compare.py old.json new.json [--threshold 1.2]
+
+The exit code is 1 if a metric got worse by more than the threshold.
+"""
+
+
+import argparse
+import json
+import sys
+
+
+# (section, metric) pairs, where a higher value is worse
+METRICS = [
+    ('search', 'median_ms'),
+    ('search', 'peak_memory_bytes'),
+    ('click', 'median_ms'),
+    ('click', 'p95_ms'),
+    ('click', 'startup_ms'),
+]
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return {result['size']: result for result in report['results']}, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Ratio new/old above which a metric is '
+                             'reported as a regression.')
+    args = parser.parse_args(argv)
+
+    old, old_report = load(args.old)
+    new, new_report = load(args.new)
+    print('old: %s (%s)' % (old_report.get('revision'),
+                            old_report.get('timestamp')))
+    print('new: %s (%s)' % (new_report.get('revision'),
+                            new_report.get('timestamp')))
+    print('%10s %-26s %14s %14s %8s' % ('size', 'metric', 'old', 'new',
+                                        'ratio'))
+    regressions = 0
+    for size in sorted(set(old) & set(new)):
+        for section, metric in METRICS:
+            old_value = old[size].get(section, {}).get(metric)
+            new_value = new[size].get(section, {}).get(metric)
+            if old_value is None or new_value is None:
+                continue
+            ratio = float(new_value) / old_value if old_value else 1.0
+            flag = ''
+            if ratio > args.threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print('%10d %-26s %14.2f %14.2f %8.2f%s' % (
+                size, '%s.%s' % (section, metric), old_value, new_value,
+                ratio, flag))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
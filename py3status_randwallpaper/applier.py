@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Background worker applying the wallpapers, so that clicks never wait for the
+wallpaper command.
+
+Only the latest request matters: when several requests are submitted while
+a wallpaper is being applied, only the newest one is applied next, and the
+intermediate ones are dropped.
+"""
+
+
+import threading
+
+
+class LatestWinsWorker:
+    """
+    Run `apply(request)` in a background thread, coalescing the requests.
+
+    When the worker becomes idle (i.e. the last submitted request has been
+    applied), `on_done(request, result)` is called from the worker thread.
+    If `apply` raised an exception, `result` is this exception.
+    """
+
+    def __init__(self, apply, on_done=None, name='random_wallpaper-applier'):
+        self._apply = apply
+        self._on_done = on_done
+        self._condition = threading.Condition()
+        self._pending = None
+        self._has_pending = False
+        self._busy = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, request):
+        """Request `request` to be applied, replacing any pending request."""
+        with self._condition:
+            self._pending = request
+            self._has_pending = True
+            self._condition.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """
+        Wait until all the submitted requests have been handled.
+
+        :return: `True` if the worker is idle, `False` if the timeout expired.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._has_pending and not self._busy, timeout)
+
+    def stop(self, wait=True):
+        """
+        Stop the worker, dropping any pending request.
+
+        :param wait: `True` to wait for the current request to finish.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if wait:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._has_pending or self._stopped)
+                if self._stopped:
+                    return
+                request = self._pending
+                self._pending = None
+                self._has_pending = False
+                self._busy = True
+            try:
+                result = self._apply(request)
+            except Exception as e:
+                # Keep the worker alive, the error is given to `on_done`
+                result = e
+            with self._condition:
+                idle = not self._has_pending
+            if idle and self._on_done is not None:
+                self._on_done(request, result)
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
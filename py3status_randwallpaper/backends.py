@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Backends running the wallpaper command.
+
+A backend has an `apply(paths)` method, which sets the wallpapers of all the
+screens in a single call (and raises `CommandFailed` on error), and a
+`close()` method.
+"""
+
+
+import json
+import subprocess
+import sys
+import threading
+
+from py3status_randwallpaper import setter
+from py3status_randwallpaper.setter import build_argv
+
+
+class CommandFailed(Exception):
+    """The wallpaper command failed."""
+
+    def __init__(self, msg, error_code=-1, output='', error=''):
+        Exception.__init__(self, msg)
+        self.error_code = error_code
+        self.output = output
+        self.error = error
+
+
+class ShellBackend:
+    """
+    Run the command with py3status (a new process for each change).
+
+    The arguments are given as a list, so that the paths are not split.
+    """
+
+    def __init__(self, py3, command):
+        self._py3 = py3
+        self._command = command
+
+    def apply(self, paths):
+        try:
+            return self._py3.command_run(build_argv(self._command, paths))
+        except self._py3.CommandError as e:
+            raise CommandFailed(str(e), e.error_code, e.output, e.error)
+
+    def close(self):
+        pass
+
+
+class WorkerBackend:
+    """
+    Send the wallpapers to a long-lived setter process (see `setter.py`),
+    over a pipe.
+
+    py3status itself then never forks: the (much smaller) setter process
+    runs the command. The process is started again if it died.
+    """
+
+    def __init__(self, command, python=None):
+        self._argv = [python or sys.executable, setter.__file__, command]
+        self._process = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the setter process (if it is not running).
+
+        :raise OSError: If the process cannot be started.
+        """
+        with self._lock:
+            self._start()
+
+    def apply(self, paths):
+        request = json.dumps(list(paths)) + '\n'
+        with self._lock:
+            line = ''
+            # If the process died, it is started again once
+            for _ in range(2):
+                try:
+                    self._start()
+                    self._process.stdin.write(request)
+                    self._process.stdin.flush()
+                    line = self._process.stdout.readline()
+                except (OSError, ValueError):
+                    line = ''
+                if line:
+                    break
+                self._stop()
+        if not line:
+            raise CommandFailed('The setter process is not responding', -4)
+        response = json.loads(line)
+        code = response['code']
+        if code != 0:
+            raise CommandFailed('The command failed', code,
+                                response['output'], response['error'])
+        return code
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def _start(self):
+        if self._process is not None and self._process.poll() is None:
+            return
+        self._process = subprocess.Popen(self._argv,
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         universal_newlines=True)
+
+    def _stop(self):
+        if self._process is None:
+            return
+        try:
+            # The setter exits at the end of its input
+            self._process.stdin.close()
+            self._process.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+
+class StubBackend:
+    """Record the wallpapers instead of setting them (e.g. for tests)."""
+
+    def __init__(self):
+        self.applied = []
+
+    def apply(self, paths):
+        self.applied.append(list(paths))
+        return 0
+
+    def close(self):
+        pass
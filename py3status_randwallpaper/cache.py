@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk caches used by the random_wallpaper module.
+
+The files are stored by default in `$XDG_CACHE_HOME/py3status-random-wallpaper`
+(or `~/.cache/py3status-random-wallpaper` if `XDG_CACHE_HOME` is not set).
+All the files are written atomically, so a crash (or a concurrent
+py3status instance) never leaves a half-written cache behind.
+"""
+
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+CACHE_DIR_NAME = 'py3status-random-wallpaper'
+
+
+def default_cache_dir():
+    """
+    Return the default directory for the persistent caches.
+
+    :rtype: str
+    """
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, CACHE_DIR_NAME)
+
+
+def load_json(path, default=None):
+    """
+    Load a JSON file, returning `default` if it does not exist or is invalid.
+
+    :param path: The path to the JSON file.
+    :type path: str
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def atomic_write_json(path, data):
+    """
+    Write `data` as JSON to `path`, atomically.
+
+    :param path: The path to the destination file. Its parent directories
+        are created if necessary.
+    :type path: str
+    """
+    atomic_write_text(path, json.dumps(data, separators=(',', ':')))
+
+
+def atomic_write_text(path, text):
+    """
+    Write `text` to `path`, atomically.
+
+    The text is first written to a temporary file in the same directory,
+    which then replaces the destination file.
+
+    :param path: The path to the destination file. Its parent directories
+        are created if necessary.
+    :type path: str
+    """
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def now_ns():
+    """Return the current time, in nanoseconds (as `st_mtime_ns`)."""
+    return int(time.time() * 10 ** 9)
+
+
+class ScanIndex:
+    """
+    Persistent index of the scanned directories.
+
+    For each directory, the index records its modification time, the
+    wallpapers it directly contains, and its sub-directories. Adding,
+    removing or renaming an entry in a directory updates its modification
+    time, so a directory whose mtime did not change does not need to be
+    listed again.
+
+    The modification time has a coarse granularity on some filesystems
+    (e.g. 1 or 2 seconds on NFS, SMB or FAT), so an entry added in the same
+    tick, just after the directory was listed, does not change it. The
+    entries listed less than `RACY_WINDOW` nanoseconds after the
+    modification of their directory are therefore not trusted, and listed
+    again by the next scan.
+
+    The index is only valid for a given filter configuration (extensions
+    and ignored patterns): a different `fingerprint` discards it.
+    """
+
+    VERSION = 2
+
+    RACY_WINDOW = 2 * 10 ** 9
+
+    def __init__(self, path, fingerprint):
+        self._path = path
+        self._fingerprint = fingerprint
+        self._entries = {}
+        self._visited = set()
+        # Directories listed, or forgotten, by the current scan
+        self._changed = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+        # The error that prevented the last save, if any
+        self.save_error = None
+        self.load()
+
+    def load(self):
+        """Load the index from the disk, if it exists and is still valid."""
+        data = load_json(self._path, default={})
+        if data.get('version') == self.VERSION \
+                and data.get('fingerprint') == self._fingerprint:
+            self._entries = data.get('dirs', {})
+        else:
+            self._entries = {}
+
+    def save(self):
+        """
+        Write the index to the disk, if it changed since the last save. If it
+        cannot be written, the error is kept in `save_error`, and the next
+        save tries again.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'version': self.VERSION,
+                    'fingerprint': self._fingerprint,
+                    'dirs': self._entries}
+            self._dirty = False
+        try:
+            atomic_write_json(self._path, data)
+        except (IOError, OSError) as e:
+            self.save_error = e
+            with self._lock:
+                self._dirty = True
+        else:
+            self.save_error = None
+
+    def begin_scan(self):
+        """Start a full scan, tracking which directories are still present."""
+        with self._lock:
+            self._visited = set()
+            self._changed = set()
+
+    def end_scan(self):
+        """
+        End a full scan: forget the directories that were not visited
+        (e.g. deleted or no longer configured), and save the index.
+        """
+        with self._lock:
+            for dir_path in list(self._entries):
+                if dir_path not in self._visited:
+                    del self._entries[dir_path]
+                    self._changed.add(dir_path)
+                    self._dirty = True
+            self._visited = set()
+        self.save()
+
+    def changed_dirs(self):
+        """
+        Return the directories whose content may have changed during the last
+        scan: those that were listed (not reused from the index), and those
+        that were forgotten.
+
+        :rtype: set
+        """
+        with self._lock:
+            return set(self._changed)
+
+    def lookup(self, dir_path, mtime):
+        """
+        Get the cached content of a directory.
+
+        :param dir_path: The absolute path to the directory.
+        :type dir_path: str
+        :param mtime: The current modification time of the directory
+            (in nanoseconds).
+        :type mtime: int
+
+        :return: A tuple `(files, subdirs)` of basenames, or `None` if the
+            directory is unknown, was modified since it was indexed, or was
+            indexed too close to its modification.
+        """
+        with self._lock:
+            self._visited.add(dir_path)
+            entry = self._entries.get(dir_path)
+        if entry is None or entry[0] != mtime \
+                or entry[3] - mtime < self.RACY_WINDOW:
+            return None
+        return entry[1], entry[2]
+
+    def store(self, dir_path, mtime, files, subdirs, listed_at=None):
+        """
+        Record the content of a directory.
+
+        :param files: The basenames of the wallpapers in this directory.
+        :param subdirs: The basenames of the sub-directories.
+        :param listed_at: The time (in nanoseconds) when the listing
+            started, by default now.
+        """
+        if listed_at is None:
+            listed_at = now_ns()
+        with self._lock:
+            self._visited.add(dir_path)
+            self._changed.add(dir_path)
+            self._entries[dir_path] = [mtime, list(files), list(subdirs),
+                                       listed_at]
+            self._dirty = True
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Removal of the duplicated wallpapers (byte-identical copies).
+
+Only the files that have the same size as another one can be duplicates, so
+only those are hashed, in a pool of threads (`hashlib` and the reads release
+the GIL, and py3status is multi-threaded, so forking worker processes could
+deadlock them). The sizes and digests are cached on the disk by path,
+modification time and size, so that a rescan only checks the files of the
+directories that changed, and only hashes the new or modified files.
+"""
+
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from py3status_randwallpaper.cache import atomic_write_json, load_json
+from py3status_randwallpaper.wallpaper_list import WallpaperList
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """
+    Compute the digest of the content of a file.
+
+    :return: The hexadecimal digest, or `None` if the file cannot be read.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class Deduplicator:
+    """
+    Keep one path (the first one, in the order of the list) per distinct
+    content.
+    """
+
+    VERSION = 2
+
+    # Below this number of files to hash, they are hashed in the calling
+    # thread, as starting the pool would take longer
+    MIN_POOL_FILES = 16
+
+    def __init__(self, path=None, workers=None):
+        """
+        :param path: The path to the file where the digests are saved, or
+            `None` to keep them in memory.
+        :param workers: The number of threads hashing the files (by
+            default, the number of CPUs).
+        """
+        self._path = path
+        self._workers = workers or os.cpu_count() or 1
+        # Path -> [mtime, size, digest or None if not hashed]
+        self._entries = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            data = load_json(path, default={})
+            if data.get('version') == self.VERSION:
+                self._entries = data.get('files', {})
+        # Removed duplicate -> kept path, for the last list
+        self.canonical = {}
+        # The error that prevented the last save of the cache, if any
+        self.save_error = None
+
+    def deduplicate(self, wallpapers, changed_dirs=None):
+        """
+        Remove the duplicates from a list of wallpapers.
+
+        :param wallpapers: The list of wallpapers (e.g. a sorted
+            `WallpaperList`).
+        :param changed_dirs: The directories whose content may have changed
+            (e.g. listed again by the last search), or `None` if unknown.
+            The files of the other directories are not checked again if they
+            are in the cache.
+
+        :return: The list without the duplicates, in the same order.
+        :rtype: WallpaperList
+        """
+        with self._lock:
+            return self._deduplicate(wallpapers, changed_dirs)
+
+    def _deduplicate(self, wallpapers, changed_dirs):
+        stats = self._stats(wallpapers, changed_dirs)
+        changed = False
+        by_size = {}
+        for path, stat in zip(wallpapers, stats):
+            if stat is None:
+                continue
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != stat[0] or entry[1] != stat[1]:
+                self._entries[path] = [stat[0], stat[1], None]
+                changed = True
+            by_size.setdefault(stat[1], []).append(path)
+        # Only the files with the same size as another one are hashed
+        to_hash = [path for group in by_size.values() if len(group) > 1
+                   for path in group if self._entries[path][2] is None]
+        for path, digest in zip(to_hash, self._hash(to_hash)):
+            self._entries[path][2] = digest
+        changed = self._forget(by_size) or changed or bool(to_hash)
+        if changed:
+            self._save()
+
+        kept = {}
+        canonical = {}
+        result = WallpaperList()
+        for path in wallpapers:
+            entry = self._entries.get(path)
+            digest = entry[2] if entry is not None else None
+            if digest is not None and len(by_size[entry[1]]) > 1:
+                if digest in kept:
+                    canonical[path] = kept[digest]
+                    continue
+                kept[digest] = path
+            result.append(path)
+        self.canonical = canonical
+        return result
+
+    def _save(self):
+        """Save the cache, recording the error (see `save_error`) if any."""
+        if self._path is None:
+            return
+        try:
+            atomic_write_json(self._path, {'version': self.VERSION,
+                                           'files': self._entries})
+        except (IOError, OSError) as e:
+            self.save_error = e
+        else:
+            self.save_error = None
+
+    def _stats(self, wallpapers, changed_dirs):
+        """
+        Return the `(mtime, size)` of each wallpaper (`None` if it cannot be
+        read), from the cache for the directories that did not change.
+        """
+        stats = []
+        to_stat = []
+        for path in wallpapers:
+            entry = self._entries.get(path)
+            if changed_dirs is not None and entry is not None \
+                    and os.path.dirname(path) not in changed_dirs:
+                stats.append((entry[0], entry[1]))
+            else:
+                to_stat.append(len(stats))
+                stats.append(None)
+        if to_stat:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = executor.map(_stat, [wallpapers[i]
+                                               for i in to_stat])
+                for i, stat in zip(to_stat, results):
+                    stats[i] = stat
+        return stats
+
+    def _hash(self, paths):
+        """Hash the files, in a pool of threads if there are enough of them."""
+        if len(paths) < self.MIN_POOL_FILES or self._workers < 2:
+            return [hash_file(path) for path in paths]
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            return list(executor.map(hash_file, paths))
+
+    def _forget(self, by_size):
+        """
+        Forget the files that no longer exist.
+
+        :return: `True` if some files were forgotten.
+        """
+        present = set(path for group in by_size.values() for path in group)
+        removed = [path for path in self._entries if path not in present]
+        for path in removed:
+            del self._entries[path]
+        return bool(removed)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Image metadata (dimensions) index, used to match wallpapers to screens.
+
+The dimensions are read from the JPEG and PNG headers, without decoding the
+images, and cached on the disk by path, modification time and size. The
+wallpapers are then grouped into buckets by aspect ratio, so that a
+wallpaper matching a screen can be chosen without filtering the whole list.
+"""
+
+
+import math
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from random import choice
+
+from py3status_randwallpaper.cache import atomic_write_json, load_json
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Start Of Frame markers (i.e. not DHT 0xC4, JPG 0xC8, DAC 0xCC)
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length (RSTn, SOI, EOI, TEM)
+JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | {0x01}
+
+# Width of an aspect ratio bucket, in log scale (about 5%)
+ASPECT_STEP = 0.05
+
+
+def read_image_size(path):
+    """
+    Read the dimensions of a JPEG or PNG image from its header.
+
+    :param path: The path to the image.
+    :type path: str
+
+    :return: A tuple `(width, height)`, or `None` if the file is not a
+        (valid) JPEG or PNG image.
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(24)
+            if header.startswith(PNG_SIGNATURE) and header[12:16] == b'IHDR':
+                return struct.unpack('>II', header[16:24])
+            if header.startswith(b'\xff\xd8'):
+                f.seek(2)
+                return _read_jpeg_size(f)
+    except (IOError, OSError, struct.error):
+        pass
+    return None
+
+
+def _read_jpeg_size(f):
+    while True:
+        byte = f.read(1)
+        # Skip the padding before the marker
+        while byte == b'\xff':
+            byte = f.read(1)
+            if byte != b'\xff':
+                break
+        else:
+            if not byte:
+                return None
+            continue
+        if not byte:
+            return None
+        marker = ord(byte)
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            return width, height
+        if marker == 0xD9 or length < 2:
+            return None
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def aspect_bucket(width, height):
+    """Return the aspect ratio bucket of the given dimensions."""
+    return int(round(math.log(float(width) / height) / ASPECT_STEP))
+
+
+def orientation(width, height):
+    """Return 'landscape', 'portrait' or 'square'."""
+    if width > height:
+        return 'landscape'
+    if width < height:
+        return 'portrait'
+    return 'square'
+
+
+class MetadataIndex:
+    """
+    Persistent index of the dimensions of the wallpapers.
+
+    The entries are keyed by path, and are valid as long as the modification
+    time and the size of the file do not change: only new or modified files
+    are read on `update`.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path=None, workers=4):
+        """
+        :param path: The path to the file where the index is saved, or
+            `None` to keep it in memory.
+        :param workers: The number of files read concurrently.
+        """
+        self._path = path
+        self._workers = workers
+        self._entries = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            data = load_json(path, default={})
+            if data.get('version') == self.VERSION:
+                self._entries = data.get('images', {})
+
+    def size(self, path):
+        """
+        Return the dimensions of a wallpaper, as `(width, height)`, or `None`
+        if they are unknown.
+        """
+        entry = self._entries.get(path)
+        if entry is None or entry[2] is None:
+            return None
+        return entry[2], entry[3]
+
+    def refresh(self, paths):
+        """
+        Read the dimensions of the given files (in parallel), if they are new
+        or were modified since they were indexed.
+
+        :return: The number of files that were read.
+        """
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            return sum(1 for read in executor.map(self._refresh, paths)
+                       if read)
+
+    def update(self, paths, changed_dirs=None):
+        """
+        Make the index match the given wallpapers: refresh them, forget the
+        other files, and save the index if it changed.
+
+        :param changed_dirs: The directories whose content may have changed
+            (e.g. listed again by the last search), or `None` if unknown.
+            The files in the other directories are only read if they are not
+            in the index yet (their modification is not checked).
+
+        :return: The number of files that were read.
+        """
+        paths = list(paths)
+        if changed_dirs is None:
+            to_refresh = paths
+        else:
+            to_refresh = [path for path in paths
+                          if path not in self._entries
+                          or os.path.dirname(path) in changed_dirs]
+        read = self.refresh(to_refresh)
+        wanted = set(paths)
+        with self._lock:
+            removed = [path for path in self._entries if path not in wanted]
+            for path in removed:
+                del self._entries[path]
+        if (read or removed) and self._path is not None:
+            with self._lock:
+                data = {'version': self.VERSION, 'images': dict(self._entries)}
+            atomic_write_json(self._path, data)
+        return read
+
+    def _refresh(self, path):
+        """Refresh the entry of a file, return `True` if it was read."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns \
+                and entry[1] == st.st_size:
+            return False
+        size = read_image_size(path) or (None, None)
+        with self._lock:
+            self._entries[path] = [st.st_mtime_ns, st.st_size,
+                                   size[0], size[1]]
+        return True
+
+
+class ScreenMatcher:
+    """
+    Candidate wallpapers for each screen, by aspect ratio and size.
+
+    For each monitor, the candidates are (by order of preference) the
+    wallpapers with the same aspect ratio and at least the same size, then
+    the ones with the same aspect ratio, then the ones with a close aspect
+    ratio, then the ones with the same orientation, and finally all the
+    wallpapers. They are precomputed once, so
+    that choosing a wallpaper is O(1).
+    """
+
+    # Maximum distance (in buckets) for a "close" aspect ratio
+    TOLERANCE = 2
+
+    def __init__(self, wallpapers, metadata, monitors):
+        buckets = {}
+        orientations = {}
+        sizes = []
+        for index, path in enumerate(wallpapers):
+            size = metadata.size(path)
+            sizes.append(size)
+            if size is not None and size[0] > 0 and size[1] > 0:
+                key = aspect_bucket(*size)
+                buckets.setdefault(key, []).append(index)
+                orientations.setdefault(orientation(*size), []).append(index)
+        self._count = len(wallpapers)
+        self.monitors = tuple(monitors)
+        self.candidates = [
+            self._candidates(buckets, orientations, sizes, monitor)
+            for monitor in monitors]
+
+    def _candidates(self, buckets, orientations, sizes, monitor):
+        if not monitor.width or not monitor.height:
+            return None
+        key = aspect_bucket(monitor.width, monitor.height)
+        same_aspect = buckets.get(key, [])
+        large_enough = [i for i in same_aspect
+                        if sizes[i][0] >= monitor.width
+                        and sizes[i][1] >= monitor.height]
+        if large_enough:
+            return large_enough
+        if same_aspect:
+            return same_aspect
+        for distance in range(1, self.TOLERANCE + 1):
+            close = buckets.get(key - distance, []) \
+                + buckets.get(key + distance, [])
+            if close:
+                return close
+        return orientations.get(orientation(monitor.width, monitor.height))
+
+    def choose(self):
+        """
+        Choose a wallpaper for each screen (different ones when possible).
+
+        :return: The list of indexes, one per monitor.
+        """
+        chosen = []
+        for candidates in self.candidates:
+            pool = candidates if candidates else range(self._count)
+            index = choice(pool)
+            # A few attempts to avoid the same wallpaper on two screens
+            for _ in range(3):
+                if index not in chosen:
+                    break
+                index = choice(pool)
+            chosen.append(index)
+        return chosen
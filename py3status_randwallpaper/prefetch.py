@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of wallpapers pre-scaled to the resolution of the screens.
+
+Decoding and scaling a large image takes a significant time for the
+wallpaper command. The likely next wallpapers are therefore rendered ahead
+of time, in background threads, so that the command is given an image
+which is just large enough to cover the screen. The aspect ratio is kept,
+so the command scales, fills or centers it as it would the original.
+
+This requires the Pillow library; without it, the cache is disabled.
+"""
+
+
+import hashlib
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def cover_size(size, width, height):
+    """
+    Compute the smallest size, with the aspect ratio of an image, that covers
+    a screen.
+
+    :param size: The size `(width, height)` of the image.
+    :param width: The width of the screen.
+    :param height: The height of the screen.
+
+    :return: The scaled size, or `None` if the image is not larger than
+        that (scaling it would not help).
+    """
+    scale = max(width / size[0], height / size[1])
+    if scale >= 1:
+        return None
+    return (max(width, int(math.ceil(size[0] * scale))),
+            max(height, int(math.ceil(size[1] * scale))))
+
+
+class PrefetchCache:
+    """
+    Bounded disk cache of pre-scaled wallpapers, with LRU eviction.
+
+    The files are named after the source path, its modification time and
+    size, and the target resolution: a modified source image is therefore
+    rendered again. The modification time of the cached files records when
+    they were last used, and the least recently used ones are evicted first.
+    """
+
+    def __init__(self, cache_dir, max_size, workers=2):
+        """
+        :param cache_dir: The directory where the pre-scaled images are
+            stored.
+        :type cache_dir: str
+        :param max_size: The maximum total size of the cache, in bytes.
+        :type max_size: int
+        :param workers: The number of images rendered concurrently.
+        :type workers: int
+        """
+        self._dir = cache_dir
+        self._max_size = max_size
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = set()
+        # The files being shown, never evicted
+        self._pinned = frozenset()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_available():
+        """Return `True` if images can be pre-scaled (Pillow is installed)."""
+        return Image is not None
+
+    def cached_path(self, path, width, height):
+        """
+        Get the pre-scaled version of an image, if it is in the cache.
+
+        :return: The path to the pre-scaled image, or `None`.
+        """
+        dest = self._dest_path(path, width, height)
+        if dest is None or not os.path.isfile(dest):
+            return None
+        try:
+            # Mark as recently used
+            os.utime(dest, None)
+        except OSError:
+            return None
+        return dest
+
+    def pin(self, cached_paths):
+        """
+        Protect the files being shown from the eviction (e.g. feh records
+        the path of the wallpaper in `~/.fehbg`), until the next call.
+
+        :param cached_paths: Paths returned by `cached_path`.
+        """
+        self._pinned = frozenset(cached_paths)
+
+    def prefetch(self, path, width, height):
+        """
+        Render an image at the given resolution in the background, unless
+        it is already in the cache (or being rendered).
+        """
+        dest = self._dest_path(path, width, height)
+        if dest is None or os.path.isfile(dest):
+            return
+        with self._lock:
+            if dest in self._pending:
+                return
+            self._pending.add(dest)
+        self._executor.submit(self._render, path, width, height, dest)
+
+    def shutdown(self, wait=False):
+        """
+        Stop rendering.
+
+        :param wait: `True` to wait for the pending renders to finish.
+        """
+        self._executor.shutdown(wait=wait)
+
+    def evict(self):
+        """Remove the least recently used images until the size fits."""
+        try:
+            names = os.listdir(self._dir)
+        except OSError:
+            return
+        entries = []
+        total = 0
+        pinned = self._pinned
+        for name in names:
+            if name.startswith('.tmp-'):
+                continue
+            file_path = os.path.join(self._dir, name)
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, file_path))
+            total += st.st_size
+        entries.sort()
+        for _, size, file_path in entries:
+            if total <= self._max_size:
+                break
+            if file_path in pinned:
+                continue
+            try:
+                os.unlink(file_path)
+                total -= size
+            except OSError:
+                pass
+
+    def _dest_path(self, path, width, height):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = '%s\0%d\0%d\0%dx%d' % (path, st.st_mtime_ns, st.st_size,
+                                     width, height)
+        digest = hashlib.sha1(key.encode('utf-8', 'surrogateescape'))
+        ext = '.jpg' if path.lower().endswith(('.jpg', '.jpeg')) else '.png'
+        return os.path.join(self._dir, digest.hexdigest() + ext)
+
+    def _render(self, path, width, height, dest):
+        tmp_path = os.path.join(os.path.dirname(dest),
+                                '.tmp-' + os.path.basename(dest))
+        try:
+            if not os.path.isdir(self._dir):
+                os.makedirs(self._dir, exist_ok=True)
+            image = Image.open(path)
+            size = cover_size(image.size, width, height)
+            if size is None:
+                # Not larger than the screen: the original is used as is
+                return
+            # Let the JPEG decoder skip the unneeded resolution
+            image.draft('RGB', size)
+            image = image.convert('RGB').resize(size, Image.LANCZOS)
+            if dest.endswith('.jpg'):
+                image.save(tmp_path, 'JPEG', quality=95)
+            else:
+                image.save(tmp_path, 'PNG')
+            os.replace(tmp_path, dest)
+        except (IOError, OSError, ValueError):
+            # Unreadable image: the original will be used
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        finally:
+            with self._lock:
+                self._pending.discard(dest)
+        self.evict()
@@ -6,39 +6,141 @@ This module sets a random wallpaper each time you start py3status.
 Additionally, you can request a change by clicking on it.
 
 Configuration parameters:
+    background_apply: Set to True to run the command in the background.
+        Clicks return immediately, and when several clicks happen while
+        the command is running, only the latest wallpaper is applied.
+        (default True)
+    backend: How the command is run: 'worker' sends the wallpapers to a
+        long-lived setter process over a pipe (py3status does not fork for
+        each change), 'shell' runs the command from py3status, and 'stub'
+        only logs the wallpapers (e.g. to run headless). If the setter
+        process cannot be started, 'shell' is used. (default 'worker')
     button_next: Select the button used to set the wallpaper as the next
         in the list. (default 1)
     button_prev: Select the button used to set the wallpaper as the previous
         in the list. (default 3)
     button_rand: Select the button used to set a random wallpaper in the list.
         (default 2)
+    cache_dir: Directory where the persistent caches (e.g. the scan index)
+        are stored. If set to None,
+        `$XDG_CACHE_HOME/py3status-random-wallpaper` is used. (default None)
     cache_list: Set to True to cache the list of images. This will result
         in a faster and less power-consuming module, but you will need to
         reload the module to update the list of images. (default False)
     command: The command that will be executed to update the wallpaper. You
-        must use '{}' as a placeholder for the path.
+        must use '{}' as a placeholder for the path(s): it is replaced by one
+        argument per screen, so paths with spaces are supported.
         (default 'feh --bg-scale {}')
+    deduplicate: Set to True to remove the byte-identical copies of the
+        wallpapers after each search (only the first path, in the sorted
+        list, is kept). Only the files with the same size are hashed, and the
+        digests are cached in `cache_dir`. With `watch_dirs`, the new files
+        are deduplicated at the next full search. (default False)
     filter_extensions: The list of extensions that will be allowed for the
-        wallpapers. Set to None to authorize all extensions.
+        wallpapers (ignoring the case). Set to None to authorize all
+        extensions.
         (default ['jpg', 'png'])
     first_image_path: Path to the first image to be loaded. This path should
         be in the list of found wallpapers. If set to None, a random image
-        will be used. (default None)
+        will be used. The last session has priority over it, when
+        `restore_session` is set. (default None)
     format_string: content that will be printed on the i3bar.
         (default 'Wallpaper {current_basename}')
     ignored_patterns: List of patterns to ignore when searching for wallpapers.
+        A directory matching a pattern is not searched at all.
         (default [])
+    match_screens: Set to True to choose, for each screen, random wallpapers
+        whose aspect ratio (and, if possible, size) match the screen. The
+        dimensions of the images are read from their headers (JPEG and PNG
+        only), in the background, and cached in `cache_dir`. Only used when
+        `same_all_screens` is False, and the screens are detected
+        (`screen_count = 'auto'`).
+        (default False)
+    prefetch: Set to True to pre-scale the next, previous and next random
+        wallpapers to the resolution of each screen (keeping their aspect
+        ratio), in the background, so that they can be set almost instantly.
+        The command is then given the path to the pre-scaled copy, in
+        `cache_dir`: e.g. `~/.fehbg` refers to it. Requires Pillow, and the
+        screens to be detected (`screen_count = 'auto'`). (default False)
+    prefetch_cache_size: Maximum size (in MB) of the pre-scaled wallpapers
+        stored in `cache_dir`. (default 512)
+    random_history: With `random_mode = 'weighted'`, the number of recently
+        shown wallpapers that are not drawn again (the history is saved in
+        `cache_dir`). (default 100)
+    random_mode: How random wallpapers are drawn: 'uniform' draws each one
+        independently, 'shuffle' goes through all the wallpapers in a random
+        order before showing any of them again (the position in the cycle is
+        saved in `cache_dir`), 'weighted' draws them according to
+        `random_weights`, leaving out the `random_history` last ones.
+        (default 'uniform')
+    random_weights: With `random_mode = 'weighted'`, a dict of patterns
+        (matched against the full paths) to weights, e.g.
+        `{'*/favorites/*': 5, '*/old/*': 0.2}`. The first matching pattern
+        gives the weight of a wallpaper (1 if none matches, 0 excludes it).
+        (default {})
     recursive_search: Set to True to search for images in subdirectories.
         (default False)
+    restore_session: Set to True to show the wallpaper(s) of the last session
+        immediately at startup, and search the wallpapers in the background.
+        The session is saved in `cache_dir` after each change, for each
+        instance of the module. (default False)
+    rotation_interval: Set to a duration (in seconds) to change the
+        wallpaper automatically, to a random one, at this interval. The next
+        wallpapers are drawn in advance, and the module does not wake up
+        between two changes. A click starts the interval again. None to
+        change it only on clicks. (default None)
+    scan_index: Set to True to keep a persistent index of the scanned
+        directories in `cache_dir`. Only the directories modified since
+        the last scan are listed again, which speeds up rescans of large
+        libraries. (default False)
+    scan_timeout: Maximum time (in seconds) to list a single directory when
+        `scan_workers` is greater than 1. A directory that takes longer
+        (e.g. a hung network mount) is skipped, with its sub-directories.
+        None to wait indefinitely. (default None)
+    scan_workers: Number of directories that can be listed concurrently.
+        Values greater than 1 speed up the search on network mounts.
+        (default 1)
     search_dirs: The list of directories to search for wallpapers.
         (default ['~/Pictures/'])
+    startup_budget: Set to a duration (in seconds) to search the wallpapers in
+        the background at startup, choosing the first one(s) while they are
+        discovered: if the search takes longer than this duration, a
+        provisional wallpaper is set without waiting for the end of the
+        search. None to search before setting the first wallpaper.
+        Has no effect with `restore_session` (when a session exists) or
+        `watch_dirs`. (default None)
+    stats_file: Path to a JSON file where the timing statistics and counters
+        are dumped (when they are logged, and when the module stops), for
+        offline analysis. None to disable. (default None)
+    stats_log_interval: Time (in seconds) between two summaries of the
+        timing statistics in the py3status log. None to disable.
+        (default None)
+    shared_index: Set to True to share the list of wallpapers between the
+        instances of this module that have the same search configuration
+        (e.g. one per bar or per output): only one of them searches the
+        wallpapers, and the others read the list it publishes in `cache_dir`,
+        without copying it in memory. Until the first list is published, the
+        others show no wallpaper. If `cache_dir` cannot be written, each
+        instance searches on its own. Has no effect with `watch_dirs`, or
+        `startup_budget`. (default False)
     screen_count: The number of screens, i.e. the number of wallpapers to set;
         or 'auto' to automatically detect the number of screens.
         (default 'auto')
+    screen_refresh_interval: When `screen_count` is 'auto', the time (in
+        seconds) during which the detected screens are cached, instead of
+        running xrandr on each click. Set to None to detect them only once.
+        (default 60)
     same_all_screens: True to set the same wallpaper on all screens, False to
         set different wallpapers for each screen. Has no effect if
-        `screen_count` is 1.
+        `screen_count` is 1. The random wallpapers of the different screens
+        are distinct, unless there are fewer wallpapers than screens.
         (default True)
+    watch_dirs: Set to True to watch the `search_dirs` for changes (using
+        inotify, Linux only). The list of images is then updated in the
+        background as soon as files are added, removed or renamed, and
+        `cache_list` has no effect. If some directories cannot be watched
+        (see `fs.inotify.max_user_watches`), the list is searched again on
+        each click instead. (default False)
 
 Button reference: (see the official py3status reference if unsure, this might
     be outdated)
@@ -51,10 +153,23 @@ Button reference: (see the official py3status reference if unsure, this might
 Format placeholders:
     {full_name} Full name (including path) of the current(s) wallpaper(s)
     {basename} Basename (i.e. excluding path) of the current(s) wallpaper(s)
+    {count} Number of wallpapers found by the last search
+    {scan_ms} Duration of the last search, in milliseconds
+    {screens_ms} Duration of the last screens detection, in milliseconds
+    {apply_ms} Duration of the last wallpaper command, in milliseconds
+    {files_visited} Number of files listed by the last search
+    {files_matched} Number of files accepted by the last search
+    {duplicates} Number of copies removed by the last search (see
+        `deduplicate`)
+    {scans} Number of searches
+    {applies} Number of wallpaper commands
+    {failures} Number of wallpaper commands that failed
 
 Requires:
     feh Used to set the background image (by default, unless you change the
         command parameter).
+    Pillow Used to pre-scale the wallpapers (optional, only if `prefetch`
+        is set).
 
 Author: rchaput <rchaput.pro@gmail.com>
 
@@ -62,17 +177,40 @@ License: Apache License 2.0 <https://www.apache.org/licenses/LICENSE-2.0.html>
 """
 
 
+import fnmatch
+import hashlib
+import json
 import os
-import subprocess
-from fnmatch import fnmatch
-from random import randint
+import re
+import threading
+import time
+from random import randint, sample
+
+from py3status_randwallpaper import scanner, watcher
+from py3status_randwallpaper.applier import LatestWinsWorker
+from py3status_randwallpaper.backends import CommandFailed, ShellBackend, \
+    StubBackend, WorkerBackend
+from py3status_randwallpaper.cache import ScanIndex, atomic_write_json, \
+    default_cache_dir, load_json, now_ns
+from py3status_randwallpaper.dedup import Deduplicator
+from py3status_randwallpaper.metadata import MetadataIndex, ScreenMatcher
+from py3status_randwallpaper.prefetch import PrefetchCache
+from py3status_randwallpaper.scanner import ParallelScanner
+from py3status_randwallpaper.screens import StaticScreenProvider, \
+    XrandrScreenProvider
+from py3status_randwallpaper.selection import ShuffleBag, WeightedSelector
+from py3status_randwallpaper.shared import SharedIndex
+from py3status_randwallpaper.stats import Stats
+from py3status_randwallpaper.wallpaper_list import WallpaperList
+from py3status_randwallpaper.watcher import InotifyWatcher
+
+
+# Time (in seconds) between two checks for the first shared list
+SHARED_POLL_INTERVAL = 1
 
 
 def detect_number_of_screens():
-    cmd = ['xrandr', '--listmonitors']
-    output = subprocess.check_output(cmd).decode('utf-8').splitlines()
-    output = [line for line in output if '+' in line]
-    return len(output)
+    return len(XrandrScreenProvider.query())
 
 
 class WallpapersFinder:
@@ -82,12 +220,59 @@ class WallpapersFinder:
                  search_dirs,
                  recursive_search,
                  filter_extensions,
-                 ignored_patterns):
+                 ignored_patterns,
+                 index_path=None,
+                 scan_workers=1,
+                 scan_timeout=None,
+                 shuffle=None,
+                 metadata=None,
+                 weighted=None,
+                 dedup=None):
         self._search_dirs = search_dirs
         self._recursive_search = recursive_search
         self._filter_extensions = filter_extensions
         self._ignored_patterns = ignored_patterns
+        # Filters compiled once, so that each file costs a single lookup
+        self._extensions = None
+        if filter_extensions is not None:
+            self._extensions = frozenset(extension.lower()
+                                         for extension in filter_extensions)
+        self._ignored_regex = self._compile_patterns(ignored_patterns)
+        self._index = None
+        if index_path is not None:
+            self._index = ScanIndex(index_path, self._filter_fingerprint())
+        self._scanner = None
+        if scan_workers > 1:
+            self._scanner = ParallelScanner(scan_workers, scan_timeout)
+        # Optional `ShuffleBag`, to draw random wallpapers without repetition
+        self._shuffle = shuffle
+        # Optional `WeightedSelector`, to draw according to weights
+        self._weighted = weighted
+        # Optional `Deduplicator`, to remove the copies after each search
+        self._dedup = dedup
+        # Optional `MetadataIndex`, to match the wallpapers to the screens,
+        # refreshed in the background (see `_update_metadata`)
+        self._metadata = metadata
+        self._metadata_worker = None
+        self._metadata_dirs = set()
+        self._matcher = None
+        self._watcher = None
+        self._lock = threading.RLock()
+        # Searches share the scan index and the counters: one at a time
+        self._search_lock = threading.Lock()
         self.wallpapers = []
+        # Number of files listed, and accepted, by the last search (the
+        # directories reused from the scan index are not listed)
+        self._counters_lock = threading.Lock()
+        self.files_visited = 0
+        self.files_matched = 0
+        # Number of copies removed by the last search
+        self.duplicates = 0
+        # Directories whose content may have changed during the last search,
+        # `None` if unknown (without the scan index)
+        self.changed_dirs = None
+        # The list returned by the last search, if it is still current
+        self._searched = None
 
     def previous(self, index, number=1, same=True):
         if len(self.wallpapers) == 0:
@@ -105,29 +290,442 @@ class WallpapersFinder:
         else:
             return [(index + i+1) % len(self.wallpapers) for i in range(number)]
 
-    def random(self, index=None, number=1, same=True):
+    def random(self, index=None, number=1, same=True, monitors=None):
         if len(self.wallpapers) == 0:
             return None
+        if not same and monitors and len(monitors) == number \
+                and self._metadata is not None:
+            return self._random_matching(monitors)
+        if self._weighted is not None:
+            return self._random_weighted(number, same)
+        if self._shuffle is not None:
+            return self._random_shuffle(number, same)
         if same:
             new_index = randint(0, len(self.wallpapers) - 1)
             return [new_index for _ in range(number)]
         else:
             return [randint(0, len(self.wallpapers) - 1) for _ in range(number)]
 
+    def _random_shuffle(self, number, same):
+        """
+        Draw from the shuffle bag, i.e. without repeating any wallpaper until
+        all of them have been drawn.
+        """
+        self._shuffle.sync(self.wallpapers)
+        if same:
+            new_index = self._shuffle.draw()
+            indexes = [new_index for _ in range(number)]
+        else:
+            indexes = [self._shuffle.draw() for _ in range(number)]
+        self._shuffle.save()
+        return indexes
+
+    def select(self, kind, index=None, number=1, same=True, steps=1,
+               monitors=None):
+        """
+        Compute the indexes of the wallpapers for several screens, and
+        several steps ahead (e.g. to prefetch or preview them), in one call.
+
+        Unlike `random`, the random wallpapers are drawn without replacement:
+        different screens (and steps) get different wallpapers, as long as
+        there are enough of them.
+
+        :param kind: 'next', 'previous' or 'random'.
+        :type kind: str
+        :param index: The current index (ignored by 'random').
+        :param number: The number of screens.
+        :param same: True to use the same wallpaper on all screens.
+        :param steps: The number of steps ahead, i.e. of rows in the result.
+        :param monitors: See `random`.
+
+        :return: A list of `steps` lists of `number` indexes (the first one
+            is the result of a single click), or `None` if there is no
+            wallpaper. The cost is linear in the size of the result.
+        :rtype: list
+        """
+        size = len(self.wallpapers)
+        if size == 0:
+            return None
+        if kind == 'next' or kind == 'previous':
+            sign = 1 if kind == 'next' else -1
+            index = index or 0
+            if same:
+                return [[(index + sign * k) % size] * number
+                        for k in range(1, steps + 1)]
+            return [[(index + sign * (k + i)) % size for i in range(number)]
+                    for k in range(1, steps + 1)]
+        if kind != 'random':
+            raise ValueError('Unknown kind of selection: %r' % (kind,))
+        if self._shuffle is not None or self._weighted is not None \
+                or (not same and monitors and len(monitors) == number
+                    and self._metadata is not None):
+            # These strategies already avoid repetitions
+            return [self.random(index, number, same, monitors)
+                    for _ in range(steps)]
+        per_step = 1 if same else number
+        if per_step * steps <= size:
+            drawn = sample(range(size), per_step * steps)
+            rows = [drawn[k * per_step:(k + 1) * per_step]
+                    for k in range(steps)]
+        else:
+            # Not enough wallpapers: distinct within each step, if possible
+            rows = []
+            for _ in range(steps):
+                drawn = sample(range(size), min(per_step, size))
+                rows.append([drawn[i % len(drawn)] for i in range(per_step)])
+        if same:
+            return [row * number for row in rows]
+        return rows
+
+    def _random_weighted(self, number, same):
+        """
+        Draw according to the weights (without the recently shown
+        wallpapers), in O(log n).
+        """
+        with self._lock:
+            if same:
+                new_index = self._weighted.draw(self.wallpapers)[0]
+                return [new_index for _ in range(number)]
+            return self._weighted.draw(self.wallpapers, number)
+
+    def put_back(self, paths):
+        """
+        Give back wallpapers that were drawn but not shown (used by the
+        shuffle bag, so that they are still shown in this cycle).
+        """
+        if self._shuffle is not None:
+            with self._lock:
+                self._shuffle.put_back(paths)
+                self._shuffle.save()
+
+    def mark_shown(self, paths):
+        """
+        Record that wallpapers were shown (used by the weighted selection to
+        leave out the recently shown ones).
+        """
+        if self._weighted is not None:
+            with self._lock:
+                self._weighted.shown(paths)
+
+    def _random_matching(self, monitors):
+        """
+        Draw a wallpaper for each monitor, among the ones matching its
+        geometry (see `ScreenMatcher`).
+
+        The candidates are computed once after each change of the list (or
+        of the monitors), not on each draw.
+        """
+        monitors = tuple(monitors)
+        with self._lock:
+            matcher = self._matcher
+            if matcher is None or matcher.monitors != monitors:
+                matcher = ScreenMatcher(self.wallpapers, self._metadata,
+                                        monitors)
+                self._matcher = matcher
+        return matcher.choose()
+
     def search(self):
         """
         Search in all the configured directories and find the wallpapers.
 
-        :return: The list of paths to all the found wallpapers.
-        :rtype: list
+        :return: The sorted list of paths to all the found wallpapers.
+        :rtype: WallpaperList
         """
-        wallpapers = []
-        for dir_path in self._search_dirs:
-            for wallpaper in self._search_in_dir(dir_path):
-                wallpapers.append(wallpaper)
-        self.wallpapers = wallpapers
+        # The content of the directories that did not change comes from the
+        # scan index, so walking the tree only costs O(directories)
+        tree = list(self._iter_tree())
+        with self._lock:
+            if self.changed_dirs == set() \
+                    and self.wallpapers is self._searched:
+                # No directory changed since the last search: the same list
+                # (and what was computed from it) is kept, without building
+                # a new one
+                return self.wallpapers
+        wallpapers = WallpaperList()
+        for root, files in tree:
+            for file in files:
+                wallpapers.append(os.path.join(root, file))
+        wallpapers.sort()
+        wallpapers = self._remove_duplicates(wallpapers, self.changed_dirs)
+        self.set_wallpapers(wallpapers, self.changed_dirs)
+        with self._lock:
+            self._searched = wallpapers
         return wallpapers
 
+    def search_sampling(self, number, budget=None, on_sample=None):
+        """
+        Search the wallpapers, and choose `number` distinct wallpapers among
+        them while they are being discovered.
+
+        The choice is uniform (reservoir sampling), and does not need the
+        complete list. If the search takes longer than `budget` seconds, the
+        current (provisional) choice is given to `on_sample` as soon as
+        `number` wallpapers were found, so that they can be set before the
+        end of the search.
+
+        :param number: The number of wallpapers to choose.
+        :type number: int
+        :param budget: The time (in seconds) after which `on_sample` is
+            called, or `None`.
+        :type budget: float
+        :param on_sample: A function called (at most once, from the calling
+            thread) with the list of the wallpapers found so far, and the
+            provisional indexes in this (unsorted) list.
+
+        :return: A tuple `(wallpapers, indexes)`: the sorted list of all the
+            found wallpapers, and the indexes of the chosen ones (fewer than
+            `number` if not enough wallpapers were found).
+        :rtype: tuple
+        """
+        wallpapers = WallpaperList()
+        reservoir = []
+        deadline = None
+        if budget is not None and on_sample is not None:
+            deadline = time.monotonic() + budget
+        for count, wallpaper in enumerate(self._iter_search()):
+            wallpapers.append(wallpaper)
+            if count < number:
+                reservoir.append(count)
+            else:
+                slot = randint(0, count)
+                if slot < number:
+                    reservoir[slot] = count
+            if deadline is not None and len(reservoir) == number \
+                    and time.monotonic() >= deadline:
+                deadline = None
+                on_sample(wallpapers, list(reservoir))
+        chosen = [wallpapers[i] for i in reservoir]
+        wallpapers.sort()
+        wallpapers = self._remove_duplicates(wallpapers, self.changed_dirs)
+        if self._dedup is not None:
+            # A removed copy is replaced by the wallpaper that was kept
+            chosen = [self._dedup.canonical.get(path, path)
+                      for path in chosen]
+        self.set_wallpapers(wallpapers, self.changed_dirs)
+        return wallpapers, [wallpapers.index(path) for path in chosen]
+
+    def _remove_duplicates(self, wallpapers, changed_dirs):
+        """Remove the byte-identical copies, if deduplication is enabled."""
+        if self._dedup is None:
+            return wallpapers
+        deduplicated = self._dedup.deduplicate(wallpapers, changed_dirs)
+        self.duplicates = len(wallpapers) - len(deduplicated)
+        return deduplicated
+
+    def set_wallpapers(self, wallpapers, changed_dirs=None):
+        """
+        Replace the list of wallpapers (after a search, or with a list found
+        elsewhere), refreshing the metadata index in the background (only
+        the new or modified files are read).
+
+        :param wallpapers: The sorted list of wallpapers.
+        :param changed_dirs: The directories whose content may have changed,
+            see `MetadataIndex.update`.
+        """
+        if self._metadata is not None:
+            self._update_metadata(wallpapers, changed_dirs)
+        with self._lock:
+            self.wallpapers = wallpapers
+            self._list_changed()
+
+    def wait_metadata(self, timeout=None):
+        """
+        Wait until the metadata index has been refreshed.
+
+        :return: `True` if it is up-to-date, `False` if the timeout expired.
+        """
+        if self._metadata_worker is None:
+            return True
+        return self._metadata_worker.wait_idle(timeout)
+
+    def _update_metadata(self, wallpapers, changed_dirs):
+        """
+        Refresh the metadata index in the background: the first pass reads
+        the headers of all the files, which must not delay the startup or
+        the clicks. Until it is done, the wallpapers whose dimensions are
+        unknown are not matched to the screens.
+        """
+        with self._lock:
+            if changed_dirs is None:
+                self._metadata_dirs = None
+            elif self._metadata_dirs is not None:
+                # The coalesced refreshes are merged
+                self._metadata_dirs |= changed_dirs
+            if self._metadata_worker is None:
+                self._metadata_worker = LatestWinsWorker(
+                    self._refresh_metadata, self._on_metadata_refreshed,
+                    name='random_wallpaper-metadata')
+        self._metadata_worker.submit(wallpapers)
+
+    def _refresh_metadata(self, wallpapers):
+        with self._lock:
+            changed_dirs = self._metadata_dirs
+            self._metadata_dirs = set()
+        self._metadata.update(wallpapers, changed_dirs)
+
+    def _on_metadata_refreshed(self, wallpapers, result):
+        # The candidates are computed again with the new dimensions
+        with self._lock:
+            self._matcher = None
+
+    def _list_changed(self):
+        """Discard what was computed from the list of wallpapers."""
+        self._matcher = None
+        if self._weighted is not None:
+            self._weighted.invalidate()
+        if self._shuffle is not None:
+            self._shuffle.invalidate()
+
+    def _iter_search(self):
+        """
+        Search in all the configured directories and yield the wallpapers.
+        """
+        for root, files in self._iter_tree():
+            for file in files:
+                yield os.path.join(root, file)
+
+    def _iter_tree(self):
+        """
+        Search in all the configured directories, and yield a tuple
+        `(dir_path, files)` for each directory, where `files` are the
+        basenames of its wallpapers.
+        """
+        with self._search_lock:
+            with self._counters_lock:
+                self.files_visited = 0
+                self.files_matched = 0
+            if self._index is not None:
+                self._index.begin_scan()
+            if self._scanner is not None:
+                self._scanner.timed_out = []
+            for dir_path in self._search_dirs:
+                for root, files in self._walk_dir(dir_path):
+                    yield root, files
+            if self._index is not None:
+                self._index.end_scan()
+                self.changed_dirs = self._index.changed_dirs()
+            else:
+                self.changed_dirs = None
+
+    @property
+    def lock(self):
+        """
+        The lock held while `wallpapers` is modified in place (by the watcher
+        thread), to hold while using indexes in the list.
+        """
+        return self._lock
+
+    @property
+    def unwatched_dirs(self):
+        """
+        The directories that could not be watched because of the inotify
+        limits (see `fs.inotify.max_user_watches`).
+        """
+        if self._watcher is None:
+            return set()
+        return self._watcher.unwatched_paths()
+
+    @property
+    def timed_out_dirs(self):
+        """The directories skipped by the last search, see `scan_timeout`."""
+        if self._scanner is None:
+            return []
+        return self._scanner.timed_out
+
+    @property
+    def cache_errors(self):
+        """
+        The errors that prevented the last search from saving its caches, as
+        a list of `(cache name, error)` tuples.
+        """
+        errors = []
+        if self._index is not None and self._index.save_error is not None:
+            errors.append(('scan index', self._index.save_error))
+        if self._dedup is not None and self._dedup.save_error is not None:
+            errors.append(('digests', self._dedup.save_error))
+        return errors
+
+    def start_watching(self):
+        """
+        Search the wallpapers, and keep the list up-to-date in the background.
+
+        The configured directories (and their sub-directories, if the search
+        is recursive) are watched with inotify: added, removed and renamed
+        files are reflected in `self.wallpapers` as soon as they happen,
+        without rescanning.
+
+        :raise OSError: If inotify is not available on this system.
+        """
+        self._watcher = InotifyWatcher(self._on_fs_event)
+        # Directories are watched before being listed (see `_scan_dir`),
+        # so that no change can be missed between the two.
+        self.search()
+        self._watcher.start()
+        return self.wallpapers
+
+    def stop_watching(self):
+        """Stop watching the directories."""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def close(self):
+        """
+        Stop watching the directories, and the threads of the scanner and of
+        the metadata index.
+        """
+        self.stop_watching()
+        if self._scanner is not None:
+            self._scanner.close()
+        if self._metadata_worker is not None:
+            self._metadata_worker.stop(wait=False)
+
+    def _on_fs_event(self, kind, path, is_dir):
+        """
+        Apply a change in a watched directory to `self.wallpapers`.
+
+        Called from the watcher's thread.
+        """
+        if kind == watcher.OVERFLOW:
+            # Some events were lost, the list cannot be trusted anymore
+            self.search()
+            return
+        if kind == watcher.MODIFIED:
+            # e.g. the content of a new file was written after it was
+            # created (and its header was read): the list did not change
+            if self._metadata is not None and path in self.wallpapers \
+                    and self._metadata.refresh([path]):
+                with self._lock:
+                    self._matcher = None
+            return
+        with self._lock:
+            self._list_changed()
+            self._searched = None
+            if kind == watcher.CREATED:
+                added = []
+                if not is_dir:
+                    if path not in self.wallpapers \
+                            and self._should_add_file(path):
+                        added.append(path)
+                elif self._recursive_search \
+                        and not self._is_ignored_file(path):
+                    for wallpaper in self._search_in_dir(path):
+                        if wallpaper not in self.wallpapers:
+                            added.append(wallpaper)
+                if added and self._metadata is not None:
+                    self._metadata.refresh(added)
+                for wallpaper in added:
+                    self.wallpapers.insort(wallpaper)
+            elif kind == watcher.DELETED:
+                if not is_dir:
+                    if path in self.wallpapers:
+                        self.wallpapers.remove(path)
+                else:
+                    prefix = path + os.sep
+                    self.wallpapers = WallpaperList(
+                        w for w in self.wallpapers if not w.startswith(prefix))
+                    self._watcher.remove_subtree(path)
+
     def _search_in_dir(self, dir_path):
         """
         Search only in the specified directory and yield the wallpapers.
@@ -136,16 +734,78 @@ class WallpapersFinder:
             will be expanded (so `~` is authorized).
         :type dir_path: str
         """
-        dir_path = os.path.expanduser(dir_path)
-        for root, dirs, files in os.walk(dir_path, topdown=True):
-            if not self._recursive_search:
-                # delete the list of dirs, cancelling the recursion
-                del dirs[:]
-            # For each file, add it to wallpapers if it meets the conditions
+        for root, files in self._walk_dir(dir_path):
             for file in files:
-                abs_path = os.path.join(root, file)
-                if self._should_add_file(abs_path):
-                    yield abs_path
+                yield os.path.join(root, file)
+
+    def _walk_dir(self, dir_path):
+        """
+        Walk the specified directory, see `_search_in_dir`.
+
+        :return: A generator of `(dir_path, files)` tuples, where `files`
+            are the basenames of the wallpapers.
+        """
+        # Normalized (e.g. without the trailing separator of the default
+        # '~/Pictures/'), so that the directories are compared with the
+        # `os.path.dirname` of the wallpapers (see `changed_dirs`)
+        dir_path = os.path.normpath(os.path.expanduser(dir_path))
+        if self._scanner is not None:
+            return self._scanner.walk(dir_path, self._scan_dir,
+                                      self._recursive_search)
+        return scanner.walk(dir_path, self._scan_dir, self._recursive_search)
+
+    def _scan_dir(self, dir_path):
+        """
+        List a single directory (without recursion).
+
+        If the scan index is enabled and the directory was not modified
+        since it was indexed, the cached content is returned instead.
+
+        :param dir_path: The absolute path to the directory.
+        :type dir_path: str
+
+        :return: A tuple `(files, subdirs)` containing the basenames of
+            the wallpapers, and of the sub-directories, in this directory.
+        :rtype: tuple
+        """
+        if self._watcher is not None:
+            self._watcher.add_watch(dir_path)
+        mtime = None
+        if self._index is not None:
+            try:
+                mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                return [], []
+            cached = self._index.lookup(dir_path, mtime)
+            if cached is not None:
+                return cached
+        listed_at = now_ns()
+        files, subdirs = scanner.list_dir(dir_path)
+        nb_visited = len(files)
+        # Prune the ignored directories, their content is never listed
+        subdirs = [
+            subdir for subdir in subdirs
+            if not self._is_ignored_file(os.path.join(dir_path, subdir))
+        ]
+        # For each file, add it to wallpapers if it meets the conditions
+        files = [file for file in files
+                 if self._should_add_file(os.path.join(dir_path, file))]
+        with self._counters_lock:
+            self.files_visited += nb_visited
+            self.files_matched += len(files)
+        if self._index is not None:
+            self._index.store(dir_path, mtime, files, subdirs, listed_at)
+        return files, subdirs
+
+    def _filter_fingerprint(self):
+        """
+        Identify the filter configuration, so that the scan index is
+        discarded when the extensions or ignored patterns change.
+        """
+        extensions = None
+        if self._filter_extensions is not None:
+            extensions = sorted(self._filter_extensions)
+        return json.dumps([extensions, self._ignored_patterns])
 
     def _should_add_file(self, filename):
         """
@@ -172,15 +832,16 @@ class WallpapersFinder:
         :type filename: str
 
         :return: `True` if `self.filter_extensions == None` or if it contains
-            the extension of the given filename (e.g. jpg, png, etc.).
+            the extension of the given filename (e.g. jpg, png, etc.),
+            ignoring the case.
         """
-        if self._filter_extensions is None:
+        if self._extensions is None:
             return True
-        # splitext('/file.2.ext') returns ('/file.2', '.ext')
-        # Thus [1] returns the 2nd value (i.e. the extension) '.ext'
-        # And [1:] deletes the heading '.' in the extension 'ext'
-        extension = os.path.splitext(filename)[1][1:]
-        return extension in self._filter_extensions
+        # Same as `os.path.splitext`: leading dots (hidden files) do not
+        # start an extension
+        basename = filename.rpartition(os.sep)[2].lstrip('.')
+        extension = basename.rpartition('.')[2] if '.' in basename else ''
+        return extension.lower() in self._extensions
 
     def _is_ignored_file(self, filename):
         """
@@ -192,22 +853,37 @@ class WallpapersFinder:
         :return: `True` if `self.ignored_patterns` is not None, and one of the
             patterns matches the given filename.
         """
-        if self._ignored_patterns is None:
+        if self._ignored_regex is None:
             return False
-        for pattern in self._ignored_patterns:
-            if fnmatch(filename, pattern):
-                return True
-        return False
+        return self._ignored_regex.match(filename) is not None
+
+    @staticmethod
+    def _compile_patterns(patterns):
+        """
+        Compile a list of Unix glob patterns into a single regular expression,
+        so that a file is matched against all of them at once.
+
+        :return: The compiled regular expression, or `None` if there is no
+            pattern.
+        """
+        if not patterns:
+            return None
+        return re.compile('|'.join(fnmatch.translate(pattern)
+                                   for pattern in patterns))
 
 
 class Py3status:
 
     # Public attributes (i.e. config parameters)
+    background_apply = True
+    backend = 'worker'
     button_next = 1
     button_prev = 3
     button_rand = 2
+    cache_dir = None
     cache_list = False
     command = 'feh --bg-scale {}'
+    deduplicate = False
     filter_extensions = [
         'jpg',
         'png'
@@ -215,18 +891,77 @@ class Py3status:
     first_image_path = None
     format_string = 'Wallpaper {basename}'
     ignored_patterns = []
+    match_screens = False
+    prefetch = False
+    prefetch_cache_size = 512
+    random_history = 100
+    random_mode = 'uniform'
+    random_weights = {}
     recursive_search = False
+    restore_session = False
+    rotation_interval = None
+    scan_index = False
+    scan_timeout = None
+    scan_workers = 1
     search_dirs = [
         '~/Pictures/'
     ]
+    shared_index = False
+    startup_budget = None
+    stats_file = None
+    stats_log_interval = None
     screen_count = 'auto'
+    screen_refresh_interval = 60
     same_all_screens = True
+    watch_dirs = False
 
     def __init__(self):
+        # The current selection is kept by path (`_current_indexes` are its
+        # positions in `_wallpapers`, found again after each search)
         self._current_indexes = None
+        self._current_paths = None
         self._finder = None
+        # Screen topology provider, may be injected before `post_config_hook`
+        self._screens = None
         self._wallpapers = None
         self._error = None
+        self._watching = False
+        self._applier = None
+        # Backend running the wallpaper command
+        self._backend = None
+        self._prefetcher = None
+        # Index shared with the other instances (if any)
+        self._shared = None
+        # Pre-drawn random wallpapers (paths), so that they can be prefetched
+        self._next_random = None
+        # Time of the next rotation (see `rotation_interval`)
+        self._rotation_due = None
+        self._stats = Stats()
+        # Time of the next summary of the statistics
+        self._stats_due = None
+        # Background thread finishing the startup (if any)
+        self._startup_thread = None
+        # Whether the restored session is being reconciled with a search
+        self._reconciling = False
+
+    def kill(self):
+        """
+        Called by py3status when the module is stopped.
+        """
+        if self.stats_file is not None:
+            self._report_stats(force=True)
+        if self._wallpapers is not None:
+            self._save_session(with_list=True)
+        if self._applier is not None:
+            self._applier.stop()
+        if self._backend is not None:
+            self._backend.close()
+        if self._prefetcher is not None:
+            self._prefetcher.shutdown()
+        if self._finder is not None:
+            self._finder.close()
+        if self._shared is not None:
+            self._shared.close()
 
     def show(self):
         """
@@ -235,18 +970,34 @@ class Py3status:
         This is the method that will be called by py3status to compute the
         output and show it on the i3bar.
         """
+        waiting = self._waiting_for_shared()
+        if self.rotation_interval:
+            self._rotate_if_due()
         if self._error:
             format_string = 'Error! (code: {error_code})'
             full_text = self.py3.safe_format(format_string, self._error)
         else:
-            full_names = [self._wallpapers[i] for i in self._current_indexes]
+            # No wallpaper is selected while the first search is running
+            full_names = self._current_paths or []
             basenames = [os.path.basename(p) for p in full_names]
-            data = {'full_name': ' '.join(full_names),
-                    'basename': ' '.join(basenames)}
+            data = self._stats.placeholders()
+            data.update({'full_name': ' '.join(full_names),
+                         'basename': ' '.join(basenames),
+                         'count': len(self._wallpapers or [])})
             full_text = self.py3.safe_format(self.format_string, data)
+        self._report_stats()
+        cached_until = self.py3.CACHE_FOREVER
+        # py3status calls `show` again when the rotation, or the next summary
+        # of the statistics, is due
+        due = [t for t in (self._rotation_due, self._stats_due)
+               if t is not None]
+        if waiting:
+            due.append(self.py3.time_in(SHARED_POLL_INTERVAL))
+        if due:
+            cached_until = min(due)
         return {
             'full_text': full_text,
-            'cached_until': self.py3.CACHE_FOREVER
+            'cached_until': cached_until
         }
 
     def on_click(self, event):
@@ -254,49 +1005,709 @@ class Py3status:
         Callback function, called when a click event is received.
         """
         # {'y': 13,'x': 1737, 'button': 1, 'name':'example','instance':'first'}
-        if not self.cache_list:
-            self._wallpapers = self._finder.search()
-        indexes = self._current_indexes
-        index = indexes[0] if indexes is not None else 0
-        nb_screens = detect_number_of_screens() if self.screen_count == 'auto' \
-            else self.screen_count
-        if event['button'] == self.button_next:
-            indexes = self._finder.next(index, nb_screens,
-                                        self.same_all_screens)
-        elif event['button'] == self.button_prev:
-            indexes = self._finder.previous(index, nb_screens,
-                                            self.same_all_screens)
-        elif event['button'] == self.button_rand:
-            indexes = self._finder.random(index, nb_screens,
-                                          self.same_all_screens)
-        if indexes is not None and indexes != self._current_indexes:
-            self._current_indexes = indexes
-            paths = [self._wallpapers[i] for i in self._current_indexes]
-            self._set_wallpaper(paths)
+        if self._wallpapers is None:
+            # The first search is still running, or the writer instance did
+            # not publish the list yet
+            self._waiting_for_shared()
+            return
+        if self._watching:
+            self._check_watches()
+        if not self._watching and not self.cache_list \
+                and not self._reconciling:
+            # While the restored session is reconciled, the restored list is
+            # used: the background search gives the new one
+            self._wallpapers = self._search()
+        # The watcher modifies the list in place: the indexes are only valid
+        # while its lock is held
+        with self._finder.lock:
+            self._change_wallpaper(event['button'])
 
     def post_config_hook(self):
         """
         Initialization method (after config parameters have been set).
         """
+        if self._screens is None:
+            if self.screen_count == 'auto':
+                self._screens = XrandrScreenProvider(
+                    self.screen_refresh_interval)
+            else:
+                self._screens = StaticScreenProvider.from_count(
+                    self.screen_count)
+        self._backend = self._create_backend()
+        if self.background_apply:
+            self._applier = LatestWinsWorker(self._set_wallpaper,
+                                             self._on_wallpaper_applied)
+        if self.prefetch:
+            if PrefetchCache.is_available():
+                self._prefetcher = PrefetchCache(
+                    os.path.join(self._cache_root(), 'prescaled'),
+                    self.prefetch_cache_size * 1024 * 1024)
+            else:
+                self.py3.log('Cannot prefetch the wallpapers: Pillow is not '
+                             'installed', self.py3.LOG_WARNING)
+        index_path = None
+        if self.scan_index:
+            index_path = self._cache_path('scan-index')
+        shuffle = None
+        weighted = None
+        if self.random_mode == 'shuffle':
+            shuffle = ShuffleBag(self._cache_path('shuffle', 'jsonl',
+                                                  per_instance=True))
+        elif self.random_mode == 'weighted':
+            weighted = WeightedSelector(
+                self.random_weights, self.random_history,
+                self._cache_path('weighted', per_instance=True))
+        elif self.random_mode != 'uniform':
+            self.py3.log('Unknown random_mode %r, using uniform' %
+                         self.random_mode, self.py3.LOG_WARNING)
+        dedup = None
+        if self.deduplicate:
+            dedup = Deduplicator(self._cache_path('digests'))
+        metadata = None
+        if self.match_screens and not self.same_all_screens:
+            metadata = MetadataIndex(self._cache_path('metadata'),
+                                     workers=max(4, self.scan_workers))
         self._finder = WallpapersFinder(self.search_dirs,
                                         self.recursive_search,
                                         self.filter_extensions,
-                                        self.ignored_patterns)
-        self._wallpapers = self._finder.search()
-        nb_screens = detect_number_of_screens() if self.screen_count == 'auto' \
-            else self.screen_count
-        # get random index
-        self._current_indexes = self._finder.random(None, nb_screens,
-                                                    self.same_all_screens)
+                                        self.ignored_patterns,
+                                        index_path=index_path,
+                                        scan_workers=self.scan_workers,
+                                        scan_timeout=self.scan_timeout,
+                                        shuffle=shuffle,
+                                        metadata=metadata,
+                                        weighted=weighted,
+                                        dedup=dedup)
+        if self.shared_index and not self.watch_dirs:
+            self._shared = SharedIndex(self._cache_path('shared', 'idx'))
+        if self.restore_session and self._restore_session():
+            # The last session is shown immediately, and reconciled with
+            # a full search in the background
+            self._reconciling = True
+            self._start_thread(self._reconcile_session)
+        elif self.startup_budget is not None and not self.watch_dirs \
+                and self.first_image_path is None and self._shared is None:
+            # A provisional wallpaper is set after `startup_budget` seconds,
+            # while the search continues in the background
+            self._start_thread(self._sampled_startup)
+        else:
+            self._load_wallpapers()
+            if self._wallpapers is not None:
+                self._select_initial()
+
+    # Private Methods
+
+    def _waiting_for_shared(self):
+        """
+        Pick up the first list published by the writer instance, if this
+        instance was waiting for it (see `shared_index`).
+
+        :return: `True` if this instance is still waiting.
+        """
+        if self._wallpapers is not None or self._shared is None \
+                or self._startup_thread is not None:
+            return False
+        self._load_wallpapers()
+        if self._wallpapers is None:
+            return True
+        with self._finder.lock:
+            self._select_initial()
+        return False
+
+    def _change_wallpaper(self, button):
+        """
+        Select (and set) new wallpapers after a click on `button`.
+        """
+        self._use_finder_list()
+        # The list may have changed: find the current wallpaper again
+        position, found = self._current_position()
+        nb_screens = self._screen_count()
+        indexes = None
+        if button == self.button_next:
+            # If the current wallpaper was removed, `position` is the one
+            # that followed it
+            indexes = self._select('next', position if found else position - 1,
+                                   nb_screens)
+        elif button == self.button_prev:
+            indexes = self._select('previous', position, nb_screens)
+        elif button == self.button_rand:
+            indexes = self._take_next_random(nb_screens)
+            if indexes is None:
+                indexes = self._select('random', position, nb_screens)
+        if indexes is None:
+            return
+        paths = [self._wallpapers[i] for i in indexes]
+        self._current_indexes = indexes
+        if paths != self._current_paths:
+            self._current_paths = paths
+            self._apply_wallpaper(self._current_paths)
+            self._prepare_next()
+            self._save_session()
+
+    def _create_backend(self):
+        """Create the backend running the wallpaper command."""
+        if self.backend == 'stub':
+            return StubBackend()
+        if self.backend == 'worker':
+            backend = WorkerBackend(self.command)
+            try:
+                backend.start()
+                return backend
+            except OSError as e:
+                self.py3.log('Cannot start the setter process (%s), using '
+                             'the shell backend' % e, self.py3.LOG_WARNING)
+        elif self.backend != 'shell':
+            self.py3.log('Unknown backend %r, using shell' % self.backend,
+                         self.py3.LOG_WARNING)
+        return ShellBackend(self.py3, self.command)
+
+    def _load_wallpapers(self):
+        """
+        Find the wallpapers, and start watching the directories if requested.
+        """
+        wallpapers = None
+        if self.watch_dirs:
+            try:
+                wallpapers = self._finder.start_watching()
+                self._watching = True
+                self._check_watches()
+            except OSError as e:
+                self.py3.log('Cannot watch the directories (%s), the list '
+                             'will be searched again on each click' % e,
+                             self.py3.LOG_WARNING)
+        if wallpapers is None:
+            wallpapers = self._search()
+        if wallpapers is None:
+            # Waiting for the writer instance (see `shared_index`)
+            return
+        # A click may be using the previous (restored) list
+        with self._finder.lock:
+            self._use_finder_list()
+
+    def _check_watches(self):
+        """
+        Stop watching the directories if some of them could not be watched
+        (their changes would be missed): the list is then searched again on
+        each click, as without `watch_dirs`.
+        """
+        unwatched = self._finder.unwatched_dirs
+        if not unwatched:
+            return
+        self.py3.log('Cannot watch %d directories (e.g. %s), increase '
+                     'fs.inotify.max_user_watches; the list will be searched '
+                     'again on each click' % (len(unwatched), min(unwatched)),
+                     self.py3.LOG_WARNING)
+        self._finder.stop_watching()
+        self._watching = False
+
+    def _select_initial(self):
+        """
+        Select (and set) the first wallpaper(s): `first_image_path` if it was
+        found (followed by the next ones, on the other screens, if they must
+        be different), a random one otherwise.
+        """
+        nb_screens = self._screen_count()
+        self._current_indexes = None
+        if self.first_image_path is not None:
+            first = self._indexes_of(
+                [os.path.expanduser(self.first_image_path)])
+            if first is None:
+                self.py3.log('first_image_path %s was not found, using a '
+                             'random wallpaper' % self.first_image_path,
+                             self.py3.LOG_WARNING)
+            elif self.same_all_screens or nb_screens == 1:
+                self._current_indexes = first * nb_screens
+            else:
+                self._current_indexes = first + self._finder.next(
+                    first[0], nb_screens - 1, same=False)
+        if self._current_indexes is None:
+            self._current_indexes = self._select('random', None, nb_screens)
         if self._current_indexes is not None:
-            paths = [self._wallpapers[i] for i in self._current_indexes]
-            self._set_wallpaper(paths)
+            self._current_paths = [self._wallpapers[i]
+                                   for i in self._current_indexes]
+            self._apply_wallpaper(self._current_paths)
+            self._prepare_next()
+            self._save_session()
         else:
             self.py3.log('Could not find a suitable wallpaper',
                          self.py3.LOG_ERROR)
             self._error = {'error_code': -2}
 
-    # Private Methods
+    def _restore_session(self):
+        """
+        Restore the wallpapers list and the current selection saved by the
+        last session, and set the current wallpaper(s) again.
+
+        :return: `True` if a session was restored.
+        """
+        session = load_json(self._cache_path('session', per_instance=True))
+        groups = load_json(self._cache_path('session-list',
+                                            per_instance=True))
+        try:
+            paths = [str(path) for path in session['paths']]
+            wallpapers = WallpaperList.from_json(groups)
+            wallpapers.sort()
+            indexes = [wallpapers.index(path) for path in paths]
+        except (KeyError, TypeError, ValueError):
+            return False
+        if not paths:
+            return False
+        self._finder.set_wallpapers(wallpapers)
+        self._wallpapers = wallpapers
+        self._current_indexes = indexes
+        self._current_paths = paths
+        self._apply_wallpaper(paths)
+        return True
+
+    def _reconcile_session(self):
+        """
+        Search the wallpapers, and find the restored selection in the new list
+        (a new selection is made if a wallpaper disappeared).
+        """
+        try:
+            self._load_wallpapers()
+            with self._finder.lock:
+                indexes = self._indexes_of(self._current_paths)
+                if indexes is None:
+                    self._select_initial()
+                else:
+                    self._current_indexes = indexes
+                    self._prepare_next()
+                self._save_session(with_list=True)
+        except Exception as e:
+            self.py3.log('Error while searching the wallpapers: %s' % e,
+                         self.py3.LOG_ERROR)
+        finally:
+            self._reconciling = False
+        self.py3.update()
+
+    def _start_thread(self, target):
+        """Run `target` in the background startup thread."""
+        self._startup_thread = threading.Thread(target=target,
+                                                name='random_wallpaper-init')
+        self._startup_thread.daemon = True
+        self._startup_thread.start()
+
+    def _sampled_startup(self):
+        """
+        Search the wallpapers while choosing the first one(s) (see
+        `WallpapersFinder.search_sampling`), setting a provisional wallpaper
+        if the search takes longer than `startup_budget`.
+        """
+        try:
+            nb_screens = self._screen_count()
+            number = 1 if self.same_all_screens else nb_screens
+            provisional = []
+
+            def on_sample(wallpapers, indexes):
+                provisional.extend(indexes)
+                self._select_sampled(wallpapers, indexes, nb_screens)
+                self.py3.update()
+
+            with self._stats.timer('scan'):
+                wallpapers, indexes = self._finder.search_sampling(
+                    number, self.startup_budget, on_sample)
+            self._record_search(wallpapers)
+            self._wallpapers = wallpapers
+            if provisional:
+                # The list was sorted since the provisional selection
+                self._current_indexes = self._indexes_of(self._current_paths)
+            else:
+                if indexes:
+                    self._select_sampled(wallpapers, indexes, nb_screens)
+                else:
+                    self.py3.log('Could not find a suitable wallpaper',
+                                 self.py3.LOG_ERROR)
+                    self._error = {'error_code': -2}
+            self._prepare_next()
+            self._save_session(with_list=True)
+        except Exception as e:
+            self.py3.log('Error while searching the wallpapers: %s' % e,
+                         self.py3.LOG_ERROR)
+        self.py3.update()
+
+    def _select_sampled(self, wallpapers, indexes, nb_screens):
+        """Select (and set) the wallpapers chosen while searching."""
+        if self.same_all_screens:
+            indexes = [indexes[0]] * nb_screens
+        else:
+            indexes = [indexes[i % len(indexes)] for i in range(nb_screens)]
+        self._current_indexes = indexes
+        self._current_paths = [wallpapers[i] for i in indexes]
+        self._apply_wallpaper(self._current_paths)
+
+    def _save_session(self, with_list=False):
+        """
+        Save the current selection (and the wallpapers list, which is larger
+        and therefore only saved after a full search), so that the next
+        startup can show them immediately.
+        """
+        if not self.restore_session or self._current_indexes is None:
+            return
+        try:
+            atomic_write_json(self._cache_path('session', per_instance=True),
+                              {'paths': self._current_paths})
+            if with_list:
+                atomic_write_json(self._cache_path('session-list',
+                                                   per_instance=True),
+                                  self._wallpapers.to_json())
+        except (IOError, OSError) as e:
+            self.py3.log('Cannot save the session: %s' % e,
+                         self.py3.LOG_WARNING)
+
+    def _apply_wallpaper(self, paths):
+        """
+        Change the current wallpaper, in the background if `background_apply`
+        is set (the bar then shows the new selection immediately).
+        """
+        self._finder.mark_shown(paths)
+        if self._applier is not None:
+            self._applier.submit(paths)
+        else:
+            self._set_wallpaper(paths)
+
+    def _on_wallpaper_applied(self, paths, code):
+        """
+        Called by the background worker when the latest wallpaper has been
+        applied, to show the (possible) error on the bar.
+        """
+        if isinstance(code, Exception):
+            self.py3.log('Error while setting the wallpaper: %s' % code,
+                         self.py3.LOG_ERROR)
+            self._error = {'error_code': -3}
+        self.py3.update()
+
+    def _search(self):
+        """
+        Search the wallpapers, measuring the search.
+
+        With `shared_index`, only the writer instance searches (and publishes
+        the list); the others use the last published list.
+
+        :return: The list, or `None` if this instance is waiting for the
+            first list to be published by the writer.
+        """
+        if self._shared is not None and not self._acquire_shared():
+            # The list is picked up later if it was not published yet (see
+            # `_waiting_for_shared`), the startup is not delayed
+            wallpapers = self._read_shared()
+            return wallpapers if wallpapers is not None else self._wallpapers
+        with self._stats.timer('scan'):
+            wallpapers = self._finder.search()
+        self._record_search(wallpapers)
+        if self._shared is not None:
+            try:
+                self._shared.publish(wallpapers)
+            except (IOError, OSError) as e:
+                self.py3.log('Cannot publish the shared index: %s' % e,
+                             self.py3.LOG_WARNING)
+        return wallpapers
+
+    def _acquire_shared(self):
+        """
+        Try to become the writer instance (see `shared_index`). If the shared
+        index cannot be used, this instance stops sharing the list, and
+        searches it on its own.
+
+        :return: `True` if this instance must search the list.
+        """
+        try:
+            return self._shared.try_acquire()
+        except (IOError, OSError) as e:
+            self.py3.log('Cannot share the list of wallpapers (%s), it is '
+                         'searched by this instance only' % e,
+                         self.py3.LOG_WARNING)
+            self._shared = None
+            return True
+
+    def _read_shared(self):
+        """
+        Use the list published by the writer instance.
+
+        :return: The list, or `None` if no list was published yet.
+        """
+        wallpapers = self._shared.refresh()
+        if wallpapers is None:
+            return None
+        if wallpapers is not self._finder.wallpapers:
+            self._finder.set_wallpapers(wallpapers)
+            self._stats.set('count', len(wallpapers))
+        return wallpapers
+
+    def _record_search(self, wallpapers):
+        """
+        Report the directories that timed out and the caches that could not
+        be saved, and update the stats.
+        """
+        for dir_path in self._finder.timed_out_dirs:
+            self.py3.log('Listing %s timed out, it was skipped' % dir_path,
+                         self.py3.LOG_WARNING)
+        for name, error in self._finder.cache_errors:
+            self.py3.log('Cannot save the %s cache: %s' % (name, error),
+                         self.py3.LOG_WARNING)
+        self._stats.increment('scans')
+        self._stats.set('count', len(wallpapers))
+        self._stats.set('files_visited', self._finder.files_visited)
+        self._stats.set('files_matched', self._finder.files_matched)
+        self._stats.set('duplicates', self._finder.duplicates)
+
+    def _screen_count(self):
+        """Return the number of screens, measuring the detection time."""
+        with self._stats.timer('screens'):
+            return self._screens.count()
+
+    def _report_stats(self, force=False):
+        """
+        Log a summary of the statistics (and dump them to `stats_file`), at
+        most once every `stats_log_interval` seconds.
+        """
+        if self.stats_log_interval is None and not force:
+            return
+        if not force and self._stats_due is not None \
+                and time.time() < self._stats_due:
+            return
+        if self.stats_log_interval:
+            # `show` is called again when the next summary is due
+            self._stats_due = self.py3.time_in(self.stats_log_interval)
+        self.py3.log('Statistics: %s' % self._stats.summary(),
+                     self.py3.LOG_INFO)
+        if self.stats_file is not None:
+            try:
+                atomic_write_json(os.path.expanduser(self.stats_file),
+                                  self._stats.to_dict())
+            except (IOError, OSError) as e:
+                self.py3.log('Cannot write the statistics: %s' % e,
+                             self.py3.LOG_WARNING)
+
+    def _cache_path(self, name, extension='json', per_instance=False):
+        """
+        Compute the path to a persistent cache file.
+
+        The name of the file depends on the search configuration, so that
+        several instances of this module do not share incompatible caches.
+
+        :param name: The kind of cache (e.g. `scan-index`).
+        :type name: str
+        :param extension: The extension of the file.
+        :type extension: str
+        :param per_instance: True if the file holds the state of this
+            instance (e.g. the current wallpaper), which must not be shared
+            with the other instances that have the same search
+            configuration (e.g. one per output).
+        :type per_instance: bool
+        """
+        config = [self.search_dirs, self.recursive_search,
+                  self.filter_extensions, self.ignored_patterns]
+        if per_instance:
+            config.append(self._instance_name())
+        config = json.dumps(config)
+        key = hashlib.sha1(config.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self._cache_root(),
+                            '%s-%s.%s' % (name, key, extension))
+
+    def _instance_name(self):
+        """
+        Return the full name of this instance in the py3status configuration
+        (e.g. `random_wallpaper left`).
+        """
+        module = getattr(self.py3, '_module', None)
+        return getattr(module, 'module_full_name', None)
+
+    def _cache_root(self):
+        """Return the directory of the persistent caches."""
+        return os.path.expanduser(self.cache_dir or default_cache_dir())
+
+    def _select(self, kind, index, nb_screens):
+        """
+        Compute the indexes of the next selection (see
+        `WallpapersFinder.select`), different for each screen unless
+        `same_all_screens` is set.
+
+        :return: The list of indexes, or `None` if there is no wallpaper.
+        """
+        rows = self._finder.select(kind, index, nb_screens,
+                                   self.same_all_screens,
+                                   monitors=self._monitors_to_match())
+        return rows[0] if rows is not None else None
+
+    def _monitors_to_match(self):
+        """
+        Return the monitors to which random wallpapers are matched (see
+        `match_screens`), or `None`.
+        """
+        if not self.match_screens or self.same_all_screens:
+            return None
+        return self._screens.monitors()
+
+    def _use_finder_list(self):
+        """
+        Use the list of the finder, which the selections are computed from
+        (to call while holding its lock). It may be newer than
+        `_wallpapers`: it is kept up-to-date by the watcher, and replaced by
+        a background search (e.g. while the restored session is reconciled).
+        """
+        self._wallpapers = self._finder.wallpapers
+
+    def _current_position(self):
+        """
+        Find the current wallpaper in the (sorted) list, in O(log n).
+
+        :return: A tuple `(position, found)`. If the current wallpaper is no
+            longer in the list, `position` is where it would be inserted,
+            i.e. the position of the wallpaper that followed it.
+        """
+        if not self._current_paths or not self._wallpapers:
+            return 0, False
+        path = self._current_paths[0]
+        position = self._wallpapers.bisect(path)
+        found = position < len(self._wallpapers) \
+            and self._wallpapers[position] == path
+        return position, found
+
+    def _indexes_of(self, paths):
+        """
+        Find wallpapers (e.g. chosen before a rescan) in the current list.
+
+        :return: Their indexes, or `None` if one of them is no longer in the
+            list.
+        """
+        if paths is None:
+            return None
+        try:
+            return [self._wallpapers.index(path) for path in paths]
+        except ValueError:
+            return None
+
+    def _prepare_next(self):
+        """
+        Prepare the next change, after a new selection: pre-draw the next
+        random wallpapers (used by the random button and the rotation),
+        schedule the next rotation, and pre-scale the wallpapers that may be
+        selected next (next, previous, and the pre-drawn random) for each
+        screen.
+        """
+        if self._current_indexes is None:
+            return
+        next_random = None
+        if self._prefetcher is not None or self.rotation_interval:
+            # The wallpapers drawn in advance are kept until they are used,
+            # so that the next and previous clicks do not consume draws
+            next_random = self._indexes_of(self._next_random)
+            if next_random is None \
+                    or len(next_random) != self._screen_count():
+                self._drop_next_random()
+                next_random = self._predraw_random()
+        if self.rotation_interval:
+            self._rotation_due = self.py3.time_in(self.rotation_interval)
+        if self._prefetcher is None:
+            return
+        monitors = self._screens.monitors()
+        nb_screens = len(monitors)
+        index = self._current_indexes[0]
+        candidates = [
+            self._select('next', index, nb_screens),
+            self._select('previous', index, nb_screens),
+            next_random,
+        ]
+        for indexes in candidates:
+            if indexes is None:
+                continue
+            for i, monitor in zip(indexes, monitors):
+                if monitor.width is not None:
+                    self._prefetcher.prefetch(self._wallpapers[i],
+                                              monitor.width, monitor.height)
+
+    def _predraw_random(self):
+        """
+        Draw the wallpapers of the next random change in advance (kept by
+        path in `_next_random`), checking that their files still exist.
+
+        :return: Their indexes, or `None`.
+        """
+        nb_screens = self._screen_count()
+        index = self._current_indexes[0]
+        self._next_random = None
+        for _ in range(3):
+            indexes = self._select('random', index, nb_screens)
+            if indexes is None:
+                return None
+            paths = [self._wallpapers[i] for i in indexes]
+            existing = [path for path in paths if os.path.isfile(path)]
+            if len(existing) == len(paths):
+                self._next_random = paths
+                return indexes
+            # The wallpapers which still exist are drawn again later
+            self._finder.put_back(existing)
+        return None
+
+    def _take_next_random(self, nb_screens):
+        """
+        Take the wallpapers drawn in advance (see `_predraw_random`), to
+        show them.
+
+        :return: Their indexes, or `None` if they are no longer usable (they
+            are then given back).
+        """
+        indexes = self._indexes_of(self._next_random)
+        if indexes is None or len(indexes) != nb_screens:
+            self._drop_next_random()
+            return None
+        self._next_random = None
+        return indexes
+
+    def _drop_next_random(self):
+        """
+        Forget the wallpapers drawn in advance without showing them, and give
+        them back so that they are still drawn in this cycle.
+        """
+        if self._next_random is not None:
+            self._finder.put_back(self._next_random)
+            self._next_random = None
+
+    def _rotate_if_due(self):
+        """
+        Change the wallpaper if the rotation is due. The new wallpapers were
+        drawn (and checked) in advance, so only the command is run.
+        """
+        if self._rotation_due is None or self._wallpapers is None \
+                or time.time() < self._rotation_due:
+            return
+        with self._finder.lock:
+            self._rotate()
+
+    def _rotate(self):
+        """Change the wallpaper to the pre-drawn random ones."""
+        self._use_finder_list()
+        indexes = self._take_next_random(self._screen_count())
+        if indexes is None:
+            indexes = self._predraw_random()
+            self._next_random = None
+            if indexes is None:
+                # Nothing to rotate to, the rotation stops until a click
+                self._rotation_due = None
+                return
+        self._current_indexes = indexes
+        self._current_paths = [self._wallpapers[i] for i in indexes]
+        self._apply_wallpaper(self._current_paths)
+        self._prepare_next()
+        self._save_session()
+
+    def _prescaled_paths(self, paths):
+        """
+        Replace the paths by their pre-scaled versions, when they are in the
+        prefetch cache.
+        """
+        monitors = self._screens.monitors()
+        prescaled = list(paths)
+        for i, monitor in enumerate(monitors[:len(paths)]):
+            if monitor.width is not None:
+                cached = self._prefetcher.cached_path(paths[i], monitor.width,
+                                                      monitor.height)
+                if cached is not None:
+                    prescaled[i] = cached
+        # The command may record these paths (e.g. in `~/.fehbg`)
+        self._prefetcher.pin(set(prescaled) - set(paths))
+        return prescaled
 
     def _set_wallpaper(self, paths):
         """
@@ -318,16 +1729,20 @@ class Py3status:
         if len(paths) == 0:
             self.py3.log('Cannot set wallpaper: `paths` is empty',
                          self.py3.LOG_ERROR)
-            self.error = {'error_code': -2}
+            self._error = {'error_code': -2}
+            return -2
 
-        str_paths = ' '.join(paths)
+        if self._prefetcher is not None:
+            paths = self._prescaled_paths(paths)
         self._error = None
-        self.py3.log('Trying to set wallpaper(s): %s' % str_paths,
+        self.py3.log('Trying to set wallpaper(s): %s' % ', '.join(paths),
                      self.py3.LOG_INFO)
-        cmd = self.command.format(str_paths)
+        self._stats.increment('applies')
         try:
-            code = self.py3.command_run(cmd)
-        except self.py3.CommandError as e:
+            with self._stats.timer('apply'):
+                code = self._backend.apply(paths)
+        except CommandFailed as e:
+            self._stats.increment('failures')
             code = e.error_code
             self._error = {'error_code': code}
             msg = 'Error while setting the wallpaper! Return code: %d ; ' \
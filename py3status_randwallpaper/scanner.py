@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Directory scanners used by `WallpapersFinder`.
+
+The serial scanner lists one directory after another, while the parallel
+scanner fans the listing of sub-directories out across a bounded pool of
+threads. This is mostly useful for network mounts, where each listing is
+bound by round trips to the server rather than by the CPU.
+"""
+
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+
+def list_dir(dir_path):
+    """
+    List a single directory, without recursion.
+
+    The type of the entries is read from `os.scandir` (i.e. `d_type`), so
+    no additional `stat` call is needed on most filesystems. As with
+    `os.walk`, symbolic links to directories are neither files nor
+    traversed directories.
+
+    :param dir_path: The path to the directory.
+    :type dir_path: str
+
+    :return: A tuple `(files, subdirs)` of basenames. Both lists are empty
+        if the directory cannot be read.
+    :rtype: tuple
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry.name)
+                elif not entry.is_symlink():
+                    subdirs.append(entry.name)
+    except OSError:
+        pass
+    return files, subdirs
+
+
+def walk(root, scan_dir, recursive):
+    """
+    Walk a directory tree serially, depth-first and top-down (same order
+    as `os.walk`).
+
+    :param root: The path to the top directory.
+    :param scan_dir: The function listing a directory, returning a tuple
+        `(files, subdirs)` of basenames.
+    :param recursive: `False` to only list the top directory.
+
+    :return: A generator of `(dir_path, files)` tuples.
+    """
+    pending = [root]
+    while pending:
+        dir_path = pending.pop()
+        files, subdirs = scan_dir(dir_path)
+        yield dir_path, files
+        if recursive:
+            pending.extend(os.path.join(dir_path, subdir)
+                           for subdir in reversed(subdirs))
+
+
+class _DaemonPool:
+    """
+    Minimal pool of daemon threads.
+
+    Unlike `ThreadPoolExecutor`, whose threads are joined when the
+    interpreter exits, a thread stuck on a hung mount does not prevent
+    py3status from exiting.
+    """
+
+    def __init__(self, max_workers):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._max_workers = max_workers
+        self._threads = 0
+        # When a thread last started a task (to detect a stuck pool)
+        self.last_started = time.monotonic()
+
+    def submit(self, fn):
+        """
+        Run `fn()` in a thread of the pool.
+
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        self._queue.put((future, fn))
+        with self._lock:
+            if self._threads < self._max_workers:
+                self._start_thread()
+        return future
+
+    def add_worker(self):
+        """Start one more thread, e.g. to replace a hung one."""
+        with self._lock:
+            self._max_workers += 1
+            self._start_thread()
+
+    def remove_worker(self):
+        """Stop one thread, once it is idle (e.g. a hung one returned)."""
+        with self._lock:
+            self._max_workers -= 1
+            if self._threads > self._max_workers:
+                self._threads -= 1
+                self._queue.put(None)
+
+    def shutdown(self):
+        """Stop the threads once they are idle (without waiting for them)."""
+        with self._lock:
+            for _ in range(self._threads):
+                self._queue.put(None)
+            self._threads = 0
+
+    def _start_thread(self):
+        thread = threading.Thread(target=self._run,
+                                  name='random_wallpaper-scan')
+        thread.daemon = True
+        thread.start()
+        self._threads += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.last_started = time.monotonic()
+            try:
+                result = fn()
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class _Task:
+    """A directory listing submitted to the pool."""
+
+    def __init__(self, scan_dir, dir_path):
+        self.scan_dir = scan_dir
+        self.dir_path = dir_path
+        self.submitted = time.monotonic()
+        self.started = None
+
+    def __call__(self):
+        self.started = time.monotonic()
+        return self.scan_dir(self.dir_path)
+
+
+class ParallelScanner:
+    """
+    Walk directory trees by listing several directories concurrently.
+
+    The results are yielded in the same order as the serial `walk`: as soon
+    as a directory has been listed, all its sub-directories are submitted
+    to the pool, and then consumed depth-first.
+
+    The pool is kept between the walks. A directory whose listing timed out
+    but is still running (e.g. on a hung mount) is remembered, and skipped
+    by the next walks until the listing returns, so that each walk does not
+    leave another thread stuck on it. The hung threads are replaced, up to
+    `max_workers` of them.
+    """
+
+    def __init__(self, max_workers, timeout=None):
+        """
+        :param max_workers: The maximum number of directories being listed
+            at the same time.
+        :type max_workers: int
+        :param timeout: The maximum time (in seconds) to list a single
+            directory. A directory that takes longer (e.g. a hung mount)
+            is skipped, along with its sub-directories. `None` to wait
+            indefinitely.
+        :type timeout: float
+        """
+        self._max_workers = max_workers
+        self._timeout = timeout
+        self._pool = _DaemonPool(max_workers)
+        # Directories whose (timed out) listing is still running
+        self._hung = set()
+        self._lock = threading.Lock()
+        self.timed_out = []
+
+    def walk(self, root, scan_dir, recursive):
+        """
+        Walk a directory tree, see the module-level `walk` function.
+
+        The directories that were skipped because of the timeout are
+        appended to `self.timed_out`.
+        """
+        executor = self._pool
+        pending = [self._submit(executor, scan_dir, root)]
+        try:
+            while pending:
+                task, future = pending.pop()
+                result = None if future is None else self._wait(task, future)
+                if result is None:
+                    self.timed_out.append(task.dir_path)
+                    continue
+                files, subdirs = result
+                if recursive:
+                    # Submit all the sub-directories now, so that they are
+                    # listed while the current results are consumed
+                    submitted = [
+                        self._submit(executor, scan_dir,
+                                     os.path.join(task.dir_path, subdir))
+                        for subdir in subdirs
+                    ]
+                    pending.extend(reversed(submitted))
+                yield task.dir_path, files
+        finally:
+            # Do not wait for hung listings; cancel those not started yet
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+    def close(self):
+        """Stop the threads of the pool (the hung ones are abandoned)."""
+        self._pool.shutdown()
+
+    def _submit(self, executor, scan_dir, dir_path):
+        """
+        Submit a listing, unless the directory is known to be hung (the
+        future is then `None`).
+        """
+        task = _Task(scan_dir, dir_path)
+        with self._lock:
+            if dir_path in self._hung:
+                return task, None
+        return task, executor.submit(task)
+
+    def _mark_hung(self, task, future):
+        """
+        Remember a directory whose listing is stuck, until it returns, and
+        replace the stuck thread.
+        """
+        with self._lock:
+            if task.dir_path in self._hung \
+                    or len(self._hung) >= self._max_workers:
+                return
+            self._hung.add(task.dir_path)
+        self._pool.add_worker()
+        future.add_done_callback(lambda _: self._forget_hung(task.dir_path))
+
+    def _forget_hung(self, dir_path):
+        with self._lock:
+            self._hung.discard(dir_path)
+        self._pool.remove_worker()
+
+    def _wait(self, task, future):
+        """
+        Wait for a listing, and return its result, or `None` if it timed out.
+
+        The timeout starts when the listing starts: the time spent in the
+        queue (e.g. behind the sub-directories submitted before) does not
+        count. A listing that has not started is only given up if no
+        listing started for the whole timeout, i.e. if all the threads are
+        hung.
+        """
+        if self._timeout is None:
+            return future.result()
+        wait = self._timeout
+        while True:
+            try:
+                return future.result(timeout=wait)
+            except TimeoutError:
+                pass
+            now = time.monotonic()
+            if task.started is not None:
+                wait = task.started + self._timeout - now
+                if wait <= 0:
+                    self._mark_hung(task, future)
+                    return None
+                continue
+            idle = now - max(task.submitted, self._pool.last_started)
+            wait = self._timeout - idle
+            if wait <= 0 and future.cancel():
+                return None
+            # Otherwise the listing started in the meantime
+            wait = max(wait, 0.01)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Screen topology providers, i.e. the list of monitors and their geometry.
+
+`XrandrScreenProvider` asks `xrandr` for the monitors, and caches the answer
+for a configurable time, so that a click does not need to fork a process.
+`StaticScreenProvider` always returns the same monitors: it is used when
+the number of screens is configured, and can be injected in tests.
+"""
+
+
+import re
+import subprocess
+import time
+from collections import namedtuple
+
+
+Monitor = namedtuple('Monitor', ['name', 'width', 'height', 'x', 'y'])
+Monitor.__doc__ = """
+A monitor, with its geometry in pixels. The geometry is `None` when it is
+unknown (e.g. the number of screens is configured instead of detected).
+"""
+
+# e.g. ' 0: +*eDP-1 1920/344x1080/193+0+0  eDP-1'
+_MONITOR_LINE = re.compile(
+    r'^\s*\d+:\s+\S+\s+(\d+)/\d+x(\d+)/\d+([+-]\d+)([+-]\d+)\s+(\S+)'
+)
+
+
+def parse_xrandr_monitors(output):
+    """
+    Parse the output of `xrandr --listmonitors`.
+
+    :param output: The (decoded) output of the command.
+    :type output: str
+
+    :return: The list of monitors, in the order given by xrandr.
+    :rtype: list
+    """
+    monitors = []
+    for line in output.splitlines():
+        match = _MONITOR_LINE.match(line)
+        if match:
+            width, height, x, y, name = match.groups()
+            monitors.append(Monitor(name, int(width), int(height),
+                                    int(x), int(y)))
+    return monitors
+
+
+class StaticScreenProvider:
+    """Provide a fixed list of monitors."""
+
+    def __init__(self, monitors):
+        self._monitors = list(monitors)
+
+    @classmethod
+    def from_count(cls, count):
+        """Create a provider for `count` monitors of unknown geometry."""
+        return cls([Monitor('screen%d' % i, None, None, None, None)
+                    for i in range(count)])
+
+    def monitors(self):
+        """Return the list of monitors."""
+        return list(self._monitors)
+
+    def count(self):
+        """Return the number of monitors."""
+        return len(self._monitors)
+
+
+class XrandrScreenProvider:
+    """
+    Provide the monitors detected by `xrandr`, caching the result.
+
+    The monitors are only queried again when the cache is older than `ttl`
+    seconds, or after `invalidate` was called.
+    """
+
+    COMMAND = ['xrandr', '--listmonitors']
+
+    def __init__(self, ttl=60):
+        """
+        :param ttl: The time (in seconds) during which the monitors are
+            cached. `0` disables the cache, `None` caches them forever
+            (until `invalidate` is called).
+        :type ttl: float
+        """
+        self._ttl = ttl
+        self._monitors = None
+        self._updated = None
+
+    @staticmethod
+    def query():
+        """Run xrandr and return the list of monitors (without caching)."""
+        output = subprocess.check_output(XrandrScreenProvider.COMMAND)
+        return parse_xrandr_monitors(output.decode('utf-8'))
+
+    def invalidate(self):
+        """Force the next call to query xrandr again."""
+        self._monitors = None
+
+    def monitors(self):
+        """Return the list of monitors."""
+        now = time.monotonic()
+        if self._monitors is None or self._is_expired(now):
+            self._monitors = self.query()
+            self._updated = now
+        return list(self._monitors)
+
+    def _is_expired(self, now):
+        if self._ttl is None:
+            return False
+        return now - self._updated >= self._ttl
+
+    def count(self):
+        """Return the number of monitors."""
+        return len(self.monitors())
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Selection strategies for random wallpapers.
+
+`ShuffleBag` draws the wallpapers in a random order without repetition:
+every wallpaper is shown once before any of them is shown again.
+
+`WeightedSelector` draws the wallpapers with a probability proportional to
+their weight (configured per pattern), and leaves out the recently shown
+ones, in O(log n) per draw and per display (see `FenwickTree`).
+"""
+
+
+import fnmatch
+import json
+import re
+from array import array
+from collections import OrderedDict
+from random import randint, random
+
+from py3status_randwallpaper.cache import atomic_write_json, \
+    atomic_write_text, load_json
+
+
+class ShuffleBag:
+    """
+    Lazily generated random permutation of `range(size)`.
+
+    The permutation is built one element at a time by an incremental
+    Fisher-Yates shuffle, so that each draw is O(1). Only the positions
+    that were swapped are stored (all the others hold their own index), so
+    the memory is proportional to the number of draws in the current cycle.
+
+    The cycle is kept by path (see `sync`): when the list of wallpapers
+    changes (e.g. after a rescan), the permutation is rebuilt so that the
+    wallpapers already drawn in this cycle stay drawn, wherever they moved
+    in the list, and the new ones join the cycle. When all the wallpapers
+    have been drawn, a new cycle starts.
+
+    The drawn paths are appended to the state file, so that saving the
+    state costs O(1) per draw; the file is rewritten when a cycle starts
+    (or when paths are put back, see `put_back`).
+    """
+
+    def __init__(self, state_path=None):
+        """
+        :param state_path: The path to the file where the state is saved, so
+            that the cycle survives restarts. `None` to keep it in memory.
+        :type state_path: str
+        """
+        self._state_path = state_path
+        # The list the positions refer to (see `sync`)
+        self._wallpapers = None
+        # Paths drawn in this cycle, and those not saved yet
+        self._drawn = set()
+        self._unsaved = []
+        # Whether the state file must be rewritten (a new cycle started)
+        self._truncate = False
+        self._reset(0)
+        if state_path is not None:
+            self.load()
+
+    def _reset(self, size):
+        # Size of the permutation being drawn
+        self._size = size
+        # Number of valid indexes (indexes above were removed)
+        self._limit = size
+        # Number of elements already drawn in this cycle
+        self._position = 0
+        # Sparse permutation: position -> index
+        self._swaps = {}
+
+    def resize(self, size):
+        """
+        Set the number of indexes, when the bag is used without paths (see
+        `sync`).
+        """
+        self._limit = size
+        if size > self._size:
+            # The new positions are not swapped yet: they hold the new
+            # indexes, which therefore join the current cycle
+            self._size = size
+
+    def invalidate(self):
+        """Forget the positions, e.g. because the list changed in place."""
+        self._wallpapers = None
+
+    def sync(self, wallpapers):
+        """
+        Draw from a list of wallpapers. If it changed since the last draw, the
+        permutation is rebuilt from the paths drawn in this cycle, in
+        O(k log n) for k paths drawn.
+
+        :param wallpapers: The list of the wallpapers (e.g. a sorted
+            `WallpaperList`).
+        """
+        if wallpapers is self._wallpapers:
+            return
+        drawn = []
+        for path in list(self._drawn):
+            try:
+                drawn.append(wallpapers.index(path))
+            except ValueError:
+                # No longer in the list
+                self._drawn.discard(path)
+        self._reset(len(wallpapers))
+        self._wallpapers = wallpapers
+        # Move the drawn indexes to the consumed positions
+        inverse = {}
+        for i, index in enumerate(sorted(drawn)):
+            position = inverse.get(index, index)
+            if position != i:
+                value_i = self._swaps.get(i, i)
+                self._swaps[position] = value_i
+                inverse[value_i] = position
+            self._swaps.pop(i, None)
+        self._position = len(drawn)
+
+    def draw(self):
+        """
+        Draw the next index of the permutation.
+
+        :return: An index in `range(size)`, or `None` if the size is 0.
+        """
+        if self._limit == 0:
+            return None
+        while True:
+            if self._position >= self._size:
+                # Every index has been drawn: start a new cycle
+                self._reset(self._limit)
+                self._drawn = set()
+                self._unsaved = []
+                self._truncate = True
+            i = self._position
+            j = randint(i, self._size - 1)
+            # Swap the positions i and j, and consume the position i
+            value_i = self._swaps.pop(i, i)
+            if j == i:
+                value_j = value_i
+            else:
+                value_j = self._swaps.get(j, j)
+                self._swaps[j] = value_i
+            self._position += 1
+            if value_j < self._limit:
+                if self._wallpapers is not None:
+                    path = self._wallpapers[value_j]
+                    self._drawn.add(path)
+                    self._unsaved.append(path)
+                return value_j
+
+    def put_back(self, paths):
+        """
+        Give back paths that were drawn but not shown (e.g. drawn in
+        advance): they are drawn again in this cycle.
+        """
+        changed = False
+        for path in paths:
+            if path not in self._drawn:
+                continue
+            self._drawn.discard(path)
+            changed = True
+            if path in self._unsaved:
+                self._unsaved.remove(path)
+            else:
+                # Already in the state file
+                self._truncate = True
+        if changed:
+            # The permutation is rebuilt on the next `sync`
+            self._wallpapers = None
+
+    def remaining(self):
+        """Return the number of positions left in the current cycle."""
+        return self._size - self._position
+
+    def load(self):
+        """Load the paths drawn in this cycle from the disk, if any."""
+        try:
+            with open(self._state_path, 'r') as f:
+                lines = f.readlines()
+        except (IOError, OSError):
+            return
+        for line in lines:
+            try:
+                path = json.loads(line)
+            except ValueError:
+                # e.g. the last line was not fully written
+                continue
+            if isinstance(path, str):
+                self._drawn.add(path)
+        self._wallpapers = None
+
+    def save(self):
+        """Append the paths drawn since the last save to the disk."""
+        if self._state_path is None or not (self._unsaved or self._truncate):
+            return
+        # A rewrite saves all the paths drawn in this cycle
+        paths = sorted(self._drawn) if self._truncate else self._unsaved
+        lines = ''.join(json.dumps(path) + '\n' for path in paths)
+        try:
+            if self._truncate:
+                atomic_write_text(self._state_path, lines)
+            else:
+                with open(self._state_path, 'a') as f:
+                    f.write(lines)
+        except (IOError, OSError):
+            return
+        self._unsaved = []
+        self._truncate = False
+
+
+class FenwickTree:
+    """
+    Binary indexed tree of non-negative weights.
+
+    Changing a weight, computing a prefix sum, and drawing an index with a
+    probability proportional to its weight are all O(log n); building the
+    tree is O(n).
+    """
+
+    def __init__(self, weights=()):
+        self._weights = array('d', weights)
+        # _tree[i] is the sum of the weights in [i & (i + 1), i]
+        self._tree = array('d', self._weights)
+        size = len(self._tree)
+        for i in range(size):
+            parent = i | (i + 1)
+            if parent < size:
+                self._tree[parent] += self._tree[i]
+
+    def __len__(self):
+        return len(self._weights)
+
+    def weight(self, index):
+        """Return the weight of an index."""
+        return self._weights[index]
+
+    def set(self, index, weight):
+        """Change the weight of an index."""
+        delta = weight - self._weights[index]
+        self._weights[index] = weight
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index |= index + 1
+
+    def prefix(self, end):
+        """Return the sum of the weights of the indexes before `end`."""
+        total = 0.0
+        end -= 1
+        while end >= 0:
+            total += self._tree[end]
+            end = (end & (end + 1)) - 1
+        return total
+
+    def total(self):
+        """Return the sum of all the weights."""
+        return self.prefix(len(self))
+
+    def find(self, value):
+        """
+        Return the first index whose prefix sum (including itself) is
+        greater than `value`.
+        """
+        position = 0
+        step = 1 << (len(self._tree).bit_length() - 1) if self._tree else 0
+        while step:
+            candidate = position + step
+            if candidate <= len(self._tree) \
+                    and self._tree[candidate - 1] <= value:
+                position = candidate
+                value -= self._tree[candidate - 1]
+            step >>= 1
+        return min(position, len(self._tree) - 1)
+
+    def sample(self):
+        """
+        Draw an index with a probability proportional to its weight.
+
+        :return: The index, or `None` if all the weights are 0.
+        """
+        # A few attempts, as rounding errors may land on a weight of 0
+        for _ in range(3):
+            total = self.total()
+            if total <= 0:
+                return None
+            index = self.find(random() * total)
+            if self._weights[index] > 0:
+                return index
+        return None
+
+
+class WeightedSelector:
+    """
+    Weighted random draws, without the recently shown wallpapers.
+
+    The weight of a wallpaper is given by the first pattern that matches its
+    path (1 if none matches, 0 excludes it). The last `history_size`
+    wallpapers shown are given a weight of 0 until they leave the history.
+    The history is kept by path, so that it survives rescans and restarts.
+    """
+
+    def __init__(self, weights=None, history_size=100, state_path=None):
+        """
+        :param weights: A dict of Unix glob patterns (matched against the
+            full paths) to weights.
+        :type weights: dict
+        :param history_size: The number of recently shown wallpapers that
+            are not drawn.
+        :type history_size: int
+        :param state_path: The path to the file where the history is saved.
+            `None` to keep it in memory.
+        :type state_path: str
+        """
+        self._patterns = [(re.compile(fnmatch.translate(pattern)),
+                           float(weight))
+                          for pattern, weight in (weights or {}).items()]
+        self._history_size = history_size
+        self._state_path = state_path
+        # Recently shown wallpapers, from the oldest (used as an ordered set)
+        self._history = OrderedDict()
+        self._wallpapers = None
+        self._tree = None
+        if state_path is not None:
+            self.load()
+
+    def invalidate(self):
+        """Forget the weights, e.g. because the list changed."""
+        self._tree = None
+
+    def draw(self, wallpapers, number=1):
+        """
+        Draw `number` distinct wallpapers (when possible).
+
+        :param wallpapers: The list of the wallpapers; the weights are
+            computed again only if it changed (see `invalidate`).
+
+        :return: The list of indexes.
+        """
+        if self._tree is None or wallpapers is not self._wallpapers:
+            self._rebuild(wallpapers)
+        indexes = []
+        removed = []
+        for _ in range(number):
+            index = self._tree.sample()
+            if index is None:
+                # Everything left has a weight of 0
+                index = randint(0, len(wallpapers) - 1)
+            else:
+                # Not drawn again for the other screens
+                removed.append((index, self._tree.weight(index)))
+                self._tree.set(index, 0)
+            indexes.append(index)
+        for index, weight in removed:
+            self._tree.set(index, weight)
+        return indexes
+
+    def shown(self, paths):
+        """
+        Record that wallpapers were shown: they are not drawn again until
+        they leave the history.
+        """
+        for path in paths:
+            if path in self._history:
+                self._history.move_to_end(path)
+                continue
+            self._history[path] = None
+            self._set_path_weight(path, 0)
+        limit = self._history_size
+        if self._wallpapers is not None:
+            # Always keep some wallpapers to draw
+            limit = min(limit, len(self._wallpapers) - len(paths))
+        while self._history and len(self._history) > max(limit, 0):
+            path, _ = self._history.popitem(last=False)
+            self._set_path_weight(path, self._base_weight(path))
+        self.save()
+
+    def load(self):
+        """Load the history from the disk, if it exists."""
+        state = load_json(self._state_path)
+        try:
+            history = [str(path) for path in state['history']]
+        except (KeyError, TypeError, ValueError):
+            return
+        if self._history_size > 0:
+            history = history[-self._history_size:]
+        else:
+            history = []
+        self._history = OrderedDict((path, None) for path in history)
+
+    def save(self):
+        """Save the history to the disk (if possible)."""
+        if self._state_path is None:
+            return
+        try:
+            atomic_write_json(self._state_path,
+                              {'history': list(self._history)})
+        except (IOError, OSError):
+            pass
+
+    def _rebuild(self, wallpapers):
+        """Compute the weights of all the wallpapers, in O(n)."""
+        self._wallpapers = wallpapers
+        self._tree = FenwickTree(self._base_weight(path)
+                                 for path in wallpapers)
+        for path in self._history:
+            self._set_path_weight(path, 0)
+
+    def _base_weight(self, path):
+        """Return the configured weight of a wallpaper."""
+        for regex, weight in self._patterns:
+            if regex.match(path):
+                return max(weight, 0.0)
+        return 1.0
+
+    def _set_path_weight(self, path, weight):
+        """Change the weight of a wallpaper, if it is in the list."""
+        if self._tree is None:
+            return
+        try:
+            index = self._wallpapers.index(path)
+        except ValueError:
+            return
+        self._tree.set(index, weight)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived wallpaper setter process, used by `backends.WorkerBackend`.
+
+It reads one request per line on its standard input (a JSON list of paths,
+one per screen), runs the wallpaper command for all of them in a single
+call, and writes one JSON response per line on its standard output:
+`{"code": ..., "output": ..., "error": ...}`.
+
+It only depends on the standard library, so that it can be run as a script:
+    python setter.py 'feh --bg-scale {}'
+"""
+
+
+import json
+import shlex
+import subprocess
+import sys
+
+
+def build_argv(command, paths):
+    """
+    Build the argument list of the wallpaper command.
+
+    The command is split as a shell would do it, then the argument `{}` is
+    replaced by all the paths (one argument each), and an argument that
+    contains `{}` (e.g. `--image={}`) is repeated for each path. The paths
+    are never split, nor interpreted by a shell.
+
+    :param command: The command, e.g. `feh --bg-scale {}`.
+    :type command: str
+    :param paths: The paths to the wallpapers.
+    :type paths: list
+
+    :return: The list of arguments.
+    :rtype: list
+    """
+    argv = []
+    for arg in shlex.split(command):
+        if arg == '{}':
+            argv.extend(paths)
+        elif '{}' in arg:
+            argv.extend(arg.replace('{}', path) for path in paths)
+        else:
+            argv.append(arg)
+    return argv
+
+
+def run(command, paths):
+    """
+    Run the wallpaper command.
+
+    :return: The response, as a dict.
+    """
+    try:
+        process = subprocess.Popen(build_argv(command, paths),
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   universal_newlines=True)
+        output, error = process.communicate()
+        return {'code': process.returncode, 'output': output, 'error': error}
+    except (OSError, ValueError) as e:
+        return {'code': 127, 'output': '', 'error': str(e)}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        sys.stderr.write('Usage: setter.py COMMAND\n')
+        return 2
+    for line in sys.stdin:
+        try:
+            paths = [str(path) for path in json.loads(line)]
+        except (TypeError, ValueError) as e:
+            response = {'code': -1, 'output': '', 'error': str(e)}
+        else:
+            response = run(argv[0], paths)
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
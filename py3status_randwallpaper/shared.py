@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Index of the wallpapers shared between several instances of the module.
+
+One instance (the writer, which holds a lock) searches the wallpapers and
+publishes the list in a binary file; the other instances memory-map this
+file, read-only, instead of searching and keeping their own copy. A
+generation counter in the header tells the readers that a new list was
+published.
+
+File format (native byte order, sections aligned on 8 bytes):
+    header: magic (8 bytes), generation, number of entries, number of
+        directories (unsigned 64-bit integers)
+    directory offsets: number of directories + 1 (unsigned 64-bit)
+    basename offsets: number of entries + 1 (unsigned 64-bit)
+    directory ids of the entries: number of entries (unsigned 32-bit)
+    directories (UTF-8, with a trailing separator), then basenames (UTF-8)
+The entries are sorted by directory, then by basename.
+"""
+
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+
+MAGIC = b'RWPIDX\x00\x01'
+HEADER = struct.Struct('=8sQQQ')
+
+
+def _encode(text):
+    return text.encode('utf-8', 'surrogateescape')
+
+
+def _decode(data):
+    return bytes(data).decode('utf-8', 'surrogateescape')
+
+
+def _padding(size):
+    return -size % 8
+
+
+def write_index(path, paths, generation):
+    """
+    Write a (sorted) list of paths to an index file, atomically.
+
+    :param path: The path to the index file.
+    :param paths: The sorted paths, e.g. a sorted `WallpaperList`.
+    :param generation: The generation number of this list.
+    """
+    dir_ids = {}
+    dir_offsets = array('Q', [0])
+    dir_blob = bytearray()
+    name_offsets = array('Q', [0])
+    entry_dirs = array('I')
+    names = bytearray()
+    for wallpaper in paths:
+        cut = wallpaper.rfind(os.sep) + 1
+        dir_path = wallpaper[:cut]
+        dir_id = dir_ids.get(dir_path)
+        if dir_id is None:
+            dir_id = dir_ids[dir_path] = len(dir_ids)
+            dir_blob += _encode(dir_path)
+            dir_offsets.append(len(dir_blob))
+        entry_dirs.append(dir_id)
+        names += _encode(wallpaper[cut:])
+        name_offsets.append(len(names))
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, generation, len(entry_dirs),
+                                len(dir_ids)))
+            f.write(dir_offsets.tobytes())
+            f.write(name_offsets.tobytes())
+            f.write(entry_dirs.tobytes())
+            f.write(b'\x00' * _padding(entry_dirs.itemsize * len(entry_dirs)))
+            f.write(dir_blob)
+            f.write(names)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SharedWallpaperList:
+    """
+    Read-only, sorted sequence of paths backed by a memory-mapped index
+    file (see `write_index`).
+
+    It behaves as `WallpaperList` for reading (indexing, iteration, `len`,
+    `in`, `index`, `bisect`, `to_json`); the data is never copied in the
+    memory of the process.
+    """
+
+    def __init__(self, data):
+        """
+        :param data: The content of the index file (e.g. an `mmap`).
+        """
+        magic, self.generation, count, nb_dirs = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('Not a wallpapers index')
+        view = memoryview(data)
+        offset = HEADER.size
+        self._dir_offsets = view[offset:offset + 8 * (nb_dirs + 1)].cast('Q')
+        offset += 8 * (nb_dirs + 1)
+        self._name_offsets = view[offset:offset + 8 * (count + 1)].cast('Q')
+        offset += 8 * (count + 1)
+        self._entry_dirs = view[offset:offset + 4 * count].cast('I')
+        offset += 4 * count + _padding(4 * count)
+        self._dir_blob = view[offset:offset + self._dir_offsets[nb_dirs]]
+        offset += self._dir_offsets[nb_dirs]
+        self._names = view[offset:offset + self._name_offsets[count]]
+        self._count = count
+        # Decoded directories, on demand
+        self._dirs = {}
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._path(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('SharedWallpaperList index out of range')
+        return self._path(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._path(i)
+
+    def __contains__(self, path):
+        index = self.bisect(path)
+        return index < len(self) and self._path(index) == path
+
+    def __eq__(self, other):
+        if other is self:
+            return True
+        try:
+            return len(self) == len(other) and list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def index(self, path):
+        """
+        Return the position of a path, in O(log n).
+
+        :raise ValueError: If the path is not in the list.
+        """
+        index = self.bisect(path)
+        if index < len(self) and self._path(index) == path:
+            return index
+        raise ValueError('%r is not in SharedWallpaperList' % (path,))
+
+    def bisect(self, path):
+        """
+        Return the position where `path` is (or would be inserted), in
+        O(log n).
+        """
+        cut = path.rfind(os.sep) + 1
+        key = (path[:cut], _encode(path[cut:]))
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def to_json(self):
+        """Same as `WallpaperList.to_json`."""
+        groups = []
+        last_dir = None
+        for index in range(len(self)):
+            dir_id = self._entry_dirs[index]
+            if dir_id != last_dir:
+                groups.append([self._dir(dir_id), []])
+                last_dir = dir_id
+            groups[-1][1].append(_decode(self._name(index)))
+        return groups
+
+    def _dir(self, dir_id):
+        dir_path = self._dirs.get(dir_id)
+        if dir_path is None:
+            dir_path = _decode(self._dir_blob[self._dir_offsets[dir_id]:
+                                              self._dir_offsets[dir_id + 1]])
+            self._dirs[dir_id] = dir_path
+        return dir_path
+
+    def _name(self, index):
+        return self._names[self._name_offsets[index]:
+                           self._name_offsets[index + 1]]
+
+    def _key(self, index):
+        return self._dir(self._entry_dirs[index]), bytes(self._name(index))
+
+    def _path(self, index):
+        return self._dir(self._entry_dirs[index]) + _decode(self._name(index))
+
+
+class SharedIndex:
+    """
+    Access to a shared index file, by a single writer and many readers.
+
+    The writer is the instance that holds an exclusive lock (`flock`) on
+    `<path>.lock`; the lock is released when it stops (or crashes), so that
+    another instance can take over.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock_file = None
+        self._list = None
+        # Digest of the last published list
+        self._published = None
+
+    @property
+    def is_writer(self):
+        return self._lock_file is not None
+
+    def try_acquire(self):
+        """
+        Try to become the writer (without waiting).
+
+        :return: `True` if this instance is the writer.
+        :raise OSError: If the lock file cannot be created (e.g. the cache
+            directory is not writable).
+        """
+        if self._lock_file is not None:
+            return True
+        directory = os.path.dirname(self._path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        lock_file = open(self._path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def publish(self, wallpapers):
+        """
+        Publish a new list of wallpapers (writer only), unless it did not
+        change since the last publication.
+        """
+        if not self.is_writer:
+            raise RuntimeError('Only the writer can publish the index')
+        # A digest, rather than the list, so that it can be freed
+        digest = hashlib.sha1()
+        for path in wallpapers:
+            digest.update(_encode(path) + b'\x00')
+        digest = digest.digest()
+        if digest == self._published:
+            return
+        current = self.refresh()
+        generation = current.generation + 1 if current is not None else 1
+        write_index(self._path, wallpapers, generation)
+        self._published = digest
+
+    def refresh(self):
+        """
+        Map the last published list.
+
+        Only the header is read if the generation did not change, in which
+        case the same list is returned.
+
+        :return: A `SharedWallpaperList`, or `None` if no list was published.
+        """
+        try:
+            with open(self._path, 'rb') as f:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return None
+                magic, generation, _, _ = HEADER.unpack(header)
+                if magic != MAGIC:
+                    return None
+                if self._list is not None \
+                        and self._list.generation == generation:
+                    return self._list
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return None
+        # The previous mapping is released when it is no longer used
+        self._list = SharedWallpaperList(data)
+        return self._list
+
+    def close(self):
+        """Release the writer lock (if held)."""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Timing and counter instrumentation of the random_wallpaper module.
+
+The durations of the main phases (search, screens detection, wallpaper
+command) are measured with a monotonic clock, and running counters are
+kept, so that a slow click can be explained.
+"""
+
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Timers and counters exposed as format placeholders (with their default)
+PLACEHOLDERS = {
+    'scan_ms': 0,
+    'screens_ms': 0,
+    'apply_ms': 0,
+    'count': 0,
+    'files_visited': 0,
+    'files_matched': 0,
+    'duplicates': 0,
+    'scans': 0,
+    'applies': 0,
+    'failures': 0,
+}
+
+
+class Stats:
+    """
+    Running statistics: the last duration of each timer (in ms), their
+    totals, and counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = {}
+        self._total = {}
+        self._calls = {}
+        self._counters = {}
+
+    @contextmanager
+    def timer(self, name):
+        """Measure the duration of a block, recorded as `<name>_ms`."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - start)
+
+    def record(self, name, seconds):
+        """Record a duration (in seconds) for the timer `name`."""
+        ms = seconds * 1000
+        with self._lock:
+            self._last[name] = ms
+            self._total[name] = self._total.get(name, 0) + ms
+            self._calls[name] = self._calls.get(name, 0) + 1
+
+    def increment(self, name, value=1):
+        """Increment a running counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Set a counter to an absolute value (e.g. the number of files)."""
+        with self._lock:
+            self._counters[name] = value
+
+    def placeholders(self):
+        """Return the values for the format placeholders."""
+        data = dict(PLACEHOLDERS)
+        with self._lock:
+            for name, ms in self._last.items():
+                data['%s_ms' % name] = int(round(ms))
+            data.update(self._counters)
+        return data
+
+    def to_dict(self):
+        """Return all the statistics, e.g. to dump them as JSON."""
+        with self._lock:
+            timers = {}
+            for name in self._last:
+                timers[name] = {
+                    'last_ms': self._last[name],
+                    'total_ms': self._total[name],
+                    'calls': self._calls[name],
+                    'mean_ms': self._total[name] / self._calls[name],
+                }
+            return {'timers': timers, 'counters': dict(self._counters)}
+
+    def summary(self):
+        """Return a one-line summary, for the logs."""
+        data = self.to_dict()
+        parts = ['%s %.1fms (mean %.1fms over %d)' % (
+            name, timer['last_ms'], timer['mean_ms'], timer['calls'])
+            for name, timer in sorted(data['timers'].items())]
+        parts += ['%s=%d' % item for item in sorted(data['counters'].items())]
+        return ', '.join(parts)
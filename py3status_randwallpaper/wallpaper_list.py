@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Compact, memory-lean list of wallpaper paths.
+
+Wallpaper libraries repeat the same long directory prefixes many times, and
+py3status is a long-lived process: storing each path as a separate string
+wastes a lot of memory. `WallpaperList` stores each directory only once,
+and the basenames as UTF-8 bytes in a single buffer. The full paths are
+only built when they are accessed.
+
+The list can be kept sorted (by directory, then by basename), so that the
+position of a path is found by binary search, even after the list changed.
+"""
+
+
+import os
+from array import array
+
+
+class WallpaperList:
+    """
+    A sequence of paths, stored as (directory id, basename) entries.
+
+    It behaves as a list of `str` for indexing, iteration, `len` and
+    membership tests, and supports the usual mutations (`append`, `insert`,
+    `remove`, `del`).
+
+    Whether the entries are sorted is tracked: once `sort` was called (or if
+    the paths were added in order), `index`, `remove` and `in` use a binary
+    search, and `insort` adds a path at its sorted position.
+    """
+
+    def __init__(self, paths=()):
+        # Table of the directories (with a trailing separator)
+        self._dirs = []
+        self._dir_ids = {}
+        # Entries: directory id, and position of the basename in `_names`
+        self._entry_dirs = array('I')
+        self._entry_starts = array('Q')
+        self._entry_lengths = array('I')
+        self._names = bytearray()
+        # Number of bytes in `_names` no longer used by any entry
+        self._garbage = 0
+        # Whether the entries are sorted by (directory, basename)
+        self._sorted = True
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self._entry_dirs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._path(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('WallpaperList index out of range')
+        return self._path(index)
+
+    def __delitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('WallpaperList index out of range')
+        self._garbage += self._entry_lengths[index]
+        del self._entry_dirs[index]
+        del self._entry_starts[index]
+        del self._entry_lengths[index]
+        if self._garbage > len(self._names) // 2:
+            self._compact()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._path(i)
+
+    def __contains__(self, path):
+        return self._find(path) >= 0
+
+    def __eq__(self, other):
+        if isinstance(other, (WallpaperList, list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return 'WallpaperList(%r)' % list(self)
+
+    def append(self, path):
+        """Add a path at the end of the list."""
+        self.insert(len(self), path)
+
+    def extend(self, paths):
+        """Add several paths at the end of the list."""
+        for path in paths:
+            self.append(path)
+
+    def insert(self, index, path):
+        """Insert a path before `index`."""
+        dir_id, name = self._split(path, create=True)
+        length = len(self)
+        if index < 0:
+            index = max(0, index + length)
+        index = min(index, length)
+        if self._sorted:
+            key = (self._dirs[dir_id], name)
+            self._sorted = (index == 0 or self._key(index - 1) <= key) \
+                and (index == length or key <= self._key(index))
+        self._entry_dirs.insert(index, dir_id)
+        self._entry_starts.insert(index, len(self._names))
+        self._entry_lengths.insert(index, len(name))
+        self._names += name
+
+    def index(self, path):
+        """
+        Return the position of a path.
+
+        :raise ValueError: If the path is not in the list.
+        """
+        index = self._find(path)
+        if index < 0:
+            raise ValueError('%r is not in WallpaperList' % (path,))
+        return index
+
+    def remove(self, path):
+        """
+        Remove the first occurrence of a path.
+
+        :raise ValueError: If the path is not in the list.
+        """
+        del self[self.index(path)]
+
+    def sort(self):
+        """Sort the entries by directory, then by basename."""
+        if self._sorted:
+            return
+        order = sorted(range(len(self)), key=self._key)
+        self._entry_dirs = array('I', [self._entry_dirs[i] for i in order])
+        self._entry_starts = array('Q', [self._entry_starts[i] for i in order])
+        self._entry_lengths = array('I',
+                                    [self._entry_lengths[i] for i in order])
+        self._sorted = True
+
+    def bisect(self, path):
+        """
+        Return the position where `path` is (or would be inserted) in the
+        sorted list, in O(log n).
+
+        :raise ValueError: If the list is not sorted.
+        """
+        if not self._sorted:
+            raise ValueError('WallpaperList is not sorted')
+        cut = path.rfind(os.sep) + 1
+        key = (path[:cut], path[cut:].encode('utf-8', 'surrogateescape'))
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def insort(self, path):
+        """Insert a path at its position, keeping the list sorted."""
+        self.sort()
+        self.insert(self.bisect(path), path)
+
+    def to_json(self):
+        """
+        Convert the list into a compact JSON-compatible structure: a list of
+        `[directory, [basenames]]`, grouping consecutive entries of the same
+        directory.
+        """
+        groups = []
+        last_dir = None
+        for index, dir_id in enumerate(self._entry_dirs):
+            if dir_id != last_dir:
+                groups.append([self._dirs[dir_id], []])
+                last_dir = dir_id
+            start = self._entry_starts[index]
+            name = self._names[start:start + self._entry_lengths[index]]
+            groups[-1][1].append(name.decode('utf-8', 'surrogateescape'))
+        return groups
+
+    @classmethod
+    def from_json(cls, groups):
+        """Create a list from the output of `to_json`."""
+        wallpapers = cls()
+        for dir_path, names in groups:
+            for name in names:
+                wallpapers.append(dir_path + name)
+        return wallpapers
+
+    def _path(self, index):
+        start = self._entry_starts[index]
+        name = self._names[start:start + self._entry_lengths[index]]
+        return self._dirs[self._entry_dirs[index]] \
+            + name.decode('utf-8', 'surrogateescape')
+
+    def _split(self, path, create=False):
+        """
+        Split a path into its directory id and its encoded basename.
+
+        :return: A tuple `(dir_id, name)`; `dir_id` is `None` if the
+            directory is unknown and `create` is `False`.
+        """
+        cut = path.rfind(os.sep) + 1
+        dir_path = path[:cut]
+        dir_id = self._dir_ids.get(dir_path)
+        if dir_id is None and create:
+            dir_id = len(self._dirs)
+            self._dirs.append(dir_path)
+            self._dir_ids[dir_path] = dir_id
+        return dir_id, path[cut:].encode('utf-8', 'surrogateescape')
+
+    def _key(self, index):
+        """Return the sort key of an entry: `(directory, encoded basename)`."""
+        start = self._entry_starts[index]
+        return (self._dirs[self._entry_dirs[index]],
+                self._names[start:start + self._entry_lengths[index]])
+
+    def _find(self, path):
+        """
+        Return the position of a path, or -1 (binary search if the list is
+        sorted, linear search otherwise).
+        """
+        dir_id, name = self._split(path)
+        if dir_id is None:
+            return -1
+        if self._sorted:
+            index = self.bisect(path)
+            if index < len(self) and self._entry_dirs[index] == dir_id \
+                    and self._key(index)[1] == name:
+                return index
+            return -1
+        length = len(name)
+        for index, entry_dir in enumerate(self._entry_dirs):
+            if entry_dir == dir_id and self._entry_lengths[index] == length:
+                start = self._entry_starts[index]
+                if self._names[start:start + length] == name:
+                    return index
+        return -1
+
+    def _compact(self):
+        """Rebuild the buffer of basenames, without the unused bytes."""
+        names = bytearray()
+        for index, start in enumerate(self._entry_starts):
+            self._entry_starts[index] = len(names)
+            names += self._names[start:start + self._entry_lengths[index]]
+        self._names = names
+        self._garbage = 0
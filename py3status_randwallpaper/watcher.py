@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal inotify binding, used to watch the wallpapers directories.
+
+This binding only relies on the C library (through `ctypes`), so no
+additional dependency is required. It is only available on Linux.
+"""
+
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO \
+    | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_EVENT_HEADER = struct.Struct('iIII')
+
+# Kinds of events sent to the callback
+CREATED = 'created'
+DELETED = 'deleted'
+MODIFIED = 'modified'
+OVERFLOW = 'overflow'
+
+
+def _load_libc():
+    name = ctypes.util.find_library('c')
+    libc = ctypes.CDLL(name or 'libc.so.6', use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError(errno.ENOSYS, 'inotify is not available')
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class InotifyWatcher:
+    """
+    Watch a set of directories and report their changes in a background
+    thread.
+
+    The callback is called as `callback(kind, path, is_dir)`, where `kind`
+    is `CREATED` (also for entries moved into a watched directory),
+    `DELETED` (also for entries moved out of a watched directory),
+    `MODIFIED` (a file opened for writing was closed, e.g. the content of a
+    file that was just created was written), or `OVERFLOW` (some events
+    were lost: `path` is then `None`).
+    """
+
+    def __init__(self, callback):
+        self._callback = callback
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._paths = {}
+        self._wds = {}
+        # Directories that could not be watched because of a limit
+        self._unwatched = set()
+        self._lock = threading.Lock()
+        # Used to wake up the thread when stopping
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = None
+
+    def add_watch(self, path):
+        """
+        Watch a directory (not recursively).
+
+        :return: `True` if the directory is watched, `False` otherwise
+            (e.g. it does not exist anymore). The directories that exist but
+            could not be watched because of a limit (e.g.
+            `fs.inotify.max_user_watches`) are listed by `unwatched_paths`.
+        """
+        with self._lock:
+            if path in self._wds:
+                return True
+            wd = self._libc.inotify_add_watch(self._fd,
+                                              os.fsencode(path),
+                                              WATCH_MASK)
+            if wd < 0:
+                if ctypes.get_errno() in (errno.ENOSPC, errno.ENOMEM):
+                    self._unwatched.add(path)
+                return False
+            self._wds[path] = wd
+            self._paths[wd] = path
+            return True
+
+    def remove_subtree(self, path):
+        """Stop watching a directory and all its sub-directories."""
+        prefix = path + os.sep
+        with self._lock:
+            for watched in list(self._wds):
+                if watched == path or watched.startswith(prefix):
+                    wd = self._wds.pop(watched)
+                    self._paths.pop(wd, None)
+                    self._libc.inotify_rm_watch(self._fd, wd)
+
+    def watched_paths(self):
+        """Return the set of the currently watched directories."""
+        with self._lock:
+            return set(self._wds)
+
+    def unwatched_paths(self):
+        """
+        Return the set of the directories that could not be watched because
+        of a limit (the changes in these directories are missed).
+        """
+        with self._lock:
+            return set(self._unwatched)
+
+    def start(self):
+        """Start the background thread which dispatches the events."""
+        self._thread = threading.Thread(target=self._run,
+                                        name='random_wallpaper-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and release the inotify instance."""
+        if self._thread is not None:
+            os.write(self._stop_w, b'x')
+            self._thread.join()
+            self._thread = None
+        for fd in (self._fd, self._stop_r, self._stop_w):
+            os.close(fd)
+
+    def _run(self):
+        while True:
+            readable, _, _ = select.select([self._fd, self._stop_r], [], [])
+            if self._stop_r in readable:
+                return
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                raise
+            for kind, path, is_dir in self._parse(buf):
+                self._callback(kind, path, is_dir)
+
+    def _parse(self, buf):
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                yield OVERFLOW, None, False
+                continue
+            with self._lock:
+                dir_path = self._paths.get(wd)
+                if mask & IN_IGNORED and dir_path is not None:
+                    # The watch was removed (directory deleted, unmounted...)
+                    del self._paths[wd]
+                    self._wds.pop(dir_path, None)
+            if dir_path is None or not name:
+                continue
+            path = os.path.join(dir_path, os.fsdecode(name))
+            is_dir = bool(mask & IN_ISDIR)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                yield CREATED, path, is_dir
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                yield DELETED, path, is_dir
+            elif mask & IN_CLOSE_WRITE:
+                yield MODIFIED, path, is_dir
@@ -12,7 +12,9 @@ setup(
     version="1.1",
 
     packages=find_packages(),
+    python_requires=">=3.6",
     install_requires=["py3status>=3.20"],
+    extras_require={"prefetch": ["Pillow"]},
 
     entry_points={"py3status": ["module = py3status_randwallpaper.Py3status"]},
 
@@ -31,7 +33,7 @@ setup(
         "Environment :: Console",
         "Topic :: Utilities",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
     ],
 )
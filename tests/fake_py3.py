@@ -0,0 +1,80 @@
+"""
+A minimal stand-in for the `py3` helper that py3status gives to modules, so
+that `Py3status` can be tested (and benchmarked) without py3status or a bar.
+"""
+
+
+import time
+
+
+class CommandError(Exception):
+
+    def __init__(self, msg, error_code=1, output='', error=''):
+        Exception.__init__(self, msg)
+        self.error_code = error_code
+        self.output = output
+        self.error = error
+
+
+class FakeModule:
+    """The wrapper of a module instance in py3status."""
+
+    def __init__(self, module_full_name):
+        self.module_full_name = module_full_name
+
+
+class FakePy3:
+    """Records the commands and logs instead of running them."""
+
+    CACHE_FOREVER = -1
+    LOG_ERROR = 'error'
+    LOG_INFO = 'info'
+    LOG_WARNING = 'warning'
+    CommandError = CommandError
+
+    def __init__(self, command_code=0, module_full_name='random_wallpaper'):
+        self._module = FakeModule(module_full_name)
+        self.command_code = command_code
+        self.commands = []
+        self.logs = []
+        self.updates = 0
+
+    def command_run(self, command):
+        self.commands.append(command)
+        if self.command_code != 0:
+            raise CommandError('failed', error_code=self.command_code)
+        return 0
+
+    def log(self, message, level=LOG_INFO):
+        self.logs.append((level, message))
+
+    def safe_format(self, format_string, param_dict=None):
+        return format_string.format(**(param_dict or {}))
+
+    def time_in(self, seconds=None):
+        return time.time() + (seconds or 0)
+
+    def update(self, module_name=None):
+        self.updates += 1
+
+
+def make_module(module_class, screens=None,
+                module_full_name='random_wallpaper', **config):
+    """
+    Create a module instance, configured as py3status would do it (the
+    configuration parameters are set as attributes, then the `py3` helper,
+    then `post_config_hook` is called).
+
+    :param screens: An optional screen provider to inject.
+    :param module_full_name: The name of the instance in the configuration.
+    """
+    # The commands are run by the fake `py3`, which records them
+    config.setdefault('backend', 'shell')
+    module = module_class()
+    for key, value in config.items():
+        setattr(module, key, value)
+    module.py3 = FakePy3(module_full_name=module_full_name)
+    if screens is not None:
+        module._screens = screens
+    module.post_config_hook()
+    return module
@@ -0,0 +1,59 @@
+"""
+This module tests the background worker applying the wallpapers, i.e. the
+ability to coalesce rapid requests so that only the newest one is applied.
+"""
+
+
+import threading
+import unittest
+
+from py3status_randwallpaper.applier import LatestWinsWorker
+
+
+class TestApplier(unittest.TestCase):
+
+    def setUp(self):
+        self.applied = []
+        self.done = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def apply(self, request):
+        self.started.set()
+        self.release.wait()
+        self.applied.append(request)
+        if request == 'bad':
+            raise ValueError(request)
+        return 0
+
+    def on_done(self, request, result):
+        self.done.append((request, result))
+
+    def test_latest_wins(self):
+        worker = LatestWinsWorker(self.apply, self.on_done)
+        worker.submit('first')
+        self.started.wait()
+        # While 'first' is being applied, the next requests are coalesced
+        for request in ['second', 'third', 'fourth']:
+            worker.submit(request)
+        self.release.set()
+        self.assertTrue(worker.wait_idle(timeout=2))
+        worker.stop()
+        self.assertListEqual(self.applied, ['first', 'fourth'])
+        self.assertListEqual(self.done, [('fourth', 0)])
+
+    def test_error_is_reported(self):
+        self.release.set()
+        worker = LatestWinsWorker(self.apply, self.on_done)
+        worker.submit('bad')
+        self.assertTrue(worker.wait_idle(timeout=2))
+        worker.submit('good')
+        self.assertTrue(worker.wait_idle(timeout=2))
+        worker.stop()
+        self.assertEqual(self.done[0][0], 'bad')
+        self.assertIsInstance(self.done[0][1], ValueError)
+        self.assertEqual(self.done[1], ('good', 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+This module tests the backends running the wallpaper command, i.e. the
+argument lists (paths with spaces) and the long-lived setter process.
+"""
+
+
+import unittest
+
+from py3status_randwallpaper.backends import CommandFailed, StubBackend, \
+    WorkerBackend
+from py3status_randwallpaper.random_wallpaper import Py3status
+from py3status_randwallpaper.setter import build_argv
+from tests.fake_py3 import make_module
+from tests.test_module import data_dir
+
+
+PATHS = ['/home/user/My Pictures/a b.jpg', "/tmp/it's.png"]
+
+# Prints its arguments, and fails so that the output is returned
+ECHO_COMMAND = 'sh -c \'printf "%s|" "$@"; exit 3\' sh {}'
+
+
+class TestBackends(unittest.TestCase):
+
+    def test_build_argv(self):
+        self.assertListEqual(build_argv('feh --bg-scale {}', PATHS),
+                             ['feh', '--bg-scale'] + PATHS)
+        self.assertListEqual(
+            build_argv("setter --image={} --mode 'fill screen'", PATHS),
+            ['setter', '--image=' + PATHS[0], '--image=' + PATHS[1],
+             '--mode', 'fill screen'])
+
+    def test_worker(self):
+        backend = WorkerBackend(ECHO_COMMAND)
+        self.addCleanup(backend.close)
+        backend.start()
+        process = backend._process
+        for _ in range(2):
+            with self.assertRaises(CommandFailed) as context:
+                backend.apply(PATHS)
+            self.assertEqual(context.exception.error_code, 3)
+            self.assertEqual(context.exception.output, '|'.join(PATHS) + '|')
+        # The same process handled both requests
+        self.assertIs(backend._process, process)
+        # It is started again if it died
+        process.kill()
+        process.wait()
+        with self.assertRaises(CommandFailed):
+            backend.apply(PATHS[:1])
+        self.assertIsNot(backend._process, process)
+        backend = WorkerBackend('true {}')
+        self.addCleanup(backend.close)
+        self.assertEqual(backend.apply(PATHS), 0)
+
+    def test_stub(self):
+        module = make_module(Py3status, search_dirs=[data_dir],
+                             recursive_search=True, screen_count=1,
+                             background_apply=False, backend='stub')
+        self.addCleanup(module.kill)
+        module.on_click({'button': module.button_next})
+        self.assertIsInstance(module._backend, StubBackend)
+        self.assertEqual(len(module._backend.applied), 2)
+        self.assertListEqual(module._backend.applied[-1],
+                             module._current_paths)
+        self.assertListEqual(module.py3.commands, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 """
-This module tests the `previous`, `next` and `random` methods of
+This module tests the `previous`, `next`, `random` and `select` methods of
 `WallpapersFinder`, i.e. the ability to compute new indexes for wallpapers,
 with number of screens, same or different images.
 """
@@ -79,6 +79,39 @@ class TestWallpapers(unittest.TestCase):
         indexes = finder.random(None, number=4, same=False)
         self.assertListEqual(indexes, [0, 0, 0, 2])
 
+    def test_select(self):
+        finder = WallpapersFinder(None, None, None, None)
+        finder.wallpapers = ['picture%d' % i for i in range(10)]
+        # The first step is what `next` and `previous` return
+        for number, same in [(1, True), (3, True), (3, False), (12, False)]:
+            rows = finder.select('next', 8, number, same, steps=3)
+            self.assertListEqual(rows[0], finder.next(8, number, same))
+            self.assertListEqual(rows[2], finder.next(10, number, same))
+            rows = finder.select('previous', 1, number, same, steps=3)
+            self.assertListEqual(rows[0], finder.previous(1, number, same))
+            self.assertListEqual(rows[2], finder.previous(-1, number, same))
+        # Different random wallpapers on each screen, and at each step
+        for _ in range(20):
+            rows = finder.select('random', None, 3, False, steps=3)
+            self.assertEqual(len(rows), 3)
+            flat = [i for row in rows for i in row]
+            self.assertEqual(len(set(flat)), 9)
+            self.assertTrue(all(0 <= i < 10 for i in flat))
+        rows = finder.select('random', None, 2, True, steps=4)
+        self.assertTrue(all(row[0] == row[1] for row in rows))
+        self.assertEqual(len(set(row[0] for row in rows)), 4)
+        # Not enough wallpapers for all the steps: distinct on each step
+        rows = finder.select('random', None, 4, False, steps=5)
+        self.assertTrue(all(len(set(row)) == 4 for row in rows))
+        # More screens than wallpapers
+        finder.wallpapers = ['picture1', 'picture2', 'picture3']
+        rows = finder.select('random', None, 4, False)
+        self.assertSetEqual(set(rows[0]), {0, 1, 2})
+        with self.assertRaises(ValueError):
+            finder.select('sideways', 0)
+        finder.wallpapers = []
+        self.assertIsNone(finder.select('random'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,146 @@
+"""
+This module tests the removal of duplicated wallpapers, i.e. the ability to
+find byte-identical copies, and to hash only what is needed.
+"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from py3status_randwallpaper import dedup
+from py3status_randwallpaper.dedup import Deduplicator
+from py3status_randwallpaper.random_wallpaper import Py3status, \
+    WallpapersFinder
+from tests.fake_py3 import make_module
+
+
+class TestDedup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lib_dir = os.path.join(self.tmp_dir, 'lib')
+        self.digests_path = os.path.join(self.tmp_dir, 'digests.json')
+        for name, content in [('a/sunset.jpg', b'sunset'),
+                              ('b/copy.jpg', b'sunset'),
+                              ('b/sunset.jpg', b'sunset'),
+                              ('c/forest.jpg', b'forest'),
+                              ('c/unique.jpg', b'unique size')]:
+            self.write(name, content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.lib_dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def make_finder(self, deduplicator):
+        return WallpapersFinder([self.lib_dir], True, ['jpg'], [],
+                                dedup=deduplicator)
+
+    def names(self, wallpapers):
+        return [os.path.relpath(path, self.lib_dir) for path in wallpapers]
+
+    def test_deduplicate(self):
+        finder = self.make_finder(Deduplicator(self.digests_path))
+        with mock.patch.object(dedup, 'hash_file',
+                               side_effect=dedup.hash_file) as hash_file:
+            wallpapers = finder.search()
+            # The file with a unique size is not hashed
+            self.assertEqual(hash_file.call_count, 4)
+        self.assertListEqual(self.names(wallpapers),
+                             ['a/sunset.jpg', 'c/forest.jpg', 'c/unique.jpg'])
+        self.assertEqual(finder.duplicates, 2)
+        # The digests are cached: only the modified file is hashed again
+        self.write('b/copy.jpg', b'sunsex')
+        finder = self.make_finder(Deduplicator(self.digests_path))
+        with mock.patch.object(dedup, 'hash_file',
+                               side_effect=dedup.hash_file) as hash_file:
+            wallpapers = finder.search()
+            self.assertEqual(hash_file.call_count, 1)
+        self.assertListEqual(self.names(wallpapers),
+                             ['a/sunset.jpg', 'b/copy.jpg', 'c/forest.jpg',
+                              'c/unique.jpg'])
+
+    def test_thread_pool(self):
+        deduplicator = Deduplicator(workers=2)
+        deduplicator.MIN_POOL_FILES = 0
+        wallpapers = self.make_finder(deduplicator).search()
+        self.assertEqual(len(wallpapers), 3)
+
+    def test_changed_dirs(self):
+        deduplicator = Deduplicator(self.digests_path)
+        wallpapers = deduplicator.deduplicate(self.all_paths())
+        self.assertEqual(len(wallpapers), 3)
+        # Only the files of the changed directories are checked
+        self.write('c/other.jpg', b'forest')
+        with mock.patch.object(dedup, '_stat',
+                               side_effect=dedup._stat) as stat:
+            wallpapers = deduplicator.deduplicate(
+                self.all_paths(), {os.path.join(self.lib_dir, 'c')})
+            self.assertListEqual(
+                sorted(self.names(call[0][0] for call in stat.call_args_list)),
+                ['c/forest.jpg', 'c/other.jpg', 'c/unique.jpg'])
+        self.assertNotIn('c/other.jpg', self.names(wallpapers))
+        self.assertEqual(
+            deduplicator.canonical[os.path.join(self.lib_dir, 'c/other.jpg')],
+            os.path.join(self.lib_dir, 'c/forest.jpg'))
+        self.assertEqual(len(wallpapers), 3)
+
+    def test_trailing_separator(self):
+        top_dir = os.path.join(self.tmp_dir, 'top')
+        os.makedirs(top_dir)
+        for name in ['a.jpg', 'b.jpg']:
+            with open(os.path.join(top_dir, name), 'wb') as f:
+                f.write(b'AAAA')
+        finder = WallpapersFinder(
+            [top_dir + os.sep], False, ['jpg'], [],
+            index_path=os.path.join(self.tmp_dir, 'index.json'),
+            dedup=Deduplicator(self.digests_path))
+        self.addCleanup(finder.close)
+        self.assertEqual(len(finder.search()), 1)
+        # The copy is replaced by a different image (with the same size)
+        os.remove(os.path.join(top_dir, 'b.jpg'))
+        with open(os.path.join(top_dir, 'b.jpg'), 'wb') as f:
+            f.write(b'BBBB')
+        self.assertListEqual([os.path.basename(path)
+                              for path in finder.search()],
+                             ['a.jpg', 'b.jpg'])
+
+    def test_unwritable_cache(self):
+        not_a_dir = os.path.join(self.tmp_dir, 'file')
+        open(not_a_dir, 'w').close()
+        module = make_module(Py3status,
+                             search_dirs=[self.lib_dir],
+                             recursive_search=True,
+                             cache_dir=os.path.join(not_a_dir, 'cache'),
+                             deduplicate=True,
+                             screen_count=1,
+                             background_apply=False)
+        self.addCleanup(module.kill)
+        self.assertEqual(len(module._wallpapers), 3)
+        self.assertIn(module.py3.LOG_WARNING,
+                      [level for level, _ in module.py3.logs])
+
+    def all_paths(self):
+        return sorted(os.path.join(root, name)
+                      for root, _, names in os.walk(self.lib_dir)
+                      for name in names)
+
+    def test_sampling(self):
+        finder = self.make_finder(Deduplicator())
+        for _ in range(10):
+            wallpapers, indexes = finder.search_sampling(2)
+            self.assertEqual(len(wallpapers), 3)
+            self.assertEqual(len(indexes), 2)
+            self.assertTrue(all(0 <= i < 3 for i in indexes))
+
+
+if __name__ == '__main__':
+    unittest.main()
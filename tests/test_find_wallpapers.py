@@ -66,6 +66,39 @@ class TestWallpapers(unittest.TestCase):
         truth = [os.path.join(data_dir, 'dir1', 'picture2.png')]
         self.assertSetEqual(set(wallpapers), set(truth))
 
+    def test_search_extensions_case(self):
+        finder = WallpapersFinder(
+            search_dirs=[os.path.join(data_dir, 'dir1')],
+            recursive_search=False,
+            filter_extensions=['PNG'],
+            ignored_patterns=None
+        )
+        wallpapers = finder.search()
+        truth = [os.path.join(data_dir, 'dir1', 'picture2.png')]
+        self.assertSetEqual(set(wallpapers), set(truth))
+
+    def test_search_ignored_dirs(self):
+        finder = WallpapersFinder(
+            search_dirs=[os.path.join(data_dir, 'dir1')],
+            recursive_search=True,
+            filter_extensions=['jpg', 'png'],
+            ignored_patterns=['*/subdir*', '*/not_*']
+        )
+        # The ignored directory must not even be listed
+        original_scan_dir = finder._scan_dir
+        listed = []
+
+        def spy_scan_dir(dir_path):
+            listed.append(dir_path)
+            return original_scan_dir(dir_path)
+
+        finder._scan_dir = spy_scan_dir
+        wallpapers = finder.search()
+        truth = [os.path.join(data_dir, 'dir1', 'picture1.jpg'),
+                 os.path.join(data_dir, 'dir1', 'picture2.png')]
+        self.assertSetEqual(set(wallpapers), set(truth))
+        self.assertListEqual(listed, [os.path.join(data_dir, 'dir1')])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,169 @@
+"""
+This module tests the image metadata index, i.e. the ability to read the
+dimensions of the images from their headers, and to match them to screens.
+"""
+
+
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from py3status_randwallpaper.metadata import MetadataIndex, ScreenMatcher, \
+    read_image_size
+from py3status_randwallpaper.random_wallpaper import WallpapersFinder
+from py3status_randwallpaper.screens import Monitor
+
+
+def png_header(width, height):
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' \
+        + struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+
+
+def jpeg_header(width, height):
+    app0 = b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    sof0 = struct.pack('>BHHB', 8, height, width, 3) + b'\x00' * 9
+    return b'\xff\xd8' \
+        + b'\xff\xe0' + struct.pack('>H', len(app0) + 2) + app0 \
+        + b'\xff\xff\xc0' + struct.pack('>H', len(sof0) + 2) + sof0
+
+
+class TestMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_read_headers(self):
+        png = self.write('a.png', png_header(1920, 1080))
+        jpeg = self.write('b.jpg', jpeg_header(1080, 1920))
+        text = self.write('c.jpg', b'not an image')
+        self.assertEqual(read_image_size(png), (1920, 1080))
+        self.assertEqual(read_image_size(jpeg), (1080, 1920))
+        self.assertIsNone(read_image_size(text))
+        self.assertIsNone(read_image_size(os.path.join(self.tmp_dir, 'x')))
+
+    def test_incremental_update(self):
+        index_path = os.path.join(self.tmp_dir, 'metadata.json')
+        first = self.write('a.png', png_header(800, 600))
+        second = self.write('b.png', png_header(1600, 900))
+        index = MetadataIndex(index_path)
+        self.assertEqual(index.update([first, second]), 2)
+        self.assertEqual(index.update([first, second]), 0)
+        # The index is persistent, and only modified files are read again
+        self.write('b.png', png_header(3200, 1800) + b'more')
+        index = MetadataIndex(index_path)
+        self.assertEqual(index.update([first, second]), 1)
+        self.assertEqual(index.size(second), (3200, 1800))
+        index.update([second])
+        self.assertIsNone(index.size(first))
+
+    def test_screen_matcher(self):
+        wide = self.write('wide.png', png_header(3840, 2160))
+        small = self.write('small.png', png_header(1280, 720))
+        portrait = self.write('portrait.jpg', jpeg_header(1080, 1920))
+        square = self.write('square.png', png_header(1000, 1000))
+        wallpapers = [wide, small, portrait, square]
+        index = MetadataIndex()
+        index.update(wallpapers)
+        monitors = [Monitor('DP-1', 2560, 1440, 0, 0),
+                    Monitor('DP-2', 900, 1600, 2560, 0),
+                    Monitor('DP-3', 1024, 768, 0, 0),
+                    Monitor('VIRTUAL', None, None, None, None)]
+        matcher = ScreenMatcher(wallpapers, index, monitors)
+        # Matching aspect ratio, then orientation, then all the wallpapers
+        self.assertListEqual(matcher.candidates,
+                             [[0], [2], [0, 1], None])
+        for _ in range(10):
+            self.assertListEqual(matcher.choose()[:2], [0, 2])
+
+    def test_finder_matching(self):
+        self.write('wide.png', png_header(1920, 1080))
+        self.write('portrait.png', png_header(1080, 1920))
+        finder = WallpapersFinder([self.tmp_dir], False, ['png'], [],
+                                  metadata=MetadataIndex())
+        wallpapers = finder.search()
+        # The dimensions are read in the background
+        self.assertTrue(finder.wait_metadata(2))
+        monitors = [Monitor('DP-1', 1080, 1920, 0, 0),
+                    Monitor('DP-2', 1920, 1080, 1080, 0)]
+        for _ in range(10):
+            indexes = finder.random(None, 2, False, monitors)
+            self.assertListEqual([os.path.basename(wallpapers[i])
+                                  for i in indexes],
+                                 ['portrait.png', 'wide.png'])
+
+    def test_finder_incremental(self):
+        lib_dir = os.path.join(self.tmp_dir, 'lib')
+        for name in ['a', 'b']:
+            os.makedirs(os.path.join(lib_dir, name))
+            self.write(os.path.join('lib', name, 'wide.png'),
+                       png_header(1920, 1080))
+        # Modified long before the scans, so that the scan index trusts them
+        past = time.time() - 60
+        for dir_path in [lib_dir, os.path.join(lib_dir, 'a'),
+                         os.path.join(lib_dir, 'b')]:
+            os.utime(dir_path, (past, past))
+        finder = WallpapersFinder(
+            [lib_dir], True, ['png'], [],
+            index_path=os.path.join(self.tmp_dir, 'index.json'),
+            metadata=MetadataIndex())
+        self.addCleanup(finder.close)
+        wallpapers = finder.search()
+        self.assertTrue(finder.wait_metadata(2))
+        # Nothing changed: the same list is kept, no file is read again
+        with mock.patch.object(MetadataIndex, 'update') as update:
+            self.assertIs(finder.search(), wallpapers)
+            self.assertTrue(finder.wait_metadata(2))
+            self.assertEqual(update.call_count, 0)
+        # Only the files of the changed directory are checked
+        self.write(os.path.join('lib', 'b', 'portrait.png'),
+                   png_header(1080, 1920))
+        with mock.patch.object(MetadataIndex, '_refresh',
+                               autospec=True,
+                               side_effect=MetadataIndex._refresh) as refresh:
+            wallpapers = finder.search()
+            self.assertTrue(finder.wait_metadata(2))
+            self.assertSetEqual(
+                set(os.path.relpath(call[0][1], lib_dir)
+                    for call in refresh.call_args_list),
+                {os.path.join('b', 'wide.png'),
+                 os.path.join('b', 'portrait.png')})
+        self.assertEqual(len(wallpapers), 3)
+
+    def test_finder_trailing_separator(self):
+        lib_dir = os.path.join(self.tmp_dir, 'lib')
+        os.makedirs(lib_dir)
+        first = self.write(os.path.join('lib', 'a.png'),
+                           png_header(1920, 1080))
+        past = time.time() - 60
+        os.utime(lib_dir, (past, past))
+        finder = WallpapersFinder(
+            [lib_dir + os.sep], False, ['png'], [],
+            index_path=os.path.join(self.tmp_dir, 'index.json'),
+            metadata=MetadataIndex())
+        self.addCleanup(finder.close)
+        finder.search()
+        self.assertTrue(finder.wait_metadata(2))
+        # The top directory changed: its files are checked again
+        self.write(os.path.join('lib', 'a.png'),
+                   png_header(1080, 1920) + b'more')
+        self.write(os.path.join('lib', 'b.png'), png_header(800, 600))
+        finder.search()
+        self.assertTrue(finder.wait_metadata(2))
+        self.assertEqual(finder._metadata.size(first), (1080, 1920))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+This module tests the `Py3status` class, i.e. the py3status module itself:
+initial wallpaper, clicks and output, with a fake `py3` helper.
+"""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from py3status_randwallpaper.random_wallpaper import Py3status
+from py3status_randwallpaper.screens import Monitor, StaticScreenProvider
+from tests.fake_py3 import make_module
+
+# The path to this folder (the `tests/` folder in the project).
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+# The path to the data folder (`tests/data`).
+data_dir = os.path.join(tests_dir, 'data')
+
+
+class TestModule(unittest.TestCase):
+
+    def make_module(self, **config):
+        config.setdefault('search_dirs', [data_dir])
+        config.setdefault('recursive_search', True)
+        config.setdefault('screen_count', 1)
+        config.setdefault('background_apply', False)
+        module = make_module(Py3status, **config)
+        self.addCleanup(module.kill)
+        return module
+
+    def test_startup(self):
+        module = self.make_module()
+        self.assertEqual(len(module.py3.commands), 1)
+        self.assertIn(module._current_paths[0], module._wallpapers)
+        output = module.show()
+        self.assertEqual(output['full_text'], 'Wallpaper %s' %
+                         os.path.basename(module._current_paths[0]))
+
+    def test_next_and_previous(self):
+        module = self.make_module()
+        first = module._current_indexes[0]
+        count = len(module._wallpapers)
+        module.on_click({'button': module.button_next})
+        self.assertEqual(module._current_indexes, [(first + 1) % count])
+        module.on_click({'button': module.button_prev})
+        self.assertEqual(module._current_indexes, [first])
+        self.assertEqual(module.py3.commands[-1],
+                         ['feh', '--bg-scale', module._wallpapers[first]])
+
+    def test_selection_kept_after_rescan(self):
+        lib_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lib_dir)
+        for name in ['b.jpg', 'd.jpg', 'f.jpg']:
+            open(os.path.join(lib_dir, name), 'w').close()
+        module = self.make_module(search_dirs=[lib_dir],
+                                  first_image_path=os.path.join(lib_dir,
+                                                                'd.jpg'))
+        self.assertEqual(module._current_indexes, [1])
+        # New wallpapers before the current one do not shift the selection
+        open(os.path.join(lib_dir, 'a.jpg'), 'w').close()
+        module.on_click({'button': module.button_next})
+        self.assertEqual(os.path.basename(module._current_paths[0]), 'f.jpg')
+        # Next of a removed wallpaper is the one that followed it
+        os.remove(os.path.join(lib_dir, 'f.jpg'))
+        open(os.path.join(lib_dir, 'e.jpg'), 'w').close()
+        module.on_click({'button': module.button_next})
+        self.assertEqual(os.path.basename(module._current_paths[0]), 'a.jpg')
+
+    def test_first_image_not_found(self):
+        module = self.make_module(first_image_path='/missing.jpg')
+        self.assertIn(module._current_paths[0], module._wallpapers)
+        self.assertEqual(module.py3.logs[0][0], module.py3.LOG_WARNING)
+
+    def test_multiple_screens(self):
+        monitors = [Monitor('left', 1920, 1080, 0, 0),
+                    Monitor('right', 1920, 1080, 1920, 0)]
+        module = self.make_module(screens=StaticScreenProvider(monitors),
+                                  screen_count='auto',
+                                  same_all_screens=False)
+        self.assertEqual(len(module._current_paths), 2)
+        module.on_click({'button': module.button_next})
+        self.assertEqual(len(module.py3.commands[-1]), 4)
+
+    def test_rotation(self):
+        module = self.make_module(rotation_interval=600)
+        output = module.show()
+        self.assertAlmostEqual(output['cached_until'], time.time() + 600,
+                               delta=5)
+        # Nothing happens before the rotation is due
+        self.assertEqual(len(module.py3.commands), 1)
+        next_paths = module._next_random
+        self.assertIsNotNone(next_paths)
+        module._rotation_due = time.time() - 1
+        output = module.show()
+        self.assertEqual(module._current_paths, next_paths)
+        self.assertEqual(len(module.py3.commands), 2)
+        self.assertGreater(output['cached_until'], time.time() + 500)
+        # A click starts the interval again
+        module._rotation_due = time.time() + 10
+        module.on_click({'button': module.button_next})
+        self.assertGreater(module.show()['cached_until'], time.time() + 500)
+        self.assertEqual(len(module.py3.commands), 3)
+
+    def test_shuffle_with_next_clicks(self):
+        lib_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lib_dir)
+        for i in range(20):
+            open(os.path.join(lib_dir, 'p%02d.jpg' % i), 'w').close()
+        module = self.make_module(search_dirs=[lib_dir],
+                                  cache_dir=os.path.join(lib_dir, 'cache'),
+                                  random_mode='shuffle',
+                                  rotation_interval=600)
+        shown = [module._current_paths[0]]
+        for _ in range(19):
+            # The next clicks do not take wallpapers from the cycle
+            module.on_click({'button': module.button_next})
+            module.on_click({'button': module.button_rand})
+            shown.append(module._current_paths[0])
+        self.assertEqual(len(set(shown)), 20)
+
+    def test_no_rotation(self):
+        module = self.make_module()
+        self.assertEqual(module.show()['cached_until'],
+                         module.py3.CACHE_FOREVER)
+        self.assertIsNone(module._next_random)
+
+    def test_background_apply(self):
+        module = self.make_module(background_apply=True)
+        module.py3.command_code = 2
+        module.on_click({'button': module.button_next})
+        self.assertTrue(module._applier.wait_idle(timeout=2))
+        self.assertEqual(module._error, {'error_code': 2})
+        self.assertTrue(module.show()['full_text'].startswith('Error!'))
+        self.assertGreater(module.py3.updates, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
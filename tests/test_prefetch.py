@@ -0,0 +1,79 @@
+"""
+This module tests the cache of pre-scaled wallpapers, i.e. the ability to
+render images ahead of time and to evict the least recently used ones.
+"""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from py3status_randwallpaper.prefetch import PrefetchCache, cover_size
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        os.makedirs(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lru_eviction(self):
+        cache = PrefetchCache(self.cache_dir, max_size=25)
+        now = time.time()
+        for i, name in enumerate(['old', 'recent', 'newest']):
+            path = os.path.join(self.cache_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10)
+            os.utime(path, (now + i, now + i))
+        cache.evict()
+        self.assertListEqual(sorted(os.listdir(self.cache_dir)),
+                             ['newest', 'recent'])
+        # The current wallpaper is not evicted
+        cache.pin([os.path.join(self.cache_dir, 'recent')])
+        cache._max_size = 5
+        cache.evict()
+        self.assertListEqual(os.listdir(self.cache_dir), ['recent'])
+
+    def test_cover_size(self):
+        # The aspect ratio is kept, and the screen covered
+        self.assertEqual(cover_size((4000, 2000), 1920, 1080), (2160, 1080))
+        self.assertEqual(cover_size((3000, 4000), 1920, 1080), (1920, 2560))
+        self.assertEqual(cover_size((3840, 2160), 1920, 1080), (1920, 1080))
+        # Never scaled up
+        self.assertIsNone(cover_size((1920, 1080), 1920, 1080))
+        self.assertIsNone(cover_size((1000, 4000), 1920, 1080))
+
+    def test_missing_source(self):
+        cache = PrefetchCache(self.cache_dir, max_size=1024)
+        missing = os.path.join(self.tmp_dir, 'missing.jpg')
+        cache.prefetch(missing, 10, 10)
+        self.assertIsNone(cache.cached_path(missing, 10, 10))
+
+    @unittest.skipUnless(PrefetchCache.is_available(), 'requires Pillow')
+    def test_render(self):
+        from PIL import Image
+        source = os.path.join(self.tmp_dir, 'source.png')
+        Image.new('RGB', (64, 32)).save(source)
+        cache = PrefetchCache(self.cache_dir, max_size=1024 * 1024)
+        self.assertIsNone(cache.cached_path(source, 16, 8))
+        cache.prefetch(source, 16, 8)
+        cache.shutdown(wait=True)
+        cached = cache.cached_path(source, 16, 8)
+        self.assertIsNotNone(cached)
+        self.assertEqual(Image.open(cached).size, (16, 8))
+        # Another aspect ratio: not stretched
+        cache = PrefetchCache(self.cache_dir, max_size=1024 * 1024)
+        cache.prefetch(source, 16, 16)
+        cache.shutdown(wait=True)
+        self.assertEqual(Image.open(cache.cached_path(source, 16, 16)).size,
+                         (32, 16))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+This module tests the streaming selection of wallpapers, i.e. the ability to
+choose random wallpapers (reservoir sampling) while they are being found.
+"""
+
+
+import os
+import random
+import unittest
+from collections import Counter
+
+from py3status_randwallpaper.random_wallpaper import Py3status, \
+    WallpapersFinder
+from tests.fake_py3 import make_module
+
+# The path to this folder (the `tests/` folder in the project).
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+# The path to the data folder (`tests/data`).
+data_dir = os.path.join(tests_dir, 'data')
+
+
+class TestSampling(unittest.TestCase):
+
+    def make_finder(self):
+        return WallpapersFinder(
+            search_dirs=[data_dir],
+            recursive_search=True,
+            filter_extensions=['jpg', 'png'],
+            ignored_patterns=None
+        )
+
+    def test_sample(self):
+        finder = self.make_finder()
+        wallpapers, indexes = finder.search_sampling(3)
+        self.assertEqual(len(wallpapers), 5)
+        self.assertEqual(len(set(indexes)), 3)
+        self.assertListEqual(list(finder.wallpapers), list(wallpapers))
+        # Not enough wallpapers
+        wallpapers, indexes = finder.search_sampling(10)
+        self.assertListEqual(sorted(indexes), [0, 1, 2, 3, 4])
+
+    def test_uniform(self):
+        random.seed(42)
+        finder = self.make_finder()
+        counts = Counter()
+        for _ in range(2000):
+            _, indexes = finder.search_sampling(1)
+            counts[indexes[0]] += 1
+        self.assertEqual(set(counts), {0, 1, 2, 3, 4})
+        for count in counts.values():
+            self.assertAlmostEqual(count / 2000.0, 0.2, delta=0.05)
+
+    def test_provisional(self):
+        finder = self.make_finder()
+        samples = []
+
+        def on_sample(wallpapers, indexes):
+            samples.append((len(wallpapers), indexes))
+
+        finder.search_sampling(2, budget=0, on_sample=on_sample)
+        # Called once, as soon as enough wallpapers were found
+        self.assertListEqual(samples, [(2, [0, 1])])
+
+    def test_module(self):
+        module = make_module(Py3status,
+                             search_dirs=[data_dir],
+                             recursive_search=True,
+                             screen_count=2,
+                             same_all_screens=False,
+                             background_apply=False,
+                             startup_budget=0)
+        module._startup_thread.join()
+        self.addCleanup(module.kill)
+        # Only the provisional wallpapers are set
+        self.assertEqual(len(module.py3.commands), 1)
+        self.assertEqual(len(module._wallpapers), 5)
+        self.assertEqual(len(set(module._current_indexes)), 2)
+        self.assertListEqual(module._current_paths,
+                             [module._wallpapers[i]
+                              for i in module._current_indexes])
+
+
+if __name__ == '__main__':
+    unittest.main()
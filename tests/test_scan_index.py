@@ -0,0 +1,128 @@
+"""
+This module tests the persistent scan index of `WallpapersFinder`, i.e. the
+ability to reuse the content of the directories that were not modified since
+the previous scan.
+"""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from py3status_randwallpaper.random_wallpaper import WallpapersFinder
+from py3status_randwallpaper.wallpaper_list import WallpaperList
+
+
+class TestScanIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lib_dir = os.path.join(self.tmp_dir, 'lib')
+        os.makedirs(os.path.join(self.lib_dir, 'sub'))
+        for name in ['a.jpg', 'b.png', 'c.txt', os.path.join('sub', 'd.jpg')]:
+            open(os.path.join(self.lib_dir, name), 'w').close()
+        # Modified long before the scans, so that the index trusts them
+        self.backdate(self.lib_dir, os.path.join(self.lib_dir, 'sub'))
+        self.index_path = os.path.join(self.tmp_dir, 'cache', 'index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def backdate(*dir_paths):
+        past = time.time() - 60
+        for dir_path in dir_paths:
+            os.utime(dir_path, (past, past))
+
+    def make_finder(self, filter_extensions=None):
+        return WallpapersFinder(
+            search_dirs=[self.lib_dir],
+            recursive_search=True,
+            filter_extensions=filter_extensions or ['jpg', 'png'],
+            ignored_patterns=None,
+            index_path=self.index_path
+        )
+
+    def search_and_spy(self, finder):
+        """Search, and return the wallpapers and the listed directories."""
+        original_scandir = os.scandir
+        listed = []
+
+        def spy_scandir(path):
+            listed.append(path)
+            return original_scandir(path)
+
+        os.scandir = spy_scandir
+        try:
+            wallpapers = finder.search()
+        finally:
+            os.scandir = original_scandir
+        return wallpapers, listed
+
+    def test_index_is_persisted(self):
+        wallpapers = self.make_finder().search()
+        self.assertTrue(os.path.isfile(self.index_path))
+        # A new finder (e.g. after a restart) reuses the index
+        new_wallpapers, listed = self.search_and_spy(self.make_finder())
+        self.assertListEqual(list(new_wallpapers), list(wallpapers))
+        self.assertListEqual(listed, [])
+
+    def test_unmodified_dirs_are_not_listed(self):
+        finder = self.make_finder()
+        finder.search()
+        open(os.path.join(self.lib_dir, 'sub', 'e.png'), 'w').close()
+        wallpapers, listed = self.search_and_spy(finder)
+        self.assertListEqual(listed, [os.path.join(self.lib_dir, 'sub')])
+        self.assertIn(os.path.join(self.lib_dir, 'sub', 'e.png'), wallpapers)
+
+    def test_unchanged_rescan(self):
+        finder = self.make_finder()
+        wallpapers = finder.search()
+        # Nothing changed: the list is not built again
+        with mock.patch.object(WallpaperList, 'append') as append:
+            self.assertIs(finder.search(), wallpapers)
+            self.assertEqual(append.call_count, 0)
+
+    def test_unwritable_index(self):
+        not_a_dir = os.path.join(self.tmp_dir, 'file')
+        open(not_a_dir, 'w').close()
+        self.index_path = os.path.join(not_a_dir, 'index.json')
+        finder = self.make_finder()
+        self.assertEqual(len(finder.search()), 3)
+        self.assertListEqual([name for name, _ in finder.cache_errors],
+                             ['scan index'])
+
+    def test_recently_modified_dirs_are_listed_again(self):
+        finder = self.make_finder()
+        open(os.path.join(self.lib_dir, 'sub', 'e.png'), 'w').close()
+        finder.search()
+        # A file added in the same mtime tick does not change the mtime
+        sub_dir = os.path.join(self.lib_dir, 'sub')
+        mtime = os.stat(sub_dir).st_mtime_ns
+        open(os.path.join(sub_dir, 'f.png'), 'w').close()
+        os.utime(sub_dir, ns=(mtime, mtime))
+        wallpapers, listed = self.search_and_spy(finder)
+        self.assertListEqual(listed, [sub_dir])
+        self.assertIn(os.path.join(sub_dir, 'f.png'), wallpapers)
+
+    def test_removed_files_and_dirs(self):
+        finder = self.make_finder()
+        finder.search()
+        os.remove(os.path.join(self.lib_dir, 'a.jpg'))
+        shutil.rmtree(os.path.join(self.lib_dir, 'sub'))
+        wallpapers = finder.search()
+        self.assertListEqual(list(wallpapers),
+                             [os.path.join(self.lib_dir, 'b.png')])
+
+    def test_filter_change_discards_index(self):
+        self.make_finder().search()
+        wallpapers = self.make_finder(filter_extensions=['txt']).search()
+        self.assertListEqual(list(wallpapers),
+                             [os.path.join(self.lib_dir, 'c.txt')])
+
+
+if __name__ == '__main__':
+    unittest.main()
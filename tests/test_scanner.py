@@ -0,0 +1,141 @@
+"""
+This module tests the parallel scanner of `WallpapersFinder`, i.e. the
+ability to list several directories concurrently, with the same results as
+the serial search, and to skip the directories that take too long.
+"""
+
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from py3status_randwallpaper import scanner
+from py3status_randwallpaper.random_wallpaper import WallpapersFinder
+from py3status_randwallpaper.scanner import ParallelScanner
+
+
+class TestScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.lib_dir = tempfile.mkdtemp()
+        for i in range(3):
+            for j in range(3):
+                sub_dir = os.path.join(self.lib_dir, 'dir%d' % i, 'sub%d' % j)
+                os.makedirs(sub_dir)
+                for k in range(3):
+                    name = 'picture%d.jpg' % k
+                    open(os.path.join(sub_dir, name), 'w').close()
+        open(os.path.join(self.lib_dir, 'top.png'), 'w').close()
+        os.symlink(os.path.join(self.lib_dir, 'dir0'),
+                   os.path.join(self.lib_dir, 'link'))
+
+    def tearDown(self):
+        shutil.rmtree(self.lib_dir)
+
+    def make_finder(self, scan_workers):
+        return WallpapersFinder(
+            search_dirs=[self.lib_dir],
+            recursive_search=True,
+            filter_extensions=['jpg', 'png'],
+            ignored_patterns=None,
+            scan_workers=scan_workers
+        )
+
+    def test_same_results_as_os_walk(self):
+        truth = []
+        for root, dirs, files in os.walk(self.lib_dir):
+            truth.extend(os.path.join(root, f) for f in files)
+        # Sorted by directory, then by basename
+        truth.sort(key=lambda path: (os.path.dirname(path), path))
+        self.assertListEqual(list(self.make_finder(1).search()), truth)
+        self.assertListEqual(list(self.make_finder(4).search()), truth)
+        # The parallel walk keeps the order of the serial one
+        serial = list(scanner.walk(self.lib_dir, scanner.list_dir, True))
+        parallel = ParallelScanner(max_workers=4).walk(
+            self.lib_dir, scanner.list_dir, True)
+        self.assertListEqual(list(parallel), serial)
+
+    def test_timeout(self):
+        hung_dir = os.path.join(self.lib_dir, 'dir1')
+        release = threading.Event()
+
+        def scan_dir(dir_path):
+            if dir_path == hung_dir:
+                release.wait()
+            return scanner.list_dir(dir_path)
+
+        parallel = ParallelScanner(max_workers=2, timeout=0.1)
+        try:
+            visited = [root for root, _ in
+                       parallel.walk(self.lib_dir, scan_dir, True)]
+        finally:
+            release.set()
+        self.assertListEqual(parallel.timed_out, [hung_dir])
+        self.assertNotIn(hung_dir, visited)
+        self.assertNotIn(os.path.join(hung_dir, 'sub0'), visited)
+        self.assertIn(os.path.join(self.lib_dir, 'dir2', 'sub0'), visited)
+
+    def test_queued_dirs_do_not_time_out(self):
+        wide_dir = os.path.join(self.lib_dir, 'wide')
+        for i in range(20):
+            for j in range(2):
+                os.makedirs(os.path.join(wide_dir, 'dir%02d' % i,
+                                         'sub%d' % j))
+
+        def scan_dir(dir_path):
+            # Each listing is well under the timeout, but the queue is not
+            time.sleep(0.03)
+            return scanner.list_dir(dir_path)
+
+        serial = list(scanner.walk(wide_dir, scanner.list_dir, True))
+        parallel = ParallelScanner(max_workers=2, timeout=0.2)
+        self.addCleanup(parallel.close)
+        visited = list(parallel.walk(wide_dir, scan_dir, True))
+        self.assertListEqual(parallel.timed_out, [])
+        self.assertListEqual(visited, serial)
+
+    def test_hung_dir_is_not_listed_again(self):
+        hung_dir = os.path.join(self.lib_dir, 'dir1')
+        release = threading.Event()
+        calls = []
+
+        def scan_dir(dir_path):
+            if dir_path == hung_dir:
+                calls.append(dir_path)
+                release.wait()
+            return scanner.list_dir(dir_path)
+
+        parallel = ParallelScanner(max_workers=2, timeout=0.1)
+        self.addCleanup(parallel.close)
+        try:
+            for _ in range(3):
+                parallel.timed_out = []
+                visited = [root for root, _ in
+                           parallel.walk(self.lib_dir, scan_dir, True)]
+                self.assertListEqual(parallel.timed_out, [hung_dir])
+                self.assertIn(os.path.join(self.lib_dir, 'dir2', 'sub0'),
+                              visited)
+            # A single thread is stuck on it, and it is a daemon thread
+            self.assertEqual(len(calls), 1)
+            stuck = [thread for thread in threading.enumerate()
+                     if thread.name == 'random_wallpaper-scan']
+            self.assertTrue(all(thread.daemon for thread in stuck))
+        finally:
+            release.set()
+        # Once the listing returned, the directory is listed again
+        for _ in range(100):
+            if not parallel._hung:
+                break
+            time.sleep(0.01)
+        parallel.timed_out = []
+        visited = [root for root, _ in
+                   parallel.walk(self.lib_dir, scan_dir, True)]
+        self.assertListEqual(parallel.timed_out, [])
+        self.assertIn(hung_dir, visited)
+
+
+if __name__ == '__main__':
+    unittest.main()
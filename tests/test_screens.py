@@ -0,0 +1,64 @@
+"""
+This module tests the screen topology providers, i.e. the ability to detect
+the monitors (with their geometry) and to cache them.
+"""
+
+
+import unittest
+
+from py3status_randwallpaper.screens import Monitor, StaticScreenProvider, \
+    XrandrScreenProvider, parse_xrandr_monitors
+
+
+XRANDR_OUTPUT = """Monitors: 2
+ 0: +*eDP-1 1920/344x1080/193+0+0  eDP-1
+ 1: +HDMI-1 2560/597x1440/336+1920+0  HDMI-1
+"""
+
+
+class CountingProvider(XrandrScreenProvider):
+    """A xrandr provider which does not run xrandr, but counts the queries."""
+
+    queries = 0
+
+    @staticmethod
+    def query():
+        CountingProvider.queries += 1
+        return parse_xrandr_monitors(XRANDR_OUTPUT)
+
+
+class TestScreens(unittest.TestCase):
+
+    def setUp(self):
+        CountingProvider.queries = 0
+
+    def test_parse(self):
+        monitors = parse_xrandr_monitors(XRANDR_OUTPUT)
+        self.assertListEqual(monitors, [
+            Monitor('eDP-1', 1920, 1080, 0, 0),
+            Monitor('HDMI-1', 2560, 1440, 1920, 0),
+        ])
+
+    def test_cache(self):
+        provider = CountingProvider(ttl=None)
+        self.assertEqual(provider.count(), 2)
+        self.assertEqual(provider.monitors()[1].width, 2560)
+        self.assertEqual(CountingProvider.queries, 1)
+        provider.invalidate()
+        provider.count()
+        self.assertEqual(CountingProvider.queries, 2)
+
+    def test_no_cache(self):
+        provider = CountingProvider(ttl=0)
+        provider.count()
+        provider.count()
+        self.assertEqual(CountingProvider.queries, 2)
+
+    def test_static(self):
+        provider = StaticScreenProvider.from_count(3)
+        self.assertEqual(provider.count(), 3)
+        self.assertIsNone(provider.monitors()[0].width)
+
+
+if __name__ == '__main__':
+    unittest.main()
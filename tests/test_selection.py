@@ -0,0 +1,208 @@
+"""
+This module tests the selection strategies of random wallpapers, i.e. the
+shuffle bag (random order without repetition) and the weighted selection.
+"""
+
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+from py3status_randwallpaper.random_wallpaper import WallpapersFinder
+from py3status_randwallpaper.selection import FenwickTree, ShuffleBag, \
+    WeightedSelector
+from py3status_randwallpaper.wallpaper_list import WallpaperList
+
+
+class TestShuffleBag(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(42)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.tmp_dir, 'shuffle.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_no_repetition(self):
+        bag = ShuffleBag()
+        bag.resize(100)
+        first_cycle = [bag.draw() for _ in range(100)]
+        self.assertListEqual(sorted(first_cycle), list(range(100)))
+        second_cycle = [bag.draw() for _ in range(100)]
+        self.assertListEqual(sorted(second_cycle), list(range(100)))
+        self.assertNotEqual(first_cycle, second_cycle)
+
+    def test_empty(self):
+        bag = ShuffleBag()
+        self.assertIsNone(bag.draw())
+
+    def test_resize(self):
+        bag = ShuffleBag()
+        bag.resize(10)
+        drawn = [bag.draw() for _ in range(5)]
+        # Grow: the new indexes join the current cycle
+        bag.resize(20)
+        drawn += [bag.draw() for _ in range(15)]
+        self.assertListEqual(sorted(drawn), list(range(20)))
+        # Shrink: the removed indexes are never drawn
+        bag.resize(5)
+        drawn = [bag.draw() for _ in range(5)]
+        self.assertListEqual(sorted(drawn), list(range(5)))
+
+    def test_persistence(self):
+        wallpapers = WallpaperList('/pictures/%02d.jpg' % i for i in range(50))
+        bag = ShuffleBag(self.state_path)
+        bag.sync(wallpapers)
+        drawn = [bag.draw() for _ in range(20)]
+        bag.save()
+        # Only the new draws are appended
+        bag.draw()
+        bag.save()
+        with open(self.state_path) as f:
+            self.assertEqual(len(f.readlines()), 21)
+        # e.g. py3status is restarted
+        bag = ShuffleBag(self.state_path)
+        bag.sync(wallpapers)
+        drawn += [bag.draw() for _ in range(29)]
+        self.assertEqual(len(set(drawn)), 49)
+        # All the 50 were drawn: a new cycle rewrites the file
+        bag.draw()
+        bag.draw()
+        bag.save()
+        with open(self.state_path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_put_back(self):
+        wallpapers = WallpaperList('/pictures/%02d.jpg' % i for i in range(10))
+        bag = ShuffleBag(self.state_path)
+        bag.sync(wallpapers)
+        drawn = [bag.draw() for _ in range(3)]
+        bag.save()
+        bag.put_back([wallpapers[drawn[-1]]])
+        bag.save()
+        # The state file no longer has the path put back
+        bag = ShuffleBag(self.state_path)
+        bag.sync(wallpapers)
+        drawn = drawn[:-1] + [bag.draw() for _ in range(8)]
+        self.assertListEqual(sorted(drawn), list(range(10)))
+
+    def test_list_changes(self):
+        paths = ['/pictures/%02d.jpg' % i for i in range(0, 40, 2)]
+        wallpapers = WallpaperList(paths)
+        bag = ShuffleBag()
+        bag.sync(wallpapers)
+        drawn = [wallpapers[bag.draw()] for _ in range(10)]
+        # New files, sorted between the others: the positions shift
+        wallpapers = WallpaperList(sorted(
+            paths + ['/pictures/%02d.jpg' % i for i in range(1, 10, 2)]))
+        bag.sync(wallpapers)
+        drawn += [wallpapers[bag.draw()] for _ in range(15)]
+        self.assertListEqual(sorted(drawn), list(wallpapers))
+        # Removed files are not drawn, the others are drawn once per cycle
+        bag.sync(wallpapers)
+        drawn = [wallpapers[bag.draw()] for _ in range(7)]
+        wallpapers = WallpaperList(list(wallpapers)[5:])
+        bag.sync(wallpapers)
+        left = len(wallpapers) - len(set(drawn) & set(wallpapers))
+        drawn += [wallpapers[bag.draw()] for _ in range(left)]
+        self.assertSetEqual(set(drawn) & set(wallpapers), set(wallpapers))
+        self.assertEqual(len(drawn), len(set(drawn)))
+
+    def test_finder(self):
+        finder = WallpapersFinder(None, None, None, None,
+                                  shuffle=ShuffleBag(self.state_path))
+        finder.wallpapers = ['picture1', 'picture2', 'picture3', 'picture4']
+        indexes = finder.random(None, number=2, same=False)
+        indexes += finder.random(None, number=2, same=False)
+        self.assertListEqual(sorted(indexes), [0, 1, 2, 3])
+        self.assertTrue(os.path.isfile(self.state_path))
+        indexes = finder.random(None, number=3, same=True)
+        self.assertEqual(len(set(indexes)), 1)
+
+
+class TestWeighted(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(42)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.tmp_dir, 'weighted.json')
+        self.wallpapers = WallpaperList(
+            ['/pictures/fav/a.jpg', '/pictures/fav/b.jpg'] +
+            ['/pictures/other/%02d.jpg' % i for i in range(8)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fenwick_tree(self):
+        weights = [random.choice([0, 0.5, 1, 3]) for _ in range(37)]
+        tree = FenwickTree(weights)
+        for end in range(len(weights) + 1):
+            self.assertAlmostEqual(tree.prefix(end), sum(weights[:end]))
+        tree.set(5, 10)
+        weights[5] = 10
+        self.assertAlmostEqual(tree.total(), sum(weights))
+        # `find` maps a value to the index whose range contains it
+        self.assertEqual(tree.find(sum(weights[:5])), 5)
+        self.assertEqual(tree.find(sum(weights[:6]) - 0.01), 5)
+        counts = Counter(tree.sample() for _ in range(5000))
+        self.assertTrue(all(weights[i] > 0 for i in counts))
+        self.assertAlmostEqual(counts[5] / 5000.0, 10 / sum(weights),
+                               delta=0.03)
+        self.assertIsNone(FenwickTree([0, 0]).sample())
+
+    def test_patterns(self):
+        selector = WeightedSelector({'*/fav/*': 7, '*/other/0[0-3].jpg': 0})
+        counts = Counter()
+        for _ in range(1000):
+            counts.update(selector.draw(self.wallpapers))
+        # 'fav' is 7 times more likely than each of the other 4 wallpapers
+        self.assertEqual(set(counts), {0, 1, 6, 7, 8, 9})
+        self.assertAlmostEqual((counts[0] + counts[1]) / 1000.0, 14 / 18.0,
+                               delta=0.05)
+
+    def test_history(self):
+        selector = WeightedSelector(history_size=6,
+                                    state_path=self.state_path)
+        shown = []
+        for _ in range(30):
+            index = selector.draw(self.wallpapers)[0]
+            self.assertNotIn(index, shown[-6:])
+            shown.append(index)
+            selector.shown([self.wallpapers[index]])
+        # Two distinct wallpapers for two screens
+        self.assertEqual(len(set(selector.draw(self.wallpapers, 2))), 2)
+        # The history survives a restart
+        selector = WeightedSelector(history_size=6,
+                                    state_path=self.state_path)
+        for _ in range(20):
+            self.assertNotIn(selector.draw(self.wallpapers)[0], shown[-6:])
+
+    def test_unwritable_state(self):
+        not_a_dir = os.path.join(self.tmp_dir, 'file')
+        open(not_a_dir, 'w').close()
+        selector = WeightedSelector(
+            history_size=6, state_path=os.path.join(not_a_dir, 'w.json'))
+        index = selector.draw(self.wallpapers)[0]
+        # The history is still kept in memory
+        selector.shown([self.wallpapers[index]])
+        for _ in range(20):
+            self.assertNotEqual(selector.draw(self.wallpapers)[0], index)
+
+    def test_finder(self):
+        finder = WallpapersFinder(None, None, None, None,
+                                  weighted=WeightedSelector(history_size=9))
+        finder.wallpapers = self.wallpapers
+        shown = set()
+        for _ in range(10):
+            indexes = finder.random(None, number=1)
+            finder.mark_shown([self.wallpapers[i] for i in indexes])
+            shown.update(indexes)
+        self.assertEqual(len(shown), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+This module tests the fast startup of the module, i.e. the ability to
+restore the last session before searching the wallpapers.
+"""
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from py3status_randwallpaper.random_wallpaper import Py3status, \
+    WallpapersFinder
+from tests.fake_py3 import make_module
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lib_dir = os.path.join(self.tmp_dir, 'lib')
+        os.makedirs(self.lib_dir)
+        for i in range(10):
+            open(os.path.join(self.lib_dir, 'p%d.jpg' % i), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_module(self, module_full_name='random_wallpaper'):
+        module = make_module(Py3status,
+                             module_full_name=module_full_name,
+                             search_dirs=[self.lib_dir],
+                             cache_dir=os.path.join(self.tmp_dir, 'cache'),
+                             restore_session=True,
+                             screen_count=1,
+                             background_apply=False)
+        self.addCleanup(module.kill)
+        return module
+
+    def test_restore(self):
+        first = self.make_module()
+        first.on_click({'button': first.button_next})
+        first.kill()
+        second = self.make_module()
+        # The last wallpaper is set again, before any search
+        self.assertEqual(second._current_paths, first._current_paths)
+        self.assertEqual(second.py3.commands, first.py3.commands[-1:])
+        second._startup_thread.join()
+        self.assertEqual(second._current_paths, first._current_paths)
+        self.assertEqual(len(second._wallpapers), 10)
+
+    def test_restored_wallpaper_removed(self):
+        first = self.make_module()
+        first.kill()
+        os.remove(first._current_paths[0])
+        second = self.make_module()
+        second._startup_thread.join()
+        self.assertEqual(len(second._wallpapers), 9)
+        self.assertNotEqual(second._current_paths, first._current_paths)
+        self.assertTrue(os.path.isfile(second._current_paths[0]))
+        self.assertEqual(len(second.py3.commands), 2)
+
+    def test_click_while_reconciling(self):
+        first = self.make_module()
+        first.kill()
+        release = threading.Event()
+        searches = []
+        original_search = WallpapersFinder.search
+
+        started = threading.Event()
+
+        def blocking_search(finder):
+            searches.append(threading.current_thread())
+            started.set()
+            release.wait()
+            return original_search(finder)
+
+        with mock.patch.object(WallpapersFinder, 'search', blocking_search):
+            second = self.make_module()
+            try:
+                self.assertTrue(started.wait(2))
+                # The click uses the restored list, it does not search
+                second.on_click({'button': second.button_next})
+                self.assertEqual(len(searches), 1)
+                self.assertIsNot(searches[0], threading.current_thread())
+                self.assertNotEqual(second._current_paths,
+                                    first._current_paths)
+            finally:
+                release.set()
+                second._startup_thread.join()
+        self.assertFalse(second._reconciling)
+        self.assertEqual(len(second._wallpapers), 10)
+        self.assertListEqual(second._current_indexes,
+                             [second._wallpapers.index(
+                                 second._current_paths[0])])
+
+    def test_click_while_list_replaced(self):
+        removed = [os.path.join(self.lib_dir, 'p%d.jpg' % i)
+                   for i in range(2, 10)]
+        for path in removed:
+            os.remove(path)
+        first = self.make_module()
+        first.kill()
+        for path in removed:
+            open(path, 'w').close()
+        release = threading.Event()
+        started = threading.Event()
+        original_record = Py3status._record_search
+
+        def blocking_record(module, wallpapers):
+            started.set()
+            release.wait()
+            return original_record(module, wallpapers)
+
+        with mock.patch.object(Py3status, '_record_search', blocking_record):
+            second = self.make_module()
+            try:
+                # The finder has the new list, the module not yet
+                self.assertTrue(started.wait(2))
+                self.assertEqual(len(second._wallpapers), 2)
+                for _ in range(10):
+                    second.on_click({'button': second.button_rand})
+                    self.assertIn(second._current_paths[0],
+                                  second._finder.wallpapers)
+            finally:
+                release.set()
+                second._startup_thread.join()
+        self.assertEqual(len(second._wallpapers), 10)
+
+    def test_instances(self):
+        left = self.make_module('random_wallpaper left')
+        left.on_click({'button': left.button_next})
+        left.kill()
+        right = self.make_module('random_wallpaper right')
+        right.on_click({'button': right.button_next})
+        right.kill()
+        # Each instance restores its own session
+        self.assertIsNone(right._startup_thread)
+        second_left = self.make_module('random_wallpaper left')
+        self.assertEqual(second_left._current_paths, left._current_paths)
+        second_left._startup_thread.join()
+
+    def test_no_session(self):
+        module = self.make_module()
+        self.assertIsNone(module._startup_thread)
+        self.assertEqual(len(module.py3.commands), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
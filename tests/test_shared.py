@@ -0,0 +1,165 @@
+"""
+This module tests the index shared between several instances of the module,
+i.e. the memory-mapped file format and the single writer.
+"""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from py3status_randwallpaper.random_wallpaper import Py3status
+from py3status_randwallpaper.shared import SharedIndex
+from py3status_randwallpaper.wallpaper_list import WallpaperList
+from tests.fake_py3 import make_module
+
+
+PATHS = [
+    '/home/user/Pictures/a.jpg',
+    '/home/user/Pictures/sub/b.png',
+    '/home/user/Pictures/c été.jpg',
+    '/root.png',
+    'relative.jpg',
+    '/home/user/Pictures/bad-\udcff.jpg',
+]
+
+
+class TestShared(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tmp_dir, 'cache', 'shared.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_index(self):
+        index = SharedIndex(self.index_path)
+        self.addCleanup(index.close)
+        return index
+
+    def test_format(self):
+        wallpapers = WallpaperList(PATHS)
+        wallpapers.sort()
+        writer = self.make_index()
+        self.assertTrue(writer.try_acquire())
+        writer.publish(wallpapers)
+        shared = self.make_index().refresh()
+        self.assertEqual(shared.generation, 1)
+        self.assertListEqual(list(shared), list(wallpapers))
+        self.assertEqual(shared[-1], wallpapers[-1])
+        self.assertListEqual(shared.to_json(), wallpapers.to_json())
+        for index, path in enumerate(wallpapers):
+            self.assertEqual(shared.index(path), index)
+            self.assertEqual(shared.bisect(path), wallpapers.bisect(path))
+        self.assertEqual(shared.bisect('/home/user/Pictures/b.jpg'),
+                         wallpapers.bisect('/home/user/Pictures/b.jpg'))
+        self.assertNotIn('/home/user/Pictures/b.jpg', shared)
+        # An empty list
+        writer.publish(WallpaperList())
+        self.assertEqual(len(self.make_index().refresh()), 0)
+
+    def test_single_writer(self):
+        writer = self.make_index()
+        reader = self.make_index()
+        self.assertTrue(writer.try_acquire())
+        self.assertFalse(reader.try_acquire())
+        self.assertIsNone(reader.refresh())
+        with self.assertRaises(RuntimeError):
+            reader.publish(WallpaperList(PATHS[:1]))
+        writer.publish(WallpaperList(PATHS[:1]))
+        first = reader.refresh()
+        # Same generation: the same list is returned
+        self.assertIs(reader.refresh(), first)
+        writer.publish(WallpaperList(PATHS[:1]))
+        self.assertIs(reader.refresh(), first)
+        writer.publish(WallpaperList(PATHS[:2]))
+        second = reader.refresh()
+        self.assertEqual(second.generation, 2)
+        self.assertEqual(len(second), 2)
+        # The old mapping is still valid
+        self.assertListEqual(list(first), PATHS[:1])
+        # Another instance takes over when the writer stops
+        writer.close()
+        self.assertTrue(reader.try_acquire())
+
+    def test_module(self):
+        lib_dir = os.path.join(self.tmp_dir, 'lib')
+        os.makedirs(lib_dir)
+        for i in range(5):
+            open(os.path.join(lib_dir, 'p%d.jpg' % i), 'w').close()
+        config = {'search_dirs': [lib_dir],
+                  'cache_dir': os.path.join(self.tmp_dir, 'cache'),
+                  'shared_index': True,
+                  'screen_count': 1,
+                  'background_apply': False}
+        writer = make_module(Py3status, **config)
+        self.addCleanup(writer.kill)
+        reader = make_module(Py3status, **config)
+        self.addCleanup(reader.kill)
+        self.assertTrue(writer._shared.is_writer)
+        self.assertFalse(reader._shared.is_writer)
+        self.assertEqual(len(reader._wallpapers), 5)
+        self.assertEqual(reader._stats.placeholders()['scans'], 0)
+        # The reader picks up the new list published by the writer
+        open(os.path.join(lib_dir, 'p5.jpg'), 'w').close()
+        writer.on_click({'button': writer.button_next})
+        reader.on_click({'button': reader.button_next})
+        self.assertEqual(len(reader._wallpapers), 6)
+        self.assertEqual(reader._stats.placeholders()['scans'], 0)
+        self.assertIn(reader._current_paths[0], reader._wallpapers)
+
+    def test_reader_does_not_wait(self):
+        lib_dir = os.path.join(self.tmp_dir, 'lib')
+        os.makedirs(lib_dir)
+        path = os.path.join(lib_dir, 'p0.jpg')
+        open(path, 'w').close()
+        # Another instance is the writer, but did not publish yet
+        with mock.patch.object(SharedIndex, 'try_acquire',
+                               return_value=False):
+            reader = make_module(Py3status, search_dirs=[lib_dir],
+                                 cache_dir=os.path.join(self.tmp_dir, 'cache'),
+                                 shared_index=True, screen_count=1,
+                                 background_apply=False)
+            self.addCleanup(reader.kill)
+            self.assertIsNone(reader._wallpapers)
+            output = reader.show()
+            self.assertLessEqual(output['cached_until'], time.time() + 1)
+            reader.on_click({'button': reader.button_next})
+            self.assertListEqual(reader.py3.commands, [])
+        writer = SharedIndex(reader._shared._path)
+        self.addCleanup(writer.close)
+        self.assertTrue(writer.try_acquire())
+        writer.publish(WallpaperList([path]))
+        # The list is picked up on the next update
+        reader.show()
+        self.assertFalse(reader._shared.is_writer)
+        self.assertEqual(reader._stats.placeholders()['scans'], 0)
+        self.assertListEqual(reader._current_paths, [path])
+        self.assertEqual(len(reader.py3.commands), 1)
+        self.assertEqual(reader.show()['cached_until'],
+                         reader.py3.CACHE_FOREVER)
+
+    def test_unwritable_cache(self):
+        lib_dir = os.path.join(self.tmp_dir, 'lib')
+        os.makedirs(lib_dir)
+        open(os.path.join(lib_dir, 'p0.jpg'), 'w').close()
+        not_a_dir = os.path.join(self.tmp_dir, 'file')
+        open(not_a_dir, 'w').close()
+        module = make_module(Py3status, search_dirs=[lib_dir],
+                             cache_dir=os.path.join(not_a_dir, 'cache'),
+                             shared_index=True, screen_count=1,
+                             background_apply=False)
+        self.addCleanup(module.kill)
+        # The list is searched privately
+        self.assertIsNone(module._shared)
+        self.assertEqual(len(module._wallpapers), 1)
+        self.assertEqual(module.py3.logs[0][0], module.py3.LOG_WARNING)
+        module.on_click({'button': module.button_next})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+This module tests the timing and counter instrumentation, i.e. the `Stats`
+helper and the corresponding format placeholders of the module.
+"""
+
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from py3status_randwallpaper.random_wallpaper import Py3status
+from py3status_randwallpaper.stats import Stats
+from tests.fake_py3 import make_module
+
+# The path to this folder (the `tests/` folder in the project).
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+# The path to the data folder (`tests/data`).
+data_dir = os.path.join(tests_dir, 'data')
+
+
+class TestStats(unittest.TestCase):
+
+    def test_timers_and_counters(self):
+        stats = Stats()
+        stats.record('scan', 0.010)
+        stats.record('scan', 0.030)
+        stats.increment('failures')
+        stats.increment('failures', 2)
+        stats.set('count', 42)
+        placeholders = stats.placeholders()
+        self.assertEqual(placeholders['scan_ms'], 30)
+        self.assertEqual(placeholders['apply_ms'], 0)
+        self.assertEqual(placeholders['failures'], 3)
+        self.assertEqual(placeholders['count'], 42)
+        timer = stats.to_dict()['timers']['scan']
+        self.assertEqual(timer['calls'], 2)
+        self.assertAlmostEqual(timer['mean_ms'], 20)
+        self.assertIn('scan 30.0ms', stats.summary())
+
+    def test_module_placeholders(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        stats_file = os.path.join(tmp_dir, 'stats.json')
+        module = make_module(
+            Py3status,
+            search_dirs=[data_dir],
+            recursive_search=True,
+            screen_count=1,
+            background_apply=False,
+            format_string='{count} {files_visited} {files_matched} {applies}',
+            stats_file=stats_file,
+            stats_log_interval=0,
+        )
+        module.on_click({'button': module.button_next})
+        self.assertEqual(module.show()['full_text'], '5 5 5 2')
+        self.assertTrue(any(message.startswith('Statistics:')
+                            for _, message in module.py3.logs))
+        module.kill()
+        with open(stats_file) as f:
+            dump = json.load(f)
+        self.assertEqual(dump['counters']['scans'], 2)
+        self.assertIn('apply', dump['timers'])
+
+    def test_periodic_report(self):
+        module = make_module(Py3status, search_dirs=[data_dir],
+                             recursive_search=True, screen_count=1,
+                             background_apply=False, stats_log_interval=60)
+        self.addCleanup(module.kill)
+        before = time.time()
+        output = module.show()
+        # `show` is called again when the next summary is due, without click
+        self.assertGreaterEqual(output['cached_until'], before + 60)
+        self.assertLessEqual(output['cached_until'], time.time() + 60)
+        self.assertEqual(len([message for _, message in module.py3.logs
+                              if message.startswith('Statistics:')]), 1)
+        module._stats_due = time.time()
+        module.show()
+        self.assertEqual(len([message for _, message in module.py3.logs
+                              if message.startswith('Statistics:')]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+This module tests `WallpaperList`, i.e. the compact list of wallpapers, which
+must behave as a plain list of paths.
+"""
+
+
+import unittest
+
+from py3status_randwallpaper.wallpaper_list import WallpaperList
+
+
+PATHS = [
+    '/home/user/Pictures/a.jpg',
+    '/home/user/Pictures/sub/b.png',
+    '/home/user/Pictures/c été.jpg',
+    '/root.png',
+    'relative.jpg',
+    '/home/user/Pictures/bad-\udcff.jpg',
+]
+
+
+class TestWallpaperList(unittest.TestCase):
+
+    def test_sequence(self):
+        wallpapers = WallpaperList(PATHS)
+        self.assertEqual(len(wallpapers), len(PATHS))
+        self.assertListEqual(list(wallpapers), PATHS)
+        self.assertEqual(wallpapers[2], PATHS[2])
+        self.assertEqual(wallpapers[-1], PATHS[-1])
+        self.assertListEqual(wallpapers[1:3], PATHS[1:3])
+        self.assertEqual(wallpapers, PATHS)
+        with self.assertRaises(IndexError):
+            wallpapers[len(PATHS)]
+
+    def test_membership(self):
+        wallpapers = WallpaperList(PATHS)
+        self.assertIn('/root.png', wallpapers)
+        self.assertNotIn('/home/user/Pictures/sub/a.jpg', wallpapers)
+        self.assertNotIn('/unknown/a.jpg', wallpapers)
+        self.assertEqual(wallpapers.index(PATHS[3]), 3)
+        with self.assertRaises(ValueError):
+            wallpapers.index('/unknown/a.jpg')
+
+    def test_mutations(self):
+        wallpapers = WallpaperList(PATHS)
+        truth = list(PATHS)
+        wallpapers.insert(1, '/tmp/new.jpg')
+        truth.insert(1, '/tmp/new.jpg')
+        wallpapers.remove(PATHS[0])
+        truth.remove(PATHS[0])
+        del wallpapers[-1]
+        del truth[-1]
+        self.assertListEqual(list(wallpapers), truth)
+        # Removing most entries compacts the buffer
+        for path in list(truth[1:]):
+            wallpapers.remove(path)
+        self.assertListEqual(list(wallpapers), truth[:1])
+        self.assertEqual(len(wallpapers._names),
+                         len(truth[0].rpartition('/')[2]))
+
+    def test_sorted(self):
+        wallpapers = WallpaperList(PATHS)
+        wallpapers.sort()
+        truth = sorted(PATHS, key=lambda path: (
+            path[:path.rfind('/') + 1],
+            path.encode('utf-8', 'surrogateescape')))
+        self.assertListEqual(list(wallpapers), truth)
+        # Positions are found by binary search, also for missing paths
+        for index, path in enumerate(truth):
+            self.assertEqual(wallpapers.index(path), index)
+        self.assertEqual(wallpapers.bisect('/home/user/Pictures/b.jpg'), 3)
+        self.assertNotIn('/home/user/Pictures/b.jpg', wallpapers)
+        wallpapers.insort('/home/user/Pictures/b.jpg')
+        wallpapers.insort('/tmp/zzz.jpg')
+        self.assertEqual(wallpapers.index('/home/user/Pictures/b.jpg'), 3)
+        self.assertEqual(wallpapers[-1], '/tmp/zzz.jpg')
+        # An insertion out of order is detected
+        wallpapers.insert(0, '/tmp/zzz.jpg')
+        with self.assertRaises(ValueError):
+            wallpapers.bisect('/root.png')
+        self.assertEqual(wallpapers.index('/root.png'), 2)
+
+    def test_json(self):
+        wallpapers = WallpaperList(PATHS)
+        groups = wallpapers.to_json()
+        self.assertEqual(groups[0], ['/home/user/Pictures/', ['a.jpg']])
+        self.assertListEqual(list(WallpaperList.from_json(groups)), PATHS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+This module tests the watch mode of `WallpapersFinder`, i.e. the ability to
+keep the list of wallpapers up-to-date when files are added, removed or
+renamed, without searching again.
+"""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from py3status_randwallpaper.metadata import MetadataIndex
+from py3status_randwallpaper.random_wallpaper import Py3status, \
+    WallpapersFinder
+from py3status_randwallpaper.watcher import InotifyWatcher
+from tests.fake_py3 import make_module
+from tests.test_metadata import jpeg_header
+
+
+def wait_until(condition, timeout=2.0):
+    """Wait until `condition()` is true, as the events are asynchronous."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.lib_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.lib_dir, 'sub'))
+        self.touch('a.jpg')
+        self.touch(os.path.join('sub', 'b.png'))
+        self.finder = WallpapersFinder(
+            search_dirs=[self.lib_dir],
+            recursive_search=True,
+            filter_extensions=['jpg', 'png'],
+            ignored_patterns=None
+        )
+        try:
+            self.finder.start_watching()
+        except OSError:
+            shutil.rmtree(self.lib_dir)
+            self.skipTest('inotify is not available')
+
+    def tearDown(self):
+        self.finder.stop_watching()
+        shutil.rmtree(self.lib_dir)
+
+    def path(self, name):
+        return os.path.join(self.lib_dir, name)
+
+    def touch(self, name):
+        open(self.path(name), 'w').close()
+
+    def test_initial_search(self):
+        self.assertSetEqual(set(self.finder.wallpapers),
+                            {self.path('a.jpg'), self.path('sub/b.png')})
+
+    def test_add_and_remove(self):
+        self.touch('c.png')
+        self.touch('ignored.txt')
+        self.assertTrue(wait_until(
+            lambda: self.path('c.png') in self.finder.wallpapers))
+        os.remove(self.path('a.jpg'))
+        self.assertTrue(wait_until(
+            lambda: self.path('a.jpg') not in self.finder.wallpapers))
+        self.assertNotIn(self.path('ignored.txt'), self.finder.wallpapers)
+
+    def test_rename(self):
+        os.rename(self.path('a.jpg'), self.path('sub/d.jpg'))
+        self.assertTrue(wait_until(
+            lambda: set(self.finder.wallpapers) ==
+            {self.path('sub/b.png'), self.path('sub/d.jpg')}))
+
+    def test_new_and_removed_subdirs(self):
+        os.makedirs(self.path('new'))
+        self.assertTrue(wait_until(
+            lambda: self.path('new') in self.finder._watcher.watched_paths()))
+        self.touch(os.path.join('new', 'e.jpg'))
+        self.assertTrue(wait_until(
+            lambda: self.path('new/e.jpg') in self.finder.wallpapers))
+        shutil.move(self.path('sub'), self.path('new/moved'))
+        self.assertTrue(wait_until(
+            lambda: set(self.finder.wallpapers) ==
+            {self.path('a.jpg'), self.path('new/e.jpg'),
+             self.path('new/moved/b.png')}))
+
+    def test_metadata_of_new_files(self):
+        metadata = MetadataIndex()
+        finder = WallpapersFinder([self.lib_dir], True, ['jpg', 'png'], [],
+                                  metadata=metadata)
+        finder.start_watching()
+        self.addCleanup(finder.stop_watching)
+        # The file is created empty, and its content written afterwards
+        with open(self.path('n.jpg'), 'wb') as f:
+            self.assertTrue(wait_until(
+                lambda: self.path('n.jpg') in finder.wallpapers))
+            f.write(jpeg_header(640, 480))
+        self.assertTrue(wait_until(
+            lambda: metadata.size(self.path('n.jpg')) == (640, 480)))
+
+    def test_watch_limit(self):
+        module = make_module(Py3status, search_dirs=[self.lib_dir],
+                             recursive_search=True, screen_count=1,
+                             background_apply=False, watch_dirs=True)
+        self.addCleanup(module.kill)
+        self.assertTrue(module._watching)
+        # The limit is reached when a new directory is created
+        with mock.patch.object(InotifyWatcher, 'unwatched_paths',
+                               return_value={self.path('new')}):
+            module.on_click({'button': module.button_next})
+        self.assertFalse(module._watching)
+        self.assertTrue(any('max_user_watches' in message
+                            for _, message in module.py3.logs))
+        # The list is now searched again on each click
+        self.touch('c.png')
+        module.on_click({'button': module.button_next})
+        self.assertIn(self.path('c.png'), module._wallpapers)
+
+
+if __name__ == '__main__':
+    unittest.main()